@@ -1,20 +1,29 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask_socketio import join_room, leave_room
+from flask_socketio import emit, join_room, leave_room
 from datetime import datetime, timedelta
 import uuid
 import os
 from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
 
 from extensions import db, socketio
 from models.user import User, Role
-from models.doctor_profile import DoctorProfile
+from models.doctor_profile import DoctorProfile, VerificationStatus
 from models.time_slot import TimeSlot
 from models.appointment import Appointment, AppointmentStatus
 from models.message import Message, MessageType
+from models.message_read_state import MessageReadState
+from models.consultation_session import ConsultationSession
 from models.file import File, FileType
 from models.notification import Notification, NotificationType
 from services.notification_service import NotificationService
+from services.socket_sessions import socket_sessions, socket_auth_required
+from services.presence_service import presence_service
+from services.availability_service import availability_service
+from services.slot_hold_service import slot_holds
+from jobs import job_queue
+from utils.datetimes import parse_utc
 from models.audit_log import AuditLog, AuditAction
 from models.admin_settings import AdminSettings
 from models.notification import Notification, NotificationType
@@ -39,11 +48,15 @@ def create_appointment():
     data = request.get_json()
     
     # Validate required fields
-    required_fields = ['doctor_id', 'time_slot_id', 'reason']
+    required_fields = ['doctor_id', 'reason']
     for field in required_fields:
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
+    # A slot is booked either by ID or by a start time from the doctor's availability
+    if 'time_slot_id' not in data and 'start_time' not in data:
+        return jsonify({'error': 'Missing required field: time_slot_id or start_time'}), 400
+    
     # Check if doctor exists
     doctor = User.query.filter_by(id=data['doctor_id'], role=Role.DOCTOR).first()
     if not doctor:
@@ -54,22 +67,34 @@ def create_appointment():
     if not doctor_profile or not doctor_profile.is_verified or not doctor.is_active:
         return jsonify({'error': 'Doctor is not available for appointments'}), 400
     
-    # Check if time slot exists and is available
-    time_slot = TimeSlot.query.get(data['time_slot_id'])
-    if not time_slot or not time_slot.is_available or time_slot.is_past:
-        return jsonify({'error': 'Time slot is not available'}), 400
-    
-    # Check if time slot belongs to the doctor
-    if str(time_slot.doctor_id) != str(doctor_profile.id):
-        return jsonify({'error': 'Time slot does not belong to the selected doctor'}), 400
-    
     # Get admin settings for appointment validation
-    admin_settings = AdminSettings.get()
+    admin_settings = AdminSettings.get_settings()
+    
+    if 'time_slot_id' in data:
+        # Check if time slot exists and is available
+        time_slot = TimeSlot.query.get(data['time_slot_id'])
+        if not time_slot or not time_slot.is_available or time_slot.is_past:
+            return jsonify({'error': 'Time slot is not available'}), 400
+        
+        # Check if time slot belongs to the doctor
+        if str(time_slot.doctor_id) != str(doctor_profile.id):
+            return jsonify({'error': 'Time slot does not belong to the selected doctor'}), 400
+        start_time, end_time = time_slot.start_time, time_slot.end_time
+    else:
+        try:
+            start_time = parse_utc(data['start_time'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid start_time format'}), 400
+        end_time = start_time + timedelta(minutes=admin_settings.appointment_duration_minutes)
+    
+    # Another patient's hold settles the race in Redis, before the slot is locked or written
+    if slot_holds.held_by_other(doctor_profile.id, user.id, start_time, end_time, admin_settings.buffer_time_minutes):
+        return jsonify({'error': 'Time slot is held by another patient'}), 409
     
     # Check if appointment is being booked with sufficient notice
     min_notice_hours = admin_settings.min_booking_notice_hours
     notice_time = datetime.utcnow() + timedelta(hours=min_notice_hours)
-    if time_slot.start_time <= notice_time:
+    if start_time <= notice_time:
         return jsonify({
             'error': f'Appointments must be booked at least {min_notice_hours} hours in advance'
         }), 400
@@ -79,6 +104,18 @@ def create_appointment():
     
     # Create appointment
     try:
+        if 'time_slot_id' in data:
+            # Take the slot with one conditional UPDATE, so a concurrent booking of it fails here at once
+            if not TimeSlot.claim(time_slot.id):
+                db.session.rollback()
+                return jsonify({'error': 'Time slot is no longer available'}), 409
+        else:
+            # Create the slot now, if the start time is still free
+            time_slot = availability_service.claim_slot(doctor_profile.id, start_time, admin_settings)
+            if not time_slot:
+                db.session.rollback()
+                return jsonify({'error': 'Time slot is no longer available'}), 409
+        
         appointment = Appointment(
             id=uuid.uuid4(),
             patient_id=user.id,
@@ -90,14 +127,14 @@ def create_appointment():
             medical_history=data.get('medical_history'),
             current_medications=data.get('current_medications'),
             allergies=data.get('allergies'),
-            room_id=room_id
+            room_id=room_id,
+            reminder_due_at=time_slot.start_time - timedelta(hours=admin_settings.reminder_hours_before)
         )
         
-        # Mark time slot as unavailable
-        time_slot.is_available = False
-        
         db.session.add(appointment)
         db.session.commit()
+        availability_service.mark_booked(doctor_profile.id, time_slot.start_time, time_slot.end_time, admin_settings.buffer_time_minutes)
+        slot_holds.release(user.id)
         
         # Log the appointment creation
         AuditLog.log(
@@ -121,29 +158,127 @@ def create_appointment():
         db.session.add(system_message)
         db.session.commit()
         
-        # Send notifications to both patient and doctor
-        NotificationService.send_appointment_notification(
-            appointment=appointment,
-            notification_type=NotificationType.APPOINTMENT_CREATED,
+        # Queue notifications to both patient and doctor
+        job_queue.enqueue(
+            'send_appointment_notification',
+            appointment_id=str(appointment.id),
+            notification_type=NotificationType.APPOINTMENT_CREATED.value,
             recipient_id=str(appointment.patient_id)
         )
         
-        NotificationService.send_appointment_notification(
-            appointment=appointment,
-            notification_type=NotificationType.APPOINTMENT_CREATED,
+        job_queue.enqueue(
+            'send_appointment_notification',
+            appointment_id=str(appointment.id),
+            notification_type=NotificationType.APPOINTMENT_CREATED.value,
             recipient_id=str(appointment.doctor_id)
         )
         
+        # Email the booking confirmation to the patient
+        if admin_settings.send_booking_confirmations:
+            job_queue.enqueue(
+                'send_email',
+                to=user.email,
+                subject='Your CareBridge appointment is booked',
+                template='booking',
+                context={
+                    'patient_name': user.full_name,
+                    'doctor_name': doctor.full_name,
+                    'start_time': time_slot.start_time.strftime('%Y-%m-%d at %H:%M')
+                }
+            )
+        
         return jsonify({
             'message': 'Appointment created successfully',
             'appointment': appointment.to_dict()
         }), 201
         
+    except IntegrityError:
+        # The exclusion constraints caught an overlap with another booking
+        db.session.rollback()
+        return jsonify({'error': 'Time slot is no longer available'}), 409
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Error creating appointment: {str(e)}')
         return jsonify({'error': 'Failed to create appointment'}), 500
 
+@appointments_bp.route('/holds', methods=['POST'])
+@jwt_required()
+def hold_slot():
+    """Hold a slot for a few minutes while the patient fills in the booking form
+    
+    Takes doctor_id and either time_slot_id or start_time, like booking. Other
+    patients no longer see the held time as available and can't book it
+    until the hold is released or expires; holding another slot replaces the
+    patient's previous hold.
+    """
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    if user.role != Role.PATIENT:
+        return jsonify({'error': 'Only patients can hold time slots'}), 403
+    
+    data = request.get_json() or {}
+    if 'doctor_id' not in data:
+        return jsonify({'error': 'Missing required field: doctor_id'}), 400
+    if 'time_slot_id' not in data and 'start_time' not in data:
+        return jsonify({'error': 'Missing required field: time_slot_id or start_time'}), 400
+    
+    doctor_profile = DoctorProfile.query.filter_by(user_id=data['doctor_id']).first()
+    if not doctor_profile or doctor_profile.verification_status != VerificationStatus.APPROVED or not doctor_profile.available_for_appointments:
+        return jsonify({'error': 'Doctor is not available for appointments'}), 400
+    
+    admin_settings = AdminSettings.get_settings()
+    notice_time = datetime.utcnow() + timedelta(hours=admin_settings.min_booking_notice_hours)
+    
+    if 'time_slot_id' in data:
+        time_slot = TimeSlot.query.get(data['time_slot_id'])
+        if not time_slot or not time_slot.is_available or str(time_slot.doctor_id) != str(doctor_profile.id) or time_slot.start_time <= notice_time:
+            return jsonify({'error': 'Time slot is not available'}), 400
+        start_time, end_time = time_slot.start_time, time_slot.end_time
+    else:
+        try:
+            start_time = parse_utc(data['start_time'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid start_time format'}), 400
+        
+        # Checked against the cache without holds, so patients can renew their own
+        bitmap = availability_service.day_bitmap(doctor_profile.id, start_time.date(), include_holds=False)
+        if start_time not in availability_service.bookable_starts(doctor_profile.id, start_time.date(), admin_settings, bitmap=bitmap):
+            return jsonify({'error': 'Time slot is not available'}), 400
+        end_time = start_time + timedelta(minutes=admin_settings.appointment_duration_minutes)
+    
+    try:
+        expires_at = slot_holds.hold(doctor_profile.id, user.id, start_time, end_time, admin_settings.buffer_time_minutes)
+    except Exception as e:
+        current_app.logger.error(f'Error holding time slot: {str(e)}')
+        return jsonify({'error': 'Failed to hold time slot'}), 500
+    
+    if not expires_at:
+        return jsonify({'error': 'Time slot is held by another patient'}), 409
+    
+    return jsonify({
+        'message': 'Time slot held',
+        'hold': {
+            'doctor_id': data['doctor_id'],
+            'time_slot_id': data.get('time_slot_id'),
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat(),
+            'expires_at': expires_at.isoformat()
+        }
+    }), 201
+
+@appointments_bp.route('/holds', methods=['DELETE'])
+@jwt_required()
+def release_slot_hold():
+    """Release the current patient's slot hold, e.g. when they leave the booking form"""
+    if not slot_holds.release(get_jwt_identity()):
+        return jsonify({'error': 'No time slot is held'}), 404
+    
+    return jsonify({'message': 'Time slot hold released'}), 200
+
 @appointments_bp.route('/<appointment_id>', methods=['GET'])
 @jwt_required()
 def get_appointment(appointment_id):
@@ -258,6 +393,9 @@ def cancel_appointment(appointment_id):
     # Cancel the appointment
     try:
         appointment.cancel(user_id=user.id, reason=reason)
+        socket_sessions.close_appointment(appointment.id)
+        if appointment.time_slot:
+            availability_service.refresh(appointment.time_slot.doctor_id, appointment.start_time.date(), appointment.end_time.date())
         
         # Log the appointment cancellation
         AuditLog.log(
@@ -284,16 +422,18 @@ def cancel_appointment(appointment_id):
         # Send notification to the other party
         if user.role == Role.PATIENT:
             # Notify doctor
-            NotificationService.send_appointment_notification(
-                appointment=appointment,
-                notification_type=NotificationType.APPOINTMENT_CANCELLED,
+            job_queue.enqueue(
+                'send_appointment_notification',
+                appointment_id=str(appointment.id),
+                notification_type=NotificationType.APPOINTMENT_CANCELLED.value,
                 recipient_id=str(appointment.doctor_id)
             )
         else:
             # Notify patient
-            NotificationService.send_appointment_notification(
-                appointment=appointment,
-                notification_type=NotificationType.APPOINTMENT_CANCELLED,
+            job_queue.enqueue(
+                'send_appointment_notification',
+                appointment_id=str(appointment.id),
+                notification_type=NotificationType.APPOINTMENT_CANCELLED.value,
                 recipient_id=str(appointment.patient_id)
             )
         
@@ -358,9 +498,10 @@ def confirm_appointment(appointment_id):
         db.session.commit()
         
         # Send notification to patient
-        NotificationService.send_appointment_notification(
-            appointment=appointment,
-            notification_type=NotificationType.APPOINTMENT_CONFIRMED,
+        job_queue.enqueue(
+            'send_appointment_notification',
+            appointment_id=str(appointment.id),
+            notification_type=NotificationType.APPOINTMENT_CONFIRMED.value,
             recipient_id=str(appointment.patient_id)
         )
         
@@ -401,6 +542,7 @@ def complete_appointment(appointment_id):
     # Complete the appointment
     try:
         appointment.complete()
+        socket_sessions.close_appointment(appointment.id)
         
         # Log the appointment completion
         AuditLog.log(
@@ -425,9 +567,10 @@ def complete_appointment(appointment_id):
         db.session.commit()
         
         # Send notification to patient
-        NotificationService.send_appointment_notification(
-            appointment=appointment,
-            notification_type=NotificationType.APPOINTMENT_COMPLETED,
+        job_queue.enqueue(
+            'send_appointment_notification',
+            appointment_id=str(appointment.id),
+            notification_type=NotificationType.APPOINTMENT_COMPLETED.value,
             recipient_id=str(appointment.patient_id)
         )
         
@@ -468,6 +611,7 @@ def mark_no_show(appointment_id):
     # Mark as no-show
     try:
         appointment.mark_no_show()
+        socket_sessions.close_appointment(appointment.id)
         
         # Log the no-show
         AuditLog.log(
@@ -492,9 +636,10 @@ def mark_no_show(appointment_id):
         db.session.commit()
         
         # Send notification to patient
-        NotificationService.send_appointment_notification(
-            appointment=appointment,
-            notification_type=NotificationType.APPOINTMENT_NO_SHOW,
+        job_queue.enqueue(
+            'send_appointment_notification',
+            appointment_id=str(appointment.id),
+            notification_type=NotificationType.APPOINTMENT_NO_SHOW.value,
             recipient_id=str(appointment.patient_id)
         )
         
@@ -528,28 +673,39 @@ def get_messages(appointment_id):
     if str(appointment.patient_id) != str(user.id) and str(appointment.doctor_id) != str(user.id) and not user.is_admin:
         return jsonify({'error': 'Unauthorized to view messages for this appointment'}), 403
     
+    # Only return messages after a sequence number, e.g. to fill a gap or catch up after reconnecting
+    if 'since' in request.args:
+        since = request.args.get('since', type=int)
+        if since is None or since < 0:
+            return jsonify({'error': 'since must be a non-negative integer'}), 400
+        limit = max(1, min(request.args.get('limit', 100, type=int), current_app.config['MESSAGE_REPLAY_LIMIT']))
+        messages, has_more = Message.since(appointment_id, since, limit)
+        read_state = _mark_messages_read(appointment, user, messages)
+        return jsonify({
+            'appointment_id': appointment_id,
+            'messages': [message.to_dict() for message in messages],
+            'latest_seq': messages[-1].seq if messages else since,
+            'has_more': has_more,
+            'read_state': read_state
+        }), 200
+    
     # Get query parameters
     page = int(request.args.get('page', 1))
     per_page = int(request.args.get('per_page', 20))
     
     # Get messages
     messages_page = Message.query.filter_by(appointment_id=appointment_id)\
-                              .order_by(Message.created_at)\
+                              .order_by(Message.seq)\
                               .paginate(page=page, per_page=per_page)
     
     # Format response
     messages = [message.to_dict() for message in messages_page.items]
-    
-    # Mark messages as read if user is not the sender
-    for message in messages_page.items:
-        if message.sender_id and str(message.sender_id) != str(user.id) and not message.is_read:
-            message.mark_as_read()
-    
-    db.session.commit()
+    read_state = _mark_messages_read(appointment, user, messages_page.items)
     
     return jsonify({
         'appointment_id': appointment_id,
         'messages': messages,
+        'read_state': read_state,
         'pagination': {
             'total': messages_page.total,
             'pages': messages_page.pages,
@@ -560,6 +716,27 @@ def get_messages(appointment_id):
         }
     }), 200
 
+def _mark_messages_read(appointment, user, messages):
+    """Advance a participant's read watermark past the messages they were shown
+    
+    Returns the read watermarks of all participants and the viewer's unread count.
+    """
+    is_participant = str(user.id) in (str(appointment.patient_id), str(appointment.doctor_id))
+    if is_participant and messages:
+        advanced_to = MessageReadState.advance(appointment.id, user.id, max(message.seq for message in messages))
+        db.session.commit()
+        if advanced_to is not None:
+            socketio.emit('messages_read', {
+                'appointment_id': str(appointment.id),
+                'user_id': str(user.id),
+                'last_read_seq': advanced_to
+            }, room=f'appointment_{appointment.id}')
+    
+    return {
+        'watermarks': MessageReadState.get_for_appointment(appointment.id),
+        'unread_count': MessageReadState.unread_counts(user.id, [appointment.id])[str(appointment.id)] if is_participant else 0
+    }
+
 @appointments_bp.route('/<appointment_id>/messages', methods=['POST'])
 @jwt_required()
 def send_message(appointment_id):
@@ -597,8 +774,7 @@ def send_message(appointment_id):
             appointment_id=appointment_id,
             sender_id=user.id,
             message_type=MessageType.TEXT,
-            content=data['content'],
-            is_read=False
+            content=data['content']
         )
         
         db.session.add(message)
@@ -614,7 +790,7 @@ def send_message(appointment_id):
         
         NotificationService.send_notification(
             user_id=recipient_id,
-            notification_type=NotificationType.MESSAGE_RECEIVED,
+            type=NotificationType.MESSAGE_RECEIVED,
             title="New message received",
             message=f"You have a new message in your appointment",
             resource_type="Appointment",
@@ -718,8 +894,7 @@ def upload_file(appointment_id):
             sender_id=user.id,
             message_type=MessageType.FILE,
             content=f"File: {filename}",
-            file_id=file_record.id,
-            is_read=False
+            file_id=file_record.id
         )
         
         db.session.add(message)
@@ -730,6 +905,9 @@ def upload_file(appointment_id):
             'message': message.to_dict()
         }, room=f'appointment_{appointment_id}')
         
+        # Post-process the upload in the background
+        job_queue.enqueue('process_uploaded_file', str(file_record.id))
+        
         return jsonify({
             'message': 'File uploaded successfully',
             'file': file_record.to_dict(),
@@ -773,99 +951,126 @@ def join_appointment_room(appointment_id):
     if now > appointment.end_time:
         return jsonify({'error': 'Appointment has already ended'}), 400
     
-    # Create system message for joining
-    system_message = Message(
-        id=uuid.uuid4(),
-        appointment_id=appointment.id,
-        sender_id=user.id,
-        message_type=MessageType.SYSTEM,
-        content=f"{user.first_name} {user.last_name} joined the consultation"
-    )
-    
-    db.session.add(system_message)
-    db.session.commit()
-    
-    # Emit message to socket.io room
-    socketio.emit('user_joined', {
-        'user': {
-            'id': str(user.id),
-            'name': f"{user.first_name} {user.last_name}",
-            'role': user.role.value
-        },
-        'message': system_message.to_dict()
-    }, room=f'appointment_{appointment_id}')
-    
+    # Attendance is tracked once the client joins the call over Socket.IO
     return jsonify({
         'message': 'Joined appointment room successfully',
         'room_id': appointment.room_id
     }), 200
 
-# Socket.IO event handlers
-@socketio.on('join')
+@appointments_bp.route('/<appointment_id>/consultation', methods=['GET'])
 @jwt_required()
-def on_join(data):
-    """Socket.IO event for joining an appointment room"""
-    appointment_id = data.get('appointment_id')
-    if not appointment_id:
-        return
-    
+def get_consultation(appointment_id):
+    """Get attendance and total call duration of an appointment's consultation"""
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
     
     if not user:
-        return
+        return jsonify({'error': 'User not found'}), 404
     
     # Get the appointment
     appointment = Appointment.query.get(appointment_id)
     
     if not appointment:
+        return jsonify({'error': 'Appointment not found'}), 404
+    
+    # Check if user is authorized to view this appointment
+    if str(appointment.patient_id) != str(user.id) and str(appointment.doctor_id) != str(user.id) and not user.is_admin:
+        return jsonify({'error': 'Unauthorized to view this appointment'}), 403
+    
+    return jsonify(ConsultationSession.summary(appointment.id)), 200
+
+@appointments_bp.route('/<appointment_id>/presence', methods=['GET'])
+@jwt_required()
+def get_presence(appointment_id):
+    """Get which participants are online in an appointment room"""
+    current_user_id = get_jwt_identity()
+    
+    # Get the appointment
+    appointment = Appointment.query.get(appointment_id)
+    
+    if not appointment:
+        return jsonify({'error': 'Appointment not found'}), 404
+    
+    # Check if user is authorized to view this appointment
+    if str(appointment.patient_id) != str(current_user_id) and str(appointment.doctor_id) != str(current_user_id):
+        return jsonify({'error': 'Unauthorized to view this appointment'}), 403
+    
+    room = f'appointment_{appointment_id}'
+    return jsonify({
+        'online_user_ids': presence_service.online_users(room),
+        'doctor_online': presence_service.is_online(room, appointment.doctor_id),
+        'patient_online': presence_service.is_online(room, appointment.patient_id),
+        'heartbeat_seconds': current_app.config['PRESENCE_TTL_SECONDS'] // 3
+    }), 200
+
+# Socket.IO event handlers
+@socketio.on('join')
+@socket_auth_required
+def on_join(data):
+    """Socket.IO event for joining an appointment room"""
+    appointment_id = (data or {}).get('appointment_id')
+    if not appointment_id:
         return
     
     # Check if user is authorized to join this appointment
-    if str(appointment.patient_id) != str(user.id) and str(appointment.doctor_id) != str(user.id):
+    session = socket_sessions.current()
+    if not socket_sessions.can_access_appointment(session, appointment_id):
         return
     
     # Join the room
     join_room(f'appointment_{appointment_id}')
+    presence_service.join(session, f'appointment_{appointment_id}')
+    
+    # Replay messages missed while disconnected, so reconnecting clients don't reload the history
+    last_seq = data.get('last_seq')
+    if isinstance(last_seq, int) and last_seq >= 0:
+        messages, has_more = Message.since(appointment_id, last_seq, current_app.config['MESSAGE_REPLAY_LIMIT'])
+        emit('messages_replay', {
+            'appointment_id': appointment_id,
+            'messages': [message.to_dict() for message in messages],
+            'latest_seq': messages[-1].seq if messages else last_seq,
+            'has_more': has_more
+        })
+
+@socketio.on('mark_messages_read')
+@socket_auth_required
+def on_mark_messages_read(data):
+    """Socket.IO event for moving the read watermark while the chat is open"""
+    appointment_id = (data or {}).get('appointment_id')
+    seq = (data or {}).get('seq')
+    if not appointment_id or not isinstance(seq, int) or seq <= 0:
+        return
+    
+    session = socket_sessions.current()
+    if not socket_sessions.can_access_appointment(session, appointment_id):
+        return
+    
+    advanced_to = MessageReadState.advance(appointment_id, session.user_id, seq)
+    db.session.commit()
+    if advanced_to is None:
+        return
+    
+    socketio.emit('messages_read', {
+        'appointment_id': appointment_id,
+        'user_id': session.user_id,
+        'last_read_seq': advanced_to
+    }, room=f'appointment_{appointment_id}')
 
 @socketio.on('leave')
-@jwt_required()
+@socket_auth_required
 def on_leave(data):
     """Socket.IO event for leaving an appointment room"""
-    appointment_id = data.get('appointment_id')
+    appointment_id = (data or {}).get('appointment_id')
     if not appointment_id:
         return
     
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    if not user:
+    session = socket_sessions.current()
+    if not socket_sessions.can_access_appointment(session, appointment_id):
         return
     
-    # Leave the room
+    # Leave the room; closing the chat doesn't end the call, which has its own room
     leave_room(f'appointment_{appointment_id}')
-    
-    # Create system message for leaving
-    system_message = Message(
-        id=uuid.uuid4(),
-        appointment_id=appointment_id,
-        sender_id=user.id,
-        message_type=MessageType.SYSTEM,
-        content=f"{user.first_name} {user.last_name} left the consultation"
-    )
-    
-    db.session.add(system_message)
-    db.session.commit()
-    
-    # Emit message to socket.io room
-    socketio.emit('user_left', {
-        'user': {
-            'id': str(user.id),
-            'name': f"{user.first_name} {user.last_name}",
-            'role': user.role.value
-        },
-        'message': system_message.to_dict()
-    }, room=f'appointment_{appointment_id}')
+    presence_service.leave(session, f'appointment_{appointment_id}')
 
 def allowed_file(filename, allowed_extensions):
     """Check if file extension is allowed"""
@@ -0,0 +1 @@
+# Doctors module initialization
\ No newline at end of file
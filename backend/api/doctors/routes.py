@@ -0,0 +1,338 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime, timedelta, date, time
+
+from extensions import db
+from models.user import User, Role
+from models.doctor_profile import DoctorProfile
+from models.time_slot import TimeSlot, SlotType, RecurrencePattern
+from models.availability_exception import AvailabilityException, AvailabilityExceptionType
+from models.admin_settings import AdminSettings
+from services.availability_service import availability_service, bitmap_to_intervals, CELL_MINUTES
+from services.availability_index import availability_index
+from utils.datetimes import parse_utc
+
+doctors_bp = Blueprint('doctors', __name__, url_prefix='/doctors')
+
+def _template_to_dict(template):
+    return {
+        'id': str(template.id),
+        'pattern': template.recurrence_pattern.value,
+        'day': template.recurrence_day,
+        'start': template.start_time.strftime('%H:%M'),
+        'end': template.end_time.strftime('%H:%M'),
+        'starts_on': template.start_time.date().isoformat(),
+        'end_date': template.recurrence_end_date.isoformat() if template.recurrence_end_date else None
+    }
+
+def _parse_template(data, today):
+    """Build a recurring slot from a schedule entry; returns (template, error)"""
+    try:
+        pattern = RecurrencePattern(data.get('pattern', 'weekly'))
+        start = time.fromisoformat(data['start'])
+        end = time.fromisoformat(data['end'])
+        starts_on = date.fromisoformat(data['starts_on']) if data.get('starts_on') else today
+        end_date = date.fromisoformat(data['end_date']) if data.get('end_date') else None
+    except (KeyError, TypeError, ValueError):
+        return None, 'Each entry needs a valid pattern, start and end (HH:MM), and ISO dates'
+    
+    if end <= start:
+        return None, 'End time must be after start time'
+    
+    day = data.get('day')
+    if pattern == RecurrencePattern.WEEKLY and not (isinstance(day, int) and 0 <= day <= 6):
+        return None, 'Weekly entries need a day of week from 0 (Monday) to 6 (Sunday)'
+    if pattern == RecurrencePattern.MONTHLY and not (isinstance(day, int) and 1 <= day <= 31):
+        return None, 'Monthly entries need a day of month from 1 to 31'
+    
+    return TimeSlot(
+        start_time=datetime.combine(starts_on, start),
+        end_time=datetime.combine(starts_on, end),
+        slot_type=SlotType.RECURRING,
+        recurrence_pattern=pattern,
+        recurrence_day=day if pattern != RecurrencePattern.DAILY else None,
+        recurrence_end_date=end_date,
+        is_available=True
+    ), None
+
+@doctors_bp.route('/me/schedule', methods=['GET'])
+@jwt_required()
+def get_schedule():
+    """Get the recurring schedule of the current doctor"""
+    current_user_id = get_jwt_identity()
+    doctor_profile = DoctorProfile.query.filter_by(user_id=current_user_id).first()
+    
+    if not doctor_profile:
+        return jsonify({'error': 'Doctor profile not found'}), 404
+    
+    today = datetime.utcnow().date()
+    templates = TimeSlot.query.filter(
+        TimeSlot.doctor_id == doctor_profile.id,
+        TimeSlot.slot_type == SlotType.RECURRING,
+        db.or_(TimeSlot.recurrence_end_date == None, TimeSlot.recurrence_end_date >= today)
+    ).order_by(TimeSlot.recurrence_day, TimeSlot.start_time).all()
+    
+    return jsonify({
+        'templates': [_template_to_dict(template) for template in templates]
+    }), 200
+
+@doctors_bp.route('/me/schedule', methods=['PUT'])
+@jwt_required()
+def publish_schedule():
+    """Publish the current doctor's recurring schedule and create its bookable slots
+    
+    Replaces the existing recurring slots. Availability is worked out from
+    them when asked for, so no bookable slots are created; unbooked future
+    slots made from the old ones are removed, booked ones stay.
+    """
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    
+    if not user or user.role != Role.DOCTOR:
+        return jsonify({'error': 'Only doctors can publish a schedule'}), 403
+    
+    doctor_profile = DoctorProfile.query.filter_by(user_id=user.id).first()
+    if not doctor_profile:
+        return jsonify({'error': 'Doctor profile not found'}), 404
+    
+    data = request.get_json()
+    if not data or not isinstance(data.get('templates'), list):
+        return jsonify({'error': 'A list of templates is required'}), 400
+    
+    today = datetime.utcnow().date()
+    templates = []
+    for entry in data['templates']:
+        template, error = _parse_template(entry if isinstance(entry, dict) else {}, today)
+        if error:
+            return jsonify({'error': error}), 400
+        template.doctor_id = doctor_profile.id
+        templates.append(template)
+    
+    try:
+        previous = TimeSlot.query.filter(
+            TimeSlot.doctor_id == doctor_profile.id,
+            TimeSlot.slot_type == SlotType.RECURRING,
+            db.or_(TimeSlot.recurrence_end_date == None, TimeSlot.recurrence_end_date >= today)
+        ).all()
+        removed = TimeSlot.remove_unbooked([template.id for template in previous])
+        for template in previous:
+            # A recurring slot that was ever booked directly has to stay, so it is ended instead
+            if not template.appointments:
+                db.session.delete(template)
+            else:
+                template.recurrence_end_date = today - timedelta(days=1)
+        
+        db.session.add_all(templates)
+        db.session.commit()
+        availability_service.invalidate(doctor_profile.id)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error publishing schedule: {str(e)}')
+        return jsonify({'error': 'Failed to publish schedule'}), 500
+    
+    return jsonify({
+        'message': 'Schedule published successfully',
+        'templates': [_template_to_dict(template) for template in templates],
+        'slots_removed': removed
+    }), 200
+
+def _current_doctor_profile():
+    """Get the profile of the current user if they are a doctor; returns (profile, error response)"""
+    user = User.query.get(get_jwt_identity())
+    if not user or user.role != Role.DOCTOR:
+        return None, (jsonify({'error': 'Only doctors can manage their availability'}), 403)
+    
+    doctor_profile = DoctorProfile.query.filter_by(user_id=user.id).first()
+    if not doctor_profile:
+        return None, (jsonify({'error': 'Doctor profile not found'}), 404)
+    return doctor_profile, None
+
+@doctors_bp.route('/me/exceptions', methods=['GET'])
+@jwt_required()
+def get_exceptions():
+    """Get the current doctor's time off and extra hours from today on"""
+    doctor_profile, error = _current_doctor_profile()
+    if error:
+        return error
+    
+    exceptions = AvailabilityException.query.filter(
+        AvailabilityException.doctor_id == doctor_profile.id,
+        AvailabilityException.end_time > datetime.utcnow()
+    ).order_by(AvailabilityException.start_time).all()
+    
+    return jsonify({
+        'exceptions': [exception.to_dict() for exception in exceptions]
+    }), 200
+
+@doctors_bp.route('/me/exceptions', methods=['POST'])
+@jwt_required()
+def create_exception():
+    """Add time off or extra hours to the current doctor's availability"""
+    doctor_profile, error = _current_doctor_profile()
+    if error:
+        return error
+    
+    data = request.get_json() or {}
+    try:
+        exception_type = AvailabilityExceptionType(data.get('type', 'time_off'))
+        start_time = datetime.fromisoformat(data['start_time'])
+        end_time = datetime.fromisoformat(data['end_time'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'A valid type, start_time and end_time are required'}), 400
+    
+    if end_time <= start_time:
+        return jsonify({'error': 'End time must be after start time'}), 400
+    
+    exception = AvailabilityException(
+        doctor_id=doctor_profile.id,
+        type=exception_type,
+        start_time=start_time,
+        end_time=end_time,
+        reason=data.get('reason')
+    )
+    
+    try:
+        db.session.add(exception)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error creating availability exception: {str(e)}')
+        return jsonify({'error': 'Failed to save availability exception'}), 500
+    
+    availability_service.invalidate(doctor_profile.id, *_days_between(start_time, end_time))
+    return jsonify({
+        'message': 'Availability exception saved successfully',
+        'exception': exception.to_dict()
+    }), 201
+
+@doctors_bp.route('/me/exceptions/<exception_id>', methods=['DELETE'])
+@jwt_required()
+def delete_exception(exception_id):
+    """Remove time off or extra hours from the current doctor's availability"""
+    doctor_profile, error = _current_doctor_profile()
+    if error:
+        return error
+    
+    exception = AvailabilityException.query.filter_by(id=exception_id, doctor_id=doctor_profile.id).first()
+    if not exception:
+        return jsonify({'error': 'Availability exception not found'}), 404
+    
+    days = _days_between(exception.start_time, exception.end_time)
+    try:
+        db.session.delete(exception)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error deleting availability exception: {str(e)}')
+        return jsonify({'error': 'Failed to delete availability exception'}), 500
+    
+    availability_service.invalidate(doctor_profile.id, *days)
+    return jsonify({'message': 'Availability exception deleted successfully'}), 200
+
+@doctors_bp.route('/<doctor_id>/slots', methods=['GET'])
+@jwt_required()
+def get_bookable_slots(doctor_id):
+    """Get the start times a patient can book with a doctor on a day
+    
+    Computed from the doctor's recurring slots, exceptions and bookings; any
+    of them can be booked by passing it as start_time when creating an
+    appointment.
+    """
+    try:
+        day = date.fromisoformat(request.args.get('date', ''))
+    except ValueError:
+        return jsonify({'error': 'A date in YYYY-MM-DD format is required'}), 400
+    
+    doctor_profile = DoctorProfile.query.filter_by(user_id=doctor_id).first()
+    if not doctor_profile or not doctor_profile.available_for_appointments:
+        return jsonify({'error': 'Doctor not found'}), 404
+    
+    settings = AdminSettings.get_settings()
+    starts = availability_service.bookable_starts(doctor_profile.id, day, settings)
+    duration = timedelta(minutes=settings.appointment_duration_minutes)
+    
+    return jsonify({
+        'date': day.isoformat(),
+        'slots': [{'start_time': start.isoformat(), 'end_time': (start + duration).isoformat()} for start in starts]
+    }), 200
+
+@doctors_bp.route('/<doctor_id>/availability', methods=['GET'])
+@jwt_required()
+def get_availability(doctor_id):
+    """Get a doctor's availability for a day (?date=YYYY-MM-DD) or a month (?month=YYYY-MM)
+    
+    Served from cached 5-minute bitmaps. Each day has its bitmap as hex, one
+    bit per cell from midnight, its free intervals and its bookable slots; a
+    month view reads every day of the month from the cache at once.
+    """
+    doctor_profile = DoctorProfile.query.filter_by(user_id=doctor_id).first()
+    if not doctor_profile or not doctor_profile.available_for_appointments:
+        return jsonify({'error': 'Doctor not found'}), 404
+    
+    try:
+        if request.args.get('month'):
+            month_start = datetime.strptime(request.args['month'], '%Y-%m').date()
+            bitmaps = availability_service.month_bitmaps(doctor_profile.id, month_start.year, month_start.month)
+        else:
+            day = date.fromisoformat(request.args.get('date', ''))
+            bitmaps = {day: availability_service.day_bitmap(doctor_profile.id, day)}
+    except ValueError:
+        return jsonify({'error': 'A date (YYYY-MM-DD) or month (YYYY-MM) is required'}), 400
+    
+    settings = AdminSettings.get_settings()
+    duration = timedelta(minutes=settings.appointment_duration_minutes)
+    days = []
+    for day, bitmap in sorted(bitmaps.items()):
+        starts = availability_service.bookable_starts(doctor_profile.id, day, settings, bitmap=bitmap)
+        days.append({
+            'date': day.isoformat(),
+            'bitmap': bitmap.hex(),
+            'free': [{'start_time': start.isoformat(), 'end_time': end.isoformat()} for start, end in bitmap_to_intervals(bitmap, day)],
+            'slots': [{'start_time': start.isoformat(), 'end_time': (start + duration).isoformat()} for start in starts]
+        })
+    
+    return jsonify({
+        'doctor_id': doctor_id,
+        'cell_minutes': CELL_MINUTES,
+        'days': days
+    }), 200
+
+@doctors_bp.route('/next-available', methods=['GET'])
+@jwt_required()
+def get_next_available():
+    """Find the doctors who can be booked soonest, optionally in a specialty and time window
+    
+    Answered from the in-memory availability index, so only the matching
+    doctors' profiles are read from the database.
+    """
+    if not availability_index.ready:
+        return jsonify({'error': 'Availability search is not ready yet'}), 503
+    
+    settings = AdminSettings.get_settings()
+    earliest = datetime.utcnow() + timedelta(hours=settings.min_booking_notice_hours)
+    try:
+        after = max(earliest, parse_utc(request.args['from'])) if request.args.get('from') else earliest
+        before = parse_utc(request.args['to']) if request.args.get('to') else None
+        limit = min(int(request.args.get('limit', 10)), 100)
+    except ValueError:
+        return jsonify({'error': 'from and to must be ISO datetimes and limit a number'}), 400
+    
+    matches = availability_index.earliest(request.args.get('specialty'), after=after, before=before, limit=limit)
+    profiles = {
+        profile.id: profile
+        for profile in DoctorProfile.query.filter(DoctorProfile.id.in_([doctor_id for _, doctor_id in matches])).all()
+    }
+    duration = timedelta(minutes=settings.appointment_duration_minutes)
+    
+    return jsonify({
+        'results': [{
+            'doctor': profiles[doctor_id].to_dict(),
+            'start_time': start.isoformat(),
+            'end_time': (start + duration).isoformat()
+        } for start, doctor_id in matches if doctor_id in profiles]
+    }), 200
+
+def _days_between(start_time, end_time):
+    """Get every date a period touches"""
+    last = (end_time - timedelta(microseconds=1)).date()
+    return [start_time.date() + timedelta(days=offset) for offset in range((last - start_time.date()).days + 1)]
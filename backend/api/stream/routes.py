@@ -0,0 +1,108 @@
+import json
+import time
+
+from flask import Blueprint, Response, request, jsonify, current_app
+from flask_jwt_extended import decode_token
+
+from extensions import db
+from models.user import User, Role
+from models.clinic import Clinic, ClinicDoctor
+from models.doctor_profile import DoctorProfile
+from services.event_bus import event_bus, parse_event_id
+
+stream_bp = Blueprint('stream', __name__, url_prefix='/stream')
+
+def _stream_claims():
+    """Decode the access token of a stream request
+    
+    EventSource can't set headers, so the token may come as ?token= as well.
+    """
+    token = request.args.get('token')
+    auth_header = request.headers.get('Authorization', '')
+    if not token and auth_header.startswith('Bearer '):
+        token = auth_header[len('Bearer '):]
+    if not token:
+        return None
+    
+    try:
+        claims = decode_token(token)
+    except Exception:
+        return None
+    return claims if claims.get('type') == 'access' else None
+
+def _clinic_doctor_ids(admin_id):
+    """Get the user IDs of the doctors in the clinic a clinic admin runs"""
+    rows = db.session.query(DoctorProfile.user_id) \
+        .join(ClinicDoctor, ClinicDoctor.doctor_id == DoctorProfile.id) \
+        .join(Clinic, Clinic.id == ClinicDoctor.clinic_id) \
+        .filter(Clinic.admin_id == admin_id)
+    return {str(user_id) for (user_id,) in rows}
+
+def _format_event(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n'
+
+@stream_bp.route('/dashboard', methods=['GET'])
+def dashboard_stream():
+    """Stream live dashboard events as Server-Sent Events
+    
+    Admins get every event; clinic admins only those about their clinic's
+    doctors. The token is checked once when the stream opens and the stream
+    ends when it expires. Clients resume where they left off by sending the
+    last event ID back, which EventSource does on its own when reconnecting.
+    """
+    claims = _stream_claims()
+    if claims is None:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    user = User.query.with_entities(User.id, User.role, User.is_active).filter(User.id == claims['sub']).first()
+    if not user or not user.is_active or user.role not in (Role.ADMIN, Role.CLINIC_ADMIN):
+        return jsonify({'error': 'Unauthorized to view the dashboard stream'}), 403
+    
+    doctor_ids = _clinic_doctor_ids(user.id) if user.role == Role.CLINIC_ADMIN else None
+    db.session.remove()  # Don't hold a database connection for the life of the stream
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id and parse_event_id(last_event_id) is None:
+        last_event_id = None
+    
+    keepalive_seconds = current_app.config['SSE_KEEPALIVE_SECONDS']
+    replay_limit = current_app.config['SSE_REPLAY_LIMIT']
+    queue_size = current_app.config['SSE_SUBSCRIBER_QUEUE_SIZE']
+    expires_at = claims.get('exp') or time.time() + 3600
+    
+    def visible(data):
+        return doctor_ids is None or str(data.get('doctor_id') or data.get('user_id')) in doctor_ids
+    
+    def generate():
+        # Subscribe before replaying, so nothing published in between is missed
+        subscription = event_bus.subscribe('dashboard', maxsize=queue_size)
+        try:
+            yield 'retry: 3000\n\n'
+            
+            last_seen = parse_event_id(last_event_id) if last_event_id else None
+            if last_event_id:
+                for event_id, event, data in event_bus.since('dashboard', last_event_id, replay_limit):
+                    last_seen = parse_event_id(event_id)
+                    if visible(data):
+                        yield _format_event(event_id, event, data)
+            
+            while time.time() < expires_at and not subscription.overflowed:
+                item = subscription.get(timeout=keepalive_seconds)
+                if item is None:
+                    # Comments keep nginx and other proxies from timing out an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                
+                event_id, event, data = item
+                if last_seen is not None and parse_event_id(event_id) <= last_seen:
+                    continue
+                last_seen = parse_event_id(event_id)
+                if visible(data):
+                    yield _format_event(event_id, event, data)
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Tells nginx to pass events through as they are written
+    })
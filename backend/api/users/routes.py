@@ -9,6 +9,9 @@ from extensions import db
 from models.user import User
 from models.file import File, FileType
 from models.audit_log import AuditLog, AuditAction
+from models.notification import NotificationType
+from models.notification_preference import NotificationPreference, DeliveryMode
+from services.notification_preferences import preference_cache
 from api.auth.utils import validate_password
 
 users_bp = Blueprint('users', __name__, url_prefix='/users')
@@ -248,6 +251,57 @@ def get_user_appointments():
         }
     }), 200
 
+@users_bp.route('/notification-preferences', methods=['GET'])
+@jwt_required()
+def get_notification_preferences():
+    """Get the delivery preference for every notification type"""
+    current_user_id = get_jwt_identity()
+    
+    preferences = NotificationPreference.get_for_users([current_user_id])[str(current_user_id)]
+    
+    return jsonify({
+        'preferences': {
+            type.value: preferences.get(type, DeliveryMode.PERSIST).value
+            for type in NotificationType
+        }
+    }), 200
+
+@users_bp.route('/notification-preferences', methods=['PUT'])
+@jwt_required()
+def update_notification_preferences():
+    """Update delivery preferences, e.g. {"message_received": "push_only"}"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    data = request.get_json()
+    
+    if not data or not isinstance(data, dict):
+        return jsonify({'error': 'Preferences are required'}), 400
+    
+    # Validate notification types and delivery modes
+    updates = {}
+    for type_value, delivery_value in data.items():
+        try:
+            updates[NotificationType(type_value)] = DeliveryMode(delivery_value)
+        except ValueError:
+            return jsonify({'error': f'Invalid preference: {type_value}={delivery_value}'}), 400
+    
+    try:
+        NotificationPreference.set_for_user(user.id, updates)
+        preference_cache.invalidate(user.id)
+        
+        return jsonify({
+            'message': 'Notification preferences updated successfully'
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Error updating notification preferences: {str(e)}')
+        return jsonify({'error': 'Failed to update notification preferences'}), 500
+
 def allowed_file(filename, allowed_extensions):
     """Check if file extension is allowed"""
     return '.' in filename and \
@@ -0,0 +1,183 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_socketio import join_room, leave_room, emit
+
+from extensions import socketio
+from services.socket_sessions import socket_sessions, socket_auth_required
+from models import Appointment, CallQualitySummary, User
+from models.call_quality_summary import render_minute
+from services.call_quality_service import call_quality_service
+from services.consultation_service import ConsultationService
+from services.presence_service import presence_service
+from services.webrtc_service import build_ice_servers, call_room, ice_servers_for, ice_candidate_batcher
+
+webrtc_bp = Blueprint('webrtc', __name__, url_prefix='/webrtc')
+
+@webrtc_bp.route('/ice-servers', methods=['GET'])
+@jwt_required()
+def get_ice_servers():
+    """Get STUN and TURN servers for setting up a call"""
+    ice_servers, expires_at = build_ice_servers(current_app.config, get_jwt_identity())
+    
+    return jsonify({
+        'ice_servers': ice_servers,
+        'expires_at': expires_at
+    }), 200
+
+@webrtc_bp.route('/calls/<appointment_id>/quality', methods=['GET'])
+@jwt_required()
+def get_call_quality(appointment_id):
+    """Get per-minute call quality of each participant, including minutes not persisted yet"""
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    appointment = Appointment.query.get(appointment_id)
+    
+    if not appointment:
+        return jsonify({'error': 'Appointment not found'}), 404
+    
+    # Check if user is authorized to view this appointment
+    if str(appointment.patient_id) != str(user.id) and str(appointment.doctor_id) != str(user.id) and not user.is_admin:
+        return jsonify({'error': 'Unauthorized to view this appointment'}), 403
+    
+    summaries = {
+        str(summary.user_id): summary.to_dict()
+        for summary in CallQualitySummary.query.filter_by(appointment_id=appointment.id)
+    }
+    
+    participants = []
+    for participant_id in (str(appointment.patient_id), str(appointment.doctor_id)):
+        participants.append({
+            'user_id': participant_id,
+            'summary': summaries.get(participant_id),
+            'live_minutes': [
+                render_minute(minute) for minute in call_quality_service.live_minutes(appointment.id, participant_id)
+            ],
+            'recent_samples': call_quality_service.recent_samples(appointment.id, participant_id)
+        })
+    
+    return jsonify({
+        'appointment_id': str(appointment.id),
+        'participants': participants
+    }), 200
+
+# Socket.IO signaling
+#
+# Peers talk through the appointment's call room. Access is checked against the
+# connection's session, which caches the user's appointments, so relaying a
+# message never touches the database.
+
+def _signaling_session(data):
+    """Get the session and appointment of a signaling message, or None if the sender may not signal there"""
+    if not isinstance(data, dict):
+        return None, None
+    appointment_id = data.get('roomId')
+    if not appointment_id:
+        return None, None
+    
+    session = socket_sessions.current()
+    if not socket_sessions.can_access_appointment(session, appointment_id):
+        return None, None
+    return session, str(appointment_id)
+
+@socketio.on('webrtc:join-room')
+@socket_auth_required
+def on_webrtc_join(data):
+    """Join an appointment's call and get the ICE servers to use"""
+    session, appointment_id = _signaling_session(data)
+    if session is None:
+        return {'error': 'Access denied'}
+    
+    join_room(call_room(appointment_id))
+    
+    # Attendance follows presence in the call room, so a reconnect within the grace period continues the session
+    if presence_service.join(session, call_room(appointment_id)):
+        ConsultationService.join(appointment_id, session.user_id, session.name, session.role)
+    
+    emit('webrtc:user-joined', {
+        'roomId': appointment_id,
+        'userId': session.user_id
+    }, room=call_room(appointment_id), include_self=False)
+    
+    return {'iceServers': ice_servers_for(session)}
+
+@socketio.on('webrtc:offer')
+@socket_auth_required
+def on_webrtc_offer(data):
+    """Relay an SDP offer to the other participant"""
+    session, appointment_id = _signaling_session(data)
+    if session is None or not data.get('offer'):
+        return
+    
+    emit('webrtc:offer', {
+        'roomId': appointment_id,
+        'userId': session.user_id,
+        'offer': data['offer']
+    }, room=call_room(appointment_id), include_self=False)
+
+@socketio.on('webrtc:answer')
+@socket_auth_required
+def on_webrtc_answer(data):
+    """Relay an SDP answer to the other participant"""
+    session, appointment_id = _signaling_session(data)
+    if session is None or not data.get('answer'):
+        return
+    
+    emit('webrtc:answer', {
+        'roomId': appointment_id,
+        'userId': session.user_id,
+        'answer': data['answer']
+    }, room=call_room(appointment_id), include_self=False)
+
+@socketio.on('webrtc:ice-candidate')
+@socket_auth_required
+def on_webrtc_ice_candidate(data):
+    """Queue a trickled ICE candidate for the next batch to the other participant"""
+    session, appointment_id = _signaling_session(data)
+    if session is None or not data.get('candidate'):
+        return
+    
+    ice_candidate_batcher.add(
+        request.sid,
+        appointment_id,
+        session.user_id,
+        data['candidate'],
+        current_app.config['WEBRTC_ICE_BATCH_WINDOW_MS'] / 1000
+    )
+
+@socketio.on('webrtc:leave-room')
+@socket_auth_required
+def on_webrtc_leave(data):
+    """Hang up an appointment's call"""
+    session, appointment_id = _signaling_session(data)
+    if session is None:
+        return
+    
+    ice_candidate_batcher.flush((request.sid, appointment_id))
+    emit('webrtc:user-left', {
+        'roomId': appointment_id,
+        'userId': session.user_id
+    }, room=call_room(appointment_id), include_self=False)
+    leave_room(call_room(appointment_id))
+    
+    # The user is out of the call once their last connection hangs up
+    if presence_service.leave(session, call_room(appointment_id)):
+        ConsultationService.leave(appointment_id, session.user_id, session.name, session.role)
+
+@socketio.on('webrtc:stats')
+@socket_auth_required
+def on_webrtc_stats(data):
+    """Take a batch of WebRTC stats samples for the call quality aggregates"""
+    session, appointment_id = _signaling_session(data)
+    samples = data.get('samples') if session is not None else None
+    if not isinstance(samples, list):
+        return
+    
+    call_quality_service.ingest(
+        appointment_id,
+        session.user_id,
+        samples[:current_app.config['CALL_QUALITY_MAX_SAMPLES_PER_EVENT']]
+    )
@@ -5,11 +5,26 @@ from flask_socketio import SocketIO
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
+from socketio import RedisManager
 
 from config import config_by_name
-from extensions import db, migrate, jwt, socketio, limiter
+from extensions import db, migrate, jwt, socketio, limiter, redis_client
 from api import register_blueprints
 from socket_events import register_socket_events
+from commands import register_commands
+from services.notification_preferences import preference_cache
+from services.email_service import email_service
+from services.presence_service import presence_service
+from services.call_quality_service import call_quality_service
+from services.appointment_feed import appointment_feed
+from services.event_bus import event_bus
+from services.availability_service import availability_service
+from services.availability_index import availability_index
+from services.slot_hold_service import slot_holds
+from jobs import job_queue
+from jobs.scheduler import scheduler
+from utils.socketio_serializer import enable_serializer_negotiation, msgpack_available
+from utils.socketio_backpressure import enable_backpressure, redis_metrics_publisher
 
 def create_app(config_name='development'):
     # Load environment variables
@@ -27,18 +42,69 @@ def create_app(config_name='development'):
     jwt.init_app(app)
     CORS(app)
     
-    # Initialize Socket.IO
-    socketio.init_app(app, cors_allowed_origins="*", async_mode='gevent')
+    # Initialize Socket.IO, sharing emits between processes through Redis
+    socketio_options = {'cors_allowed_origins': '*', 'async_mode': app.config['SOCKETIO_ASYNC_MODE']}
+    if app.config['SOCKETIO_MESSAGE_QUEUE']:
+        socketio_options['client_manager'] = RedisManager(
+            app.config['SOCKETIO_MESSAGE_QUEUE'],
+            channel=app.config['SOCKETIO_CHANNEL'],
+            write_only=app.config['SOCKETIO_WRITE_ONLY']
+        )
+    socketio.init_app(app, **socketio_options)
+    
+    # Bound each connection's outbound queue, so slow clients can't hold unbounded memory
+    enable_backpressure(
+        socketio.server,
+        policies=app.config['SOCKETIO_OUTBOUND_POLICIES'],
+        soft_limit_bytes=app.config['SOCKETIO_OUTBOUND_SOFT_LIMIT_BYTES'],
+        max_bytes=app.config['SOCKETIO_OUTBOUND_MAX_BYTES'],
+        max_packets=app.config['SOCKETIO_OUTBOUND_MAX_PACKETS'],
+        publish=redis_metrics_publisher(redis_client, app.config['SOCKETIO_METRICS_PREFIX'], app.config['SOCKETIO_METRICS_INTERVAL'] * 3),
+        metrics_interval=app.config['SOCKETIO_METRICS_INTERVAL']
+    )
+    
+    # Let clients opt into MessagePack packets
+    if app.config['SOCKETIO_MSGPACK_ENABLED'] and msgpack_available():
+        enable_serializer_negotiation(socketio.server)
     
     # Initialize rate limiter
     limiter.init_app(app)
     
+    # Configure the notification preference cache
+    preference_cache.init_app(app)
+    
+    # Initialize Redis and the background job queue
+    redis_client.init_app(app)
+    job_queue.init_app(app)
+    from jobs import tasks  # Registers the job tasks
+    presence_service.init_app(app)
+    call_quality_service.init_app(app)
+    event_bus.init_app(app)
+    availability_service.init_app(app)
+    slot_holds.init_app(app)
+    
+    # Run periodic tasks in a single leader process
+    scheduler.init_app(app)
+    from jobs import schedules  # Registers the periodic tasks
+    
+    # Push appointment changes to doctors from a single listener process
+    appointment_feed.init_app(app)
+    
+    # Keep an in-memory index of doctors' free time for next-available search
+    availability_index.init_app(app)
+    
+    # Initialize the email sender
+    email_service.init_app(app)
+    
     # Register API blueprints
     register_blueprints(app)
     
     # Register Socket.IO event handlers
     register_socket_events(app)
     
+    # Register CLI commands
+    register_commands(app)
+    
     # Create uploads directory if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
@@ -0,0 +1,118 @@
+"""Time next-available queries on the in-memory availability index
+
+Loads synthetic availability for many doctors spread over specialties, each
+free on weekday mornings and afternoons with some of that time already
+booked, then times earliest-available and in-window queries and the update a
+booking applies. Runs entirely in memory.
+    
+    python benchmarks/availability_index.py --doctors 10000 --days 30
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.availability_index import AvailabilityIndex
+from services.availability_service import subtract_intervals
+
+SPECIALTIES = [
+    'Cardiology', 'Dermatology', 'Endocrinology', 'Family Medicine', 'Gastroenterology',
+    'Neurology', 'Oncology', 'Ophthalmology', 'Orthopedics', 'Pediatrics',
+    'Psychiatry', 'Pulmonology', 'Radiology', 'Rheumatology', 'Urology',
+    'Nephrology', 'Gynecology', 'Allergy', 'Infectious Disease', 'Internal Medicine'
+]
+
+def free_day(day, rng, slot_minutes, buffer_minutes, booked_share):
+    """Weekday windows with a random share of their slots booked"""
+    if day.weekday() >= 5:
+        return []
+    windows = [
+        (datetime.combine(day, datetime.min.time()) + timedelta(hours=start), datetime.combine(day, datetime.min.time()) + timedelta(hours=end))
+        for start, end in ((9, 12), (14, 17))
+    ]
+    step = timedelta(minutes=slot_minutes + buffer_minutes)
+    booked = []
+    for start, end in windows:
+        while start + timedelta(minutes=slot_minutes) <= end:
+            if rng.random() < booked_share:
+                booked.append((start - timedelta(minutes=buffer_minutes), start + step))
+            start += step
+    return subtract_intervals(windows, booked)
+
+def make_doctors(count, days, rng, slot_minutes, buffer_minutes, booked_share):
+    doctors = []
+    for _ in range(count):
+        doctors.append((
+            uuid.uuid4(),
+            rng.choice(SPECIALTIES),
+            {day: free_day(day, rng, slot_minutes, buffer_minutes, booked_share) for day in days}
+        ))
+    return doctors
+
+def timed(function, repeats):
+    """Run function repeatedly; returns per-call times in microseconds"""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - started) * 1e6)
+    return sorted(times)
+
+def report(name, times):
+    print(f'{name:<28} p50={times[len(times) // 2]:8.1f} us  p99={times[int(len(times) * 0.99)]:8.1f} us')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--slot-minutes', type=int, default=30)
+    parser.add_argument('--buffer-minutes', type=int, default=10)
+    parser.add_argument('--booked', type=float, default=0.6, help='Share of slots already booked')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    today = date.today()
+    days = [today + timedelta(days=offset) for offset in range(args.days)]
+    doctors = make_doctors(args.doctors, days, rng, args.slot_minutes, args.buffer_minutes, args.booked)
+    
+    index = AvailabilityIndex()
+    started = time.perf_counter()
+    index.load(doctors, args.slot_minutes, args.buffer_minutes)
+    load_seconds = time.perf_counter() - started
+    slots = sum(len(group.starts) for group in index._specialties.values())
+    print(f'doctors={args.doctors} days={args.days} specialties={len(SPECIALTIES)} bookable slots={slots}')
+    print(f'load: {load_seconds:.2f} s')
+    
+    now = datetime.combine(today, datetime.min.time())
+    week_end = now + timedelta(days=7)
+    
+    def random_time():
+        return now + timedelta(minutes=rng.randrange(args.days * 24 * 60))
+    
+    report('earliest, one specialty', timed(lambda: index.earliest(rng.choice(SPECIALTIES), after=random_time(), limit=1), args.queries))
+    report('earliest 10, one specialty', timed(lambda: index.earliest(rng.choice(SPECIALTIES), after=random_time(), limit=10), args.queries))
+    report('earliest, all specialties', timed(lambda: index.earliest(after=random_time(), limit=1), args.queries))
+    report('this week, one specialty', timed(lambda: index.available_in_window(now, week_end, rng.choice(SPECIALTIES), limit=50), args.queries))
+    
+    def book():
+        doctor_id, specialty, free = rng.choice(doctors)
+        day = rng.choice(days)
+        intervals = free[day]
+        if intervals:
+            start, end = intervals[0]
+            intervals = subtract_intervals(intervals, [(start, start + timedelta(minutes=args.slot_minutes + args.buffer_minutes))])
+            free[day] = intervals
+        index.update_day(doctor_id, specialty, day, intervals)
+    
+    report('apply a booking', timed(book, args.queries))
+
+if __name__ == '__main__':
+    main()
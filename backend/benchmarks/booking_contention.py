@@ -0,0 +1,193 @@
+"""Hammer the same time slots with concurrent bookings
+
+Every client thread has its own database connection and, released together,
+tries to book one of a few popular slots, the way the booking endpoint
+writes it. Two strategies are compared:
+
+- read-check-write: read the slot, check is_available, mark it taken and
+  insert the appointment, as create_appointment used to. Racing clients all
+  pass the check and the losers fail late on a constraint.
+- atomic claim: TimeSlot.claim_statement takes the slot with one conditional
+  UPDATE ... RETURNING whose subquery skips locked rows, so losers fail
+  before doing any other work.
+
+Reports throughput, latency and how attempts ended. Needs a seeded database
+with enough available future slots; the appointments it books are deleted and
+the slots made available again afterwards.
+    
+    python benchmarks/booking_contention.py --clients 300 --slots 5 --rounds 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from sqlalchemy import create_engine, exc, insert, select, text, update
+
+def _percentile(values, percent):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+def load_targets(count):
+    """Get available future slots of one doctor, spaced beyond the buffer, and some patients"""
+    from models import AdminSettings, DoctorProfile, TimeSlot, User, Role
+    from models.time_slot import SlotType
+    
+    settings = AdminSettings.get_settings()
+    not_before = datetime.utcnow() + timedelta(hours=settings.min_booking_notice_hours + 1)
+    buffer = timedelta(minutes=settings.buffer_time_minutes)
+    slots = TimeSlot.query.filter(
+        TimeSlot.slot_type == SlotType.CUSTOM,
+        TimeSlot.is_available == True,
+        TimeSlot.start_time > not_before
+    ).order_by(TimeSlot.doctor_id, TimeSlot.start_time).all()
+    
+    chosen = []
+    for slot in slots:
+        if chosen and slot.doctor_id != chosen[0].doctor_id:
+            continue
+        if not chosen or slot.start_time >= chosen[-1].end_time + buffer:
+            chosen.append(slot)
+        if len(chosen) == count:
+            break
+    if len(chosen) < count:
+        raise RuntimeError(f'Need {count} available future slots of one doctor, found {len(chosen)}')
+    
+    doctor_user_id = DoctorProfile.query.get(chosen[0].doctor_id).user_id
+    patient_ids = [patient_id for (patient_id,) in User.query.with_entities(User.id).filter_by(role=Role.PATIENT).all()]
+    if not patient_ids:
+        raise RuntimeError('The database has no patients to book with')
+    return [slot.id for slot in chosen], doctor_user_id, patient_ids
+
+def appointment_row(slot_id, patient_id, doctor_user_id):
+    from models.appointment import AppointmentStatus
+    
+    now = datetime.utcnow()
+    return {
+        'id': uuid.uuid4(),
+        'patient_id': patient_id,
+        'doctor_id': doctor_user_id,
+        'time_slot_id': slot_id,
+        'status': AppointmentStatus.PENDING,
+        'reason': 'booking contention benchmark',
+        'last_message_seq': 0,
+        'created_at': now,
+        'updated_at': now
+    }
+
+def read_check_write(connection, slot_id, row):
+    from models import Appointment, TimeSlot
+    
+    slots = TimeSlot.__table__
+    with connection.begin():
+        available = connection.execute(select(slots.c.is_available).where(slots.c.id == slot_id)).scalar()
+        if not available:
+            return 'rejected'
+        connection.execute(update(slots).where(slots.c.id == slot_id).values(is_available=False))
+        connection.execute(insert(Appointment.__table__).values(**row))
+    return 'booked'
+
+def atomic_claim(connection, slot_id, row):
+    from models import Appointment, TimeSlot
+    
+    with connection.begin() as transaction:
+        if connection.execute(TimeSlot.claim_statement(slot_id)).first() is None:
+            transaction.rollback()
+            return 'rejected'
+        connection.execute(insert(Appointment.__table__).values(**row))
+    return 'booked'
+
+def run_round(engine, strategy, clients, slot_ids, doctor_user_id, patient_ids):
+    """Release every client at once; returns [(outcome, seconds)] and the wall time"""
+    barrier = threading.Barrier(clients + 1)
+    results = [None] * clients
+    
+    def client(index):
+        slot_id = slot_ids[index % len(slot_ids)]
+        row = appointment_row(slot_id, patient_ids[index % len(patient_ids)], doctor_user_id)
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))  # Open the connection before the race starts
+            connection.commit()
+            barrier.wait()
+            started = time.perf_counter()
+            try:
+                outcome = strategy(connection, slot_id, row)
+            except exc.IntegrityError:
+                outcome = 'late conflict'
+            except exc.DBAPIError:
+                outcome = 'error'
+            results[index] = (outcome, time.perf_counter() - started)
+    
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+def reset(engine, slot_ids):
+    """Delete the benchmark's appointments and make its slots available again"""
+    from models import Appointment, TimeSlot
+    
+    appointments = Appointment.__table__
+    slots = TimeSlot.__table__
+    with engine.begin() as connection:
+        connection.execute(appointments.delete().where(
+            appointments.c.time_slot_id.in_(slot_ids),
+            appointments.c.reason == 'booking contention benchmark'
+        ))
+        connection.execute(update(slots).where(slots.c.id.in_(slot_ids)).values(is_available=True))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default=os.getenv('FLASK_CONFIG', 'development'))
+    parser.add_argument('--clients', type=int, default=300, help='Concurrent clients, each with its own connection')
+    parser.add_argument('--slots', type=int, default=5, help='Slots the clients compete for')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    
+    os.environ['PERIODIC_TASKS_ENABLED'] = 'False'
+    os.environ['APPOINTMENT_FEED_ENABLED'] = 'False'
+    from app import create_app
+    
+    app = create_app(args.config)
+    with app.app_context():
+        slot_ids, doctor_user_id, patient_ids = load_targets(args.slots)
+        engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], pool_size=args.clients + 1, max_overflow=0)
+        
+        print(f'clients={args.clients} slots={args.slots} rounds={args.rounds}')
+        for name, strategy in (('read-check-write', read_check_write), ('atomic claim', atomic_claim)):
+            outcomes = {}
+            latencies = []
+            seconds = 0
+            for _ in range(args.rounds):
+                reset(engine, slot_ids)
+                results, elapsed = run_round(engine, strategy, args.clients, slot_ids, doctor_user_id, patient_ids)
+                seconds += elapsed
+                for outcome, latency in results:
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                    latencies.append(latency)
+            reset(engine, slot_ids)
+            
+            attempts = args.clients * args.rounds
+            failed = attempts - outcomes.get('booked', 0) - outcomes.get('rejected', 0)
+            print(
+                f'{name}: {attempts / seconds:.0f} attempts/s '
+                f'p50={_percentile(latencies, 50) * 1000:.1f} ms p99={_percentile(latencies, 99) * 1000:.1f} ms '
+                f'error rate={failed / attempts * 100:.1f}% '
+                + ' '.join(f'{outcome}={count}' for outcome, count in sorted(outcomes.items()))
+            )
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Check that Socket.IO events reach clients on every server process through Redis
+
+Starts two API server processes on different ports, connects one client to
+each as an existing active user (clients join their user room on connect), then emits from this process the way the
+job worker does (write-only, through the message queue). Every client must
+receive its event no matter which process it is connected to.
+
+Needs a local Redis (REDIS_URL, default redis://localhost:6379/0) and a seeded
+database with at least one active user per server process:
+    
+    python benchmarks/socketio_cross_process.py
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def serve(port, config_name):
+    from gevent import monkey
+    monkey.patch_all()
+    
+    from app import create_app
+    from extensions import socketio
+    
+    app = create_app(config_name)
+    socketio.run(app, host='127.0.0.1', port=port)
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+def connect_client(port, token, user_id, received, joined):
+    import socketio as socketio_client
+    
+    client = socketio_client.Client()
+    
+    @client.on('room_joined')
+    def on_room_joined(data):
+        joined[user_id].set()
+    
+    @client.on('notification')
+    def on_notification(data):
+        received[user_id].append((port, data))
+    
+    client.connect(f'http://127.0.0.1:{port}', headers={'Authorization': f'Bearer {token}'},
+                   transports=['websocket'])
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default=os.getenv('FLASK_CONFIG', 'development'))
+    parser.add_argument('--ports', default='5101,5102', help='Comma-separated ports, one server process per port')
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    os.environ['PERIODIC_TASKS_ENABLED'] = 'False'
+    if args.serve:
+        serve(args.serve, args.config)
+        return
+    
+    # This process only publishes, like the job worker
+    os.environ['SOCKETIO_ASYNC_MODE'] = 'threading'
+    os.environ['SOCKETIO_WRITE_ONLY'] = 'True'
+    
+    ports = [int(port) for port in args.ports.split(',')]
+    servers = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--config', args.config, '--serve', str(port)],
+                         cwd=BACKEND_DIR)
+        for port in ports
+    ]
+    clients = []
+    try:
+        for port in ports:
+            wait_for_port(port)
+        
+        from flask_jwt_extended import create_access_token
+        from app import create_app
+        from extensions import socketio
+        from models import User
+        
+        app = create_app(args.config)
+        with app.app_context():
+            users = User.query.filter_by(is_active=True).limit(len(ports)).all()
+            if len(users) < len(ports):
+                raise RuntimeError(f'Need {len(ports)} active users, found {len(users)}')
+            user_ids = {port: str(user.id) for port, user in zip(ports, users)}
+            received = {user_id: [] for user_id in user_ids.values()}
+            joined = {user_id: threading.Event() for user_id in user_ids.values()}
+            
+            for port, user_id in user_ids.items():
+                token = create_access_token(identity=user_id)
+                clients.append(connect_client(port, token, user_id, received, joined))
+        
+        for user_id, event in joined.items():
+            if not event.wait(args.timeout):
+                raise RuntimeError(f'User {user_id} never joined their room')
+        
+        sent_at = time.monotonic()
+        for user_id in user_ids.values():
+            socketio.emit('notification', {'user_id': user_id}, room=user_id)
+        
+        deadline = sent_at + args.timeout
+        while time.monotonic() < deadline and not all(received.values()):
+            time.sleep(0.01)
+        elapsed_ms = (time.monotonic() - sent_at) * 1000
+        
+        failed = False
+        for port, user_id in user_ids.items():
+            events = received[user_id]
+            if len(events) != 1 or events[0][1]['user_id'] != user_id:
+                failed = True
+                print(f'FAIL  port {port}: expected one notification for {user_id}, got {events}')
+            else:
+                print(f'OK    port {port}: notification delivered')
+        print(f'Delivered to {len(ports)} server processes in {elapsed_ms:.1f} ms')
+        sys.exit(1 if failed else 0)
+    finally:
+        for client in clients:
+            client.disconnect()
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
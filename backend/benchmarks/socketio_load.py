@@ -0,0 +1,222 @@
+"""Measure how many consult rooms one gevent Socket.IO worker sustains
+
+Starts a single API server process and a few load generator processes. Each
+open appointment becomes a consult room with two authenticated clients, its
+patient and its doctor, who connect, join the room and then chat through the
+send_message HTTP endpoint. The recipient measures delivery latency of the
+resulting new_message and notification events.
+
+Reports connect rate, p50/p99 delivery latency, server memory per connection
+and server CPU per message sent. Needs a local Redis and a seeded database
+with enough PENDING or CONFIRMED appointments; messages are stored like any
+other chat message.
+    
+    python benchmarks/socketio_load.py --rooms 1000 --messages 5 --interval 2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from socketio_cross_process import serve, wait_for_port
+
+def _proc_stat(pid):
+    """Get (resident bytes, CPU seconds) of a process from /proc"""
+    with open(f'/proc/{pid}/statm') as f:
+        rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return rss, cpu
+
+def _percentile(values, percent):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+def run_load(spec_path):
+    """Load generator process: connect this share of the rooms, wait for GO, chat and report"""
+    from gevent import monkey
+    monkey.patch_all()
+    
+    import gevent
+    import urllib.request
+    import socketio as socketio_client
+    
+    with open(spec_path) as f:
+        spec = json.load(f)
+    base_url = spec['base_url']
+    
+    sent_at = {}  # appointment_id -> send times not yet matched by a notification
+    latencies = {'new_message': [], 'notification': []}
+    connect_times = []
+    clients = []
+    
+    def connect(participant, appointment_id):
+        client = socketio_client.Client(reconnection=False)
+        
+        @client.on('new_message')
+        def on_new_message(data):
+            message = data['message']
+            if message['sender_id'] != participant['user_id'] and message['content'].startswith('bench '):
+                latencies['new_message'].append(time.time() - float(message['content'].split()[1]))
+        
+        @client.on('notification')
+        def on_notification(data):
+            pending = sent_at.get(data.get('resource_id'))
+            if data.get('type') == 'message_received' and pending:
+                latencies['notification'].append(time.time() - pending.pop(0))
+        
+        started = time.time()
+        client.connect(base_url, headers={'Authorization': f"Bearer {participant['token']}"}, transports=['websocket'])
+        connect_times.append((started, time.time()))
+        clients.append(client)
+        # Waiting for the acknowledgement means the client is in the room before anyone chats
+        client.call('join', {'appointment_id': appointment_id}, timeout=spec['timeout'])
+    
+    def open_room(room):
+        for participant in (room['patient'], room['doctor']):
+            connect(participant, room['appointment_id'])
+    
+    gevent.joinall([gevent.spawn(open_room, room) for room in spec['rooms']])
+    print('READY', flush=True)
+    sys.stdin.readline()  # Wait for GO, so every generator chats at the same time
+    
+    def chat(room):
+        appointment_id = room['appointment_id']
+        for i in range(spec['messages']):
+            sender = room['patient'] if i % 2 == 0 else room['doctor']
+            now = time.time()
+            sent_at.setdefault(appointment_id, []).append(now)
+            request = urllib.request.Request(
+                f'{base_url}/api/appointments/{appointment_id}/messages',
+                data=json.dumps({'content': f'bench {now}'}).encode(),
+                headers={'Authorization': f"Bearer {sender['token']}", 'Content-Type': 'application/json'},
+                method='POST'
+            )
+            urllib.request.urlopen(request, timeout=spec['timeout']).read()
+            gevent.sleep(spec['interval'])
+    
+    gevent.joinall([gevent.spawn(chat, room) for room in spec['rooms']])
+    expected = len(spec['rooms']) * spec['messages']
+    deadline = time.time() + spec['timeout']
+    while time.time() < deadline and len(latencies['notification']) < expected:
+        gevent.sleep(0.05)
+    
+    for client in clients:
+        client.disconnect()
+    print(json.dumps({'connect_times': connect_times, 'latencies': latencies, 'sent': expected}), flush=True)
+
+def load_rooms(config_name, count):
+    """Get open appointments and access tokens for both participants of each"""
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from models import Appointment
+    from services.socket_sessions import OPEN_APPOINTMENT_STATUSES
+    
+    app = create_app(config_name)
+    with app.app_context():
+        appointments = Appointment.query.with_entities(Appointment.id, Appointment.patient_id, Appointment.doctor_id) \
+            .filter(Appointment.status.in_(OPEN_APPOINTMENT_STATUSES)).limit(count).all()
+        if len(appointments) < count:
+            raise RuntimeError(f'Need {count} open appointments, found {len(appointments)}')
+        
+        tokens = {}
+        def participant(user_id):
+            user_id = str(user_id)
+            if user_id not in tokens:
+                tokens[user_id] = create_access_token(identity=user_id)
+            return {'user_id': user_id, 'token': tokens[user_id]}
+        
+        return [{
+            'appointment_id': str(appointment.id),
+            'patient': participant(appointment.patient_id),
+            'doctor': participant(appointment.doctor_id)
+        } for appointment in appointments]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default=os.getenv('FLASK_CONFIG', 'development'))
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--rooms', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=5, help='Messages sent per room')
+    parser.add_argument('--interval', type=float, default=2, help='Seconds between messages in a room')
+    parser.add_argument('--generators', type=int, default=4, help='Load generator processes')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--load', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    os.environ['PERIODIC_TASKS_ENABLED'] = 'False'
+    os.environ['APPOINTMENT_FEED_ENABLED'] = 'False'
+    os.environ.setdefault('RATE_LIMIT_DEFAULT', '1000000/hour')  # The benchmark sends from one address
+    if args.serve:
+        serve(args.serve, args.config)
+        return
+    if args.load:
+        run_load(args.load)
+        return
+    
+    rooms = load_rooms(args.config, args.rooms)
+    script = os.path.abspath(__file__)
+    server = subprocess.Popen([sys.executable, script, '--config', args.config, '--serve', str(args.port)])
+    generators = []
+    spec_dir = tempfile.mkdtemp(prefix='socketio-load-')
+    try:
+        wait_for_port(args.port)
+        time.sleep(1)
+        baseline_rss, _ = _proc_stat(server.pid)
+        
+        for i in range(args.generators):
+            spec_path = os.path.join(spec_dir, f'generator-{i}.json')
+            with open(spec_path, 'w') as f:
+                json.dump({
+                    'base_url': f'http://127.0.0.1:{args.port}',
+                    'rooms': rooms[i::args.generators],
+                    'messages': args.messages,
+                    'interval': args.interval,
+                    'timeout': args.timeout
+                }, f)
+            generators.append(subprocess.Popen(
+                [sys.executable, script, '--load', spec_path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+            ))
+        
+        for generator in generators:
+            if generator.stdout.readline().strip() != 'READY':
+                raise RuntimeError('A load generator failed to connect its clients')
+        connected_rss, cpu_before = _proc_stat(server.pid)
+        
+        for generator in generators:
+            generator.stdin.write('GO\n')
+            generator.stdin.flush()
+        results = [json.loads(generator.stdout.readline()) for generator in generators]
+        _, cpu_after = _proc_stat(server.pid)
+    finally:
+        for generator in generators:
+            generator.kill()
+        server.terminate()
+        server.wait()
+    
+    connect_times = [times for result in results for times in result['connect_times']]
+    clients = len(connect_times)
+    connect_seconds = max(end for _, end in connect_times) - min(start for start, _ in connect_times)
+    sent = sum(result['sent'] for result in results)
+    
+    print(f'rooms={len(rooms)} clients={clients} messages={sent}')
+    print(f'connect rate: {clients / connect_seconds:.0f} connections/s')
+    print(f'memory per connection: {(connected_rss - baseline_rss) / max(clients, 1) / 1024:.1f} KB')
+    print(f'cpu per message: {(cpu_after - cpu_before) / max(sent, 1) * 1000:.2f} ms')
+    for event in ('new_message', 'notification'):
+        latencies = [latency for result in results for latency in result['latencies'][event]]
+        print(
+            f'{event}: delivered={len(latencies)}/{sent} '
+            f'p50={_percentile(latencies, 50) * 1000:.1f} ms p99={_percentile(latencies, 99) * 1000:.1f} ms'
+        )
+
+if __name__ == '__main__':
+    main()
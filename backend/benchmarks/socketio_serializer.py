@@ -0,0 +1,84 @@
+"""Compare JSON and MessagePack Socket.IO packets for typical CareBridge events
+
+Encodes representative new_message, notification, user_joined and user_left
+payloads with both packet formats and reports encoded size and encode time.
+    
+    python benchmarks/socketio_serializer.py --iterations 20000
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime
+
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+def _user():
+    return {
+        'id': str(uuid.uuid4()),
+        'first_name': 'Amelia',
+        'last_name': 'Okafor',
+        'role': 'doctor',
+        'profile_picture': 'profile_pictures/2f1c7c1e-amelia.jpg'
+    }
+
+def sample_events():
+    """Payloads shaped like the ones the API emits"""
+    appointment_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    message = {
+        'id': str(uuid.uuid4()),
+        'appointment_id': appointment_id,
+        'sender_id': str(uuid.uuid4()),
+        'message_type': 'text',
+        'content': 'The rash started three days ago and has been spreading to my forearm since yesterday.',
+        'seq': 42,
+        'file_id': None,
+        'created_at': now,
+        'updated_at': now,
+        'sender': _user()
+    }
+    return {
+        'new_message': {'message': message},
+        'notification': {
+            'id': str(uuid.uuid4()),
+            'type': 'message_received',
+            'title': 'New message received',
+            'message': 'You have a new message in your appointment',
+            'resource_type': 'Appointment',
+            'resource_id': appointment_id,
+            'status': 'unread',
+            'created_at': now
+        },
+        'user_joined': {
+            'user': {'id': str(uuid.uuid4()), 'name': 'Amelia Okafor', 'role': 'doctor'},
+            'message': dict(message, message_type='system', content='Amelia Okafor joined the consultation')
+        },
+        'user_left': {
+            'user': {'id': str(uuid.uuid4()), 'name': 'Amelia Okafor', 'role': 'doctor'},
+            'message': dict(message, message_type='system', content='Amelia Okafor left the consultation')
+        }
+    }
+
+def measure(packet_class, event, data, iterations):
+    encoded = packet_class(packet.EVENT, data=[event, data], namespace='/').encode()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        packet_class(packet.EVENT, data=[event, data], namespace='/').encode()
+    elapsed = time.perf_counter() - started
+    return len(encoded), elapsed / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    
+    print(f"{'event':<14}{'json bytes':>12}{'msgpack bytes':>15}{'saved':>8}{'json us':>10}{'msgpack us':>12}")
+    for event, data in sample_events().items():
+        json_size, json_us = measure(packet.Packet, event, data, args.iterations)
+        msgpack_size, msgpack_us = measure(MsgPackPacket, event, data, args.iterations)
+        saved = (1 - msgpack_size / json_size) * 100
+        print(f'{event:<14}{json_size:>12}{msgpack_size:>15}{saved:>7.1f}%{json_us:>10.2f}{msgpack_us:>12.2f}')
+
+if __name__ == '__main__':
+    main()
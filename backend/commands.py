@@ -0,0 +1,183 @@
+import click
+
+from models import Appointment, AdminSettings, ScheduledTask, TimeSlot
+from models.appointment import APPOINTMENT_NOTIFY_DDL, APPOINTMENT_PERIOD_DDL, ACTIVE_APPOINTMENT_STATUSES_SQL
+from models.time_slot import TAKEN_SLOT_SQL
+from services.reminder_service import ReminderService
+from extensions import db, redis_client
+from jobs import job_queue
+from utils.socketio_backpressure import collect_metrics
+
+def register_commands(app):
+    """Register custom Flask CLI commands"""
+    
+    @app.cli.command('send-reminders')
+    def send_reminders():
+        """Send appointment reminders that are due"""
+        sent = ReminderService.send_due_reminders()
+        click.echo(f'Sent {sent} appointment reminders')
+    
+    @app.cli.command('reschedule-reminders')
+    def reschedule_reminders():
+        """Recompute reminder due times from the current admin settings"""
+        settings = AdminSettings.get_settings()
+        Appointment.reschedule_reminders(settings.reminder_hours_before)
+        click.echo(f'Rescheduled pending reminders to {settings.reminder_hours_before} hours before')
+    
+    @app.cli.command('backfill-reminders')
+    def backfill_reminders():
+        """Schedule reminders for upcoming appointments that have no due time yet"""
+        settings = AdminSettings.get_settings()
+        backfilled = Appointment.backfill_reminders(settings.reminder_hours_before)
+        click.echo(f'Scheduled reminders for {backfilled} appointments')
+    
+    @app.cli.command('jobs-stats')
+    def jobs_stats():
+        """Show background job queue depths"""
+        stats = job_queue.stats()
+        for queue, priorities in sorted(stats['queues'].items()):
+            click.echo(f'{queue}: ' + ', '.join(f'{priority}={count}' for priority, count in priorities.items()))
+        click.echo(f"processing={stats['processing']} delayed={stats['delayed']} dead={stats['dead']}")
+    
+    @app.cli.command('socket-stats')
+    def socket_stats():
+        """Show outbound queue and backpressure metrics of every Socket.IO server process"""
+        snapshots = collect_metrics(redis_client, app.config['SOCKETIO_METRICS_PREFIX'])
+        if not snapshots:
+            click.echo('No Socket.IO server processes reporting')
+        for process, snapshot in sorted(snapshots.items()):
+            click.echo(
+                f"{process}: connections={snapshot['connections']} queued_bytes={snapshot['queued_bytes']} "
+                f"max_queued_bytes={snapshot['max_queued_bytes']} queued_packets={snapshot['queued_packets']} "
+                f"backpressure_disconnects={snapshot['backpressure_disconnects']}"
+            )
+            for kind in ('dropped', 'coalesced'):
+                if snapshot[kind]:
+                    click.echo(f'  {kind}: ' + ', '.join(f'{event}={count}' for event, count in sorted(snapshot[kind].items())))
+    
+    @app.cli.command('jobs-retry-dead')
+    def jobs_retry_dead():
+        """Requeue every dead-lettered job"""
+        requeued = job_queue.retry_dead_letters()
+        click.echo(f'Requeued {requeued} dead-lettered jobs')
+    
+    @app.cli.command('scheduled-tasks')
+    def scheduled_tasks():
+        """Show last run, duration and lag of every periodic task"""
+        for task in ScheduledTask.query.order_by(ScheduledTask.name).all():
+            click.echo(
+                f'{task.name}: every {task.interval_seconds}s, last run {task.last_run_at}, '
+                f'duration {task.last_duration_ms}ms, lag {task.last_lag_ms}ms, '
+                f'next run {task.next_run_at}, runs {task.run_count}, failures {task.failure_count}'
+                + (f', last error: {task.last_error}' if task.last_error else '')
+            )
+    
+    @app.cli.command('install-appointment-triggers')
+    def install_appointment_triggers():
+        """Create or replace the triggers that feed appointment changes to doctors"""
+        db.session.execute(db.text(APPOINTMENT_NOTIFY_DDL))
+        db.session.commit()
+        click.echo('Installed appointment notify triggers')
+    
+    @app.cli.command('install-booking-constraints')
+    def install_booking_constraints():
+        """Add the range columns and overlap exclusion constraints to existing databases"""
+        db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+        db.session.execute(db.text(
+            'ALTER TABLE timeslot ADD COLUMN IF NOT EXISTS period tsrange '
+            'GENERATED ALWAYS AS (tsrange(start_time, end_time)) STORED'
+        ))
+        db.session.execute(db.text('ALTER TABLE appointment ADD COLUMN IF NOT EXISTS booked_period tsrange'))
+        db.session.execute(db.text(APPOINTMENT_PERIOD_DDL))
+        
+        # Setting time_slot_id to itself runs the trigger, which fills in booked_period
+        db.session.execute(db.text('UPDATE appointment SET time_slot_id = time_slot_id WHERE booked_period IS NULL'))
+        
+        # A cancelled appointment gives its slot back, so only the others keep it to themselves
+        db.session.execute(db.text('ALTER TABLE appointment DROP CONSTRAINT IF EXISTS appointment_time_slot_id_key'))
+        db.session.execute(db.text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_appointment_time_slot ON appointment (time_slot_id) WHERE status <> 'CANCELLED'"
+        ))
+        
+        # Recreated every time, since earlier versions also covered free slots
+        db.session.execute(db.text('ALTER TABLE timeslot DROP CONSTRAINT IF EXISTS excl_timeslot_doctor_period'))
+        constraints = {
+            'excl_timeslot_doctor_period': "ALTER TABLE timeslot ADD CONSTRAINT excl_timeslot_doctor_period "
+                                           f"EXCLUDE USING gist (doctor_id WITH =, period WITH &&) WHERE ({TAKEN_SLOT_SQL})",
+            'excl_appointment_doctor_period': "ALTER TABLE appointment ADD CONSTRAINT excl_appointment_doctor_period "
+                                              f"EXCLUDE USING gist (doctor_id WITH =, booked_period WITH &&) WHERE ({ACTIVE_APPOINTMENT_STATUSES_SQL})",
+            'excl_appointment_patient_period': "ALTER TABLE appointment ADD CONSTRAINT excl_appointment_patient_period "
+                                               f"EXCLUDE USING gist (patient_id WITH =, booked_period WITH &&) WHERE ({ACTIVE_APPOINTMENT_STATUSES_SQL})"
+        }
+        existing = {name for (name,) in db.session.execute(
+            db.text('SELECT conname FROM pg_constraint WHERE conname = ANY(:names)'), {'names': list(constraints)}
+        )}
+        try:
+            for name, statement in constraints.items():
+                if name not in existing:
+                    db.session.execute(db.text(statement))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise click.ClickException(f'Existing rows overlap, resolve them and run this again: {str(e)}')
+        click.echo('Installed booking range columns and exclusion constraints')
+    
+    @app.cli.command('install-message-sequence')
+    def install_message_sequence():
+        """Add per-appointment message sequence numbers to existing databases"""
+        db.session.execute(db.text('ALTER TABLE appointment ADD COLUMN IF NOT EXISTS last_message_seq integer NOT NULL DEFAULT 0'))
+        db.session.execute(db.text('ALTER TABLE message ADD COLUMN IF NOT EXISTS seq integer'))
+        
+        # Number messages without one in the order they were sent, after any already numbered
+        backfilled = db.session.execute(db.text("""
+            UPDATE message
+            SET seq = numbered.seq
+            FROM (
+                SELECT message.id,
+                       COALESCE(latest.seq, 0)
+                           + row_number() OVER (PARTITION BY message.appointment_id ORDER BY message.created_at, message.id) AS seq
+                FROM message
+                LEFT JOIN (
+                    SELECT appointment_id, MAX(seq) AS seq FROM message GROUP BY appointment_id
+                ) AS latest ON latest.appointment_id = message.appointment_id
+                WHERE message.seq IS NULL
+            ) AS numbered
+            WHERE message.id = numbered.id
+        """)).rowcount
+        db.session.execute(db.text('ALTER TABLE message ALTER COLUMN seq SET NOT NULL'))
+        
+        exists = db.session.execute(
+            db.text("SELECT 1 FROM pg_constraint WHERE conname = 'uq_message_appointment_seq'")
+        ).first()
+        if not exists:
+            db.session.execute(db.text(
+                'ALTER TABLE message ADD CONSTRAINT uq_message_appointment_seq UNIQUE (appointment_id, seq)'
+            ))
+        
+        # New messages continue from the latest number of their appointment
+        db.session.execute(db.text("""
+            UPDATE appointment
+            SET last_message_seq = latest.seq
+            FROM (SELECT appointment_id, MAX(seq) AS seq FROM message GROUP BY appointment_id) AS latest
+            WHERE appointment.id = latest.appointment_id
+              AND appointment.last_message_seq < latest.seq
+        """))
+        db.session.commit()
+        click.echo(f'Installed message sequence numbers, backfilled {backfilled} messages')
+    
+    @app.cli.command('install-retention-indexes')
+    def install_retention_indexes():
+        """Add the indexes the retention purge relies on to existing databases"""
+        db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_message_created_at ON message (created_at)'))
+        db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_message_file_id ON message (file_id) WHERE file_id IS NOT NULL'))
+        db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_file_created_at ON file (created_at)'))
+        db.session.commit()
+        click.echo('Installed retention indexes')
+    
+    @app.cli.command('remove-materialized-slots')
+    def remove_materialized_slots():
+        """Delete the unbooked future slots earlier versions created from recurring slots"""
+        removed = TimeSlot.remove_unbooked()
+        db.session.execute(db.text('ALTER TABLE timeslot DROP COLUMN IF EXISTS materialized_until'))
+        db.session.commit()
+        click.echo(f'Removed {removed} materialized time slots')
@@ -1,3 +1,4 @@
+import redis
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
@@ -5,9 +6,24 @@ from flask_socketio import SocketIO
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
+class RedisClient:
+    """Redis connection pool configured from REDIS_URL, shared across the app"""
+    
+    def __init__(self):
+        self._client = None
+    
+    def init_app(self, app):
+        self._client = redis.Redis.from_url(app.config['REDIS_URL'])
+    
+    def __getattr__(self, name):
+        if self._client is None:
+            raise RuntimeError('Redis client is not initialized, call init_app first')
+        return getattr(self._client, name)
+
 # Initialize extensions
 db = SQLAlchemy()
 migrate = Migrate()
 jwt = JWTManager()
 socketio = SocketIO()
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+limiter = Limiter(key_func=get_remote_address)
+redis_client = RedisClient()
@@ -0,0 +1 @@
+from jobs.queue import job_queue, JobQueue, PRIORITIES
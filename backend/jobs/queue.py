@@ -0,0 +1,247 @@
+import json
+import random
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+from extensions import db, redis_client
+
+# Priorities in the order workers drain them
+PRIORITIES = ('high', 'normal', 'low')
+
+# Moves delayed jobs whose run time has passed onto their queue
+PROMOTE_DELAYED_SCRIPT = """
+local payloads = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, payload in ipairs(payloads) do
+    redis.call('ZREM', KEYS[1], payload)
+    local job = cjson.decode(payload)
+    redis.call('LPUSH', ARGV[3] .. ':queue:' .. job['queue'] .. ':' .. job['priority'], payload)
+end
+return #payloads
+"""
+
+# Pops the next job from the first non-empty priority list and leases it in the same step,
+# so a worker dying in between can't lose it. KEYS are the priority lists, then the
+# processing hash and the lease set.
+DEQUEUE_SCRIPT = """
+for i = 1, #KEYS - 2 do
+    local payload = redis.call('RPOP', KEYS[i])
+    if payload then
+        local job = cjson.decode(payload)
+        redis.call('HSET', KEYS[#KEYS - 1], job['id'], payload)
+        redis.call('ZADD', KEYS[#KEYS], ARGV[1], job['id'])
+        return payload
+    end
+end
+return false
+"""
+
+# Puts jobs back on their queue once their lease runs out, e.g. because the worker holding them died
+REQUEUE_EXPIRED_SCRIPT = """
+local job_ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job_id in ipairs(job_ids) do
+    redis.call('ZREM', KEYS[1], job_id)
+    local payload = redis.call('HGET', KEYS[2], job_id)
+    if payload then
+        redis.call('HDEL', KEYS[2], job_id)
+        local job = cjson.decode(payload)
+        redis.call('RPUSH', ARGV[3] .. ':queue:' .. job['queue'] .. ':' .. job['priority'], payload)
+    end
+end
+return #job_ids
+"""
+
+class TaskSpec:
+    """A registered task and its queueing defaults"""
+    
+    def __init__(self, func, queue, priority, max_retries):
+        self.func = func
+        self.queue = queue
+        self.priority = priority
+        self.max_retries = max_retries
+
+class JobQueue:
+    """Redis-backed job queue with priorities, retries and a dead-letter list
+    
+    Each queue is a set of Redis lists, one per priority. Jobs being worked on
+    are held under a lease so that jobs from a crashed worker are picked up
+    again, failed jobs are retried with exponential backoff, and jobs that
+    exhaust their retries are moved to the dead-letter list.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.prefix = 'carebridge:jobs'
+        self.tasks = {}
+        self._dequeue = None
+        self._promote_delayed = None
+        self._requeue_expired = None
+    
+    def init_app(self, app):
+        self.app = app
+        self.prefix = app.config['JOB_QUEUE_PREFIX']
+    
+    def task(self, name=None, queue='default', priority='normal', max_retries=3):
+        """Register a function as a task; arguments must be JSON serializable"""
+        def decorator(func):
+            self.tasks[name or func.__name__] = TaskSpec(func, queue, priority, max_retries)
+            return func
+        return decorator
+    
+    def enqueue(self, task_name, *args, priority=None, queue=None, delay=None, **kwargs):
+        """Enqueue a task by name and return the job ID"""
+        spec = self.tasks[task_name]
+        priority = priority or spec.priority
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown job priority: {priority}')
+        
+        job = {
+            'id': str(uuid.uuid4()),
+            'task': task_name,
+            'args': list(args),
+            'kwargs': kwargs,
+            'queue': queue or spec.queue,
+            'priority': priority,
+            'attempts': 0,
+            'max_retries': spec.max_retries,
+            'enqueued_at': time.time()
+        }
+        
+        # Run inline when no worker is expected, e.g. in tests
+        if self.app.config['JOB_QUEUE_EAGER']:
+            if delay:
+                self._execute_later(job, delay)
+            else:
+                self.execute(job)
+            return job['id']
+        
+        payload = json.dumps(job)
+        if delay:
+            redis_client.zadd(self._key('delayed'), {payload: time.time() + delay})
+        else:
+            redis_client.lpush(self._queue_key(job['queue'], priority), payload)
+        return job['id']
+    
+    def dequeue(self, queue, timeout=1):
+        """Pop the next job from a queue, highest priority first, and lease it
+        
+        Waits up to timeout seconds for a job, checking the queue every
+        JOB_QUEUE_POLL_SECONDS, and returns None if none came.
+        """
+        if self._dequeue is None:
+            self._dequeue = redis_client.register_script(DEQUEUE_SCRIPT)
+        
+        keys = [self._queue_key(queue, priority) for priority in PRIORITIES]
+        keys += [self._key('processing'), self._key('leases')]
+        deadline = time.monotonic() + timeout
+        while True:
+            payload = self._dequeue(keys=keys, args=[time.time() + self.app.config['JOB_QUEUE_LEASE_SECONDS']])
+            if payload is not None:
+                return json.loads(payload)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(self.app.config['JOB_QUEUE_POLL_SECONDS'], remaining))
+    
+    def execute(self, job):
+        """Run a job's task function"""
+        spec = self.tasks[job['task']]
+        return spec.func(*job['args'], **job['kwargs'])
+    
+    def ack(self, job):
+        """Release the lease of a job that finished successfully"""
+        pipeline = redis_client.pipeline()
+        pipeline.hdel(self._key('processing'), job['id'])
+        pipeline.zrem(self._key('leases'), job['id'])
+        pipeline.execute()
+    
+    def fail(self, job, error):
+        """Schedule a retry with backoff, or dead-letter the job once retries run out"""
+        job['attempts'] += 1
+        job['last_error'] = ''.join(traceback.format_exception_only(type(error), error)).strip()
+        
+        pipeline = redis_client.pipeline()
+        pipeline.hdel(self._key('processing'), job['id'])
+        pipeline.zrem(self._key('leases'), job['id'])
+        
+        if job['attempts'] > job['max_retries']:
+            job['failed_at'] = datetime.utcnow().isoformat()
+            pipeline.lpush(self._key('dead'), json.dumps(job))
+            pipeline.ltrim(self._key('dead'), 0, self.app.config['JOB_QUEUE_DEAD_LETTER_MAX'] - 1)
+        else:
+            delay = self.app.config['JOB_QUEUE_RETRY_BASE_DELAY'] * (2 ** (job['attempts'] - 1))
+            delay *= random.uniform(0.8, 1.2)
+            pipeline.zadd(self._key('delayed'), {json.dumps(job): time.time() + delay})
+        
+        pipeline.execute()
+        return job['attempts'] <= job['max_retries']
+    
+    def promote_delayed(self, limit=100):
+        """Move due delayed and retried jobs back onto their queues"""
+        if self._promote_delayed is None:
+            self._promote_delayed = redis_client.register_script(PROMOTE_DELAYED_SCRIPT)
+        return self._promote_delayed(keys=[self._key('delayed')], args=[time.time(), limit, self.prefix])
+    
+    def requeue_expired(self, limit=100):
+        """Requeue jobs whose worker lease has expired"""
+        if self._requeue_expired is None:
+            self._requeue_expired = redis_client.register_script(REQUEUE_EXPIRED_SCRIPT)
+        return self._requeue_expired(
+            keys=[self._key('leases'), self._key('processing')],
+            args=[time.time(), limit, self.prefix]
+        )
+    
+    def dead_letters(self, limit=100):
+        """Get the most recent dead-lettered jobs"""
+        return [json.loads(payload) for payload in redis_client.lrange(self._key('dead'), 0, limit - 1)]
+    
+    def retry_dead_letters(self):
+        """Requeue every dead-lettered job with a fresh retry budget"""
+        requeued = 0
+        while True:
+            payload = redis_client.rpop(self._key('dead'))
+            if payload is None:
+                return requeued
+            job = json.loads(payload)
+            job['attempts'] = 0
+            redis_client.lpush(self._queue_key(job['queue'], job['priority']), json.dumps(job))
+            requeued += 1
+    
+    def stats(self):
+        """Get queue depths per queue and priority, plus delayed and dead counts"""
+        queues = {}
+        for key in redis_client.scan_iter(match=f'{self.prefix}:queue:*'):
+            _, queue, priority = key.decode().rsplit(':', 2)
+            queues.setdefault(queue, {})[priority] = redis_client.llen(key)
+        return {
+            'queues': queues,
+            'processing': redis_client.hlen(self._key('processing')),
+            'delayed': redis_client.zcard(self._key('delayed')),
+            'dead': redis_client.llen(self._key('dead'))
+        }
+    
+    def _execute_later(self, job, delay):
+        """Run a job inline once its delay has passed, for eager mode"""
+        def run():
+            with self.app.app_context():
+                try:
+                    self.execute(job)
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Delayed job {job['task']} ({job['id']}) failed: {str(e)}")
+                finally:
+                    db.session.remove()
+        
+        timer = threading.Timer(delay, run)
+        timer.daemon = True
+        timer.start()
+    
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+    
+    def _queue_key(self, queue, priority):
+        return f'{self.prefix}:queue:{queue}:{priority}'
+
+job_queue = JobQueue()
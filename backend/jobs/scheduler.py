@@ -0,0 +1,196 @@
+import time
+import traceback
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from extensions import db, socketio
+from models.scheduled_task import ScheduledTask
+
+# Claims a run of a task. Even if leadership changes hands mid-tick, only one
+# process can move next_run_at past a given schedule slot.
+CLAIM_RUN_SQL = text("""
+    UPDATE scheduledtask
+    SET next_run_at = :next_run_at
+    WHERE name = :name AND next_run_at = :scheduled_for
+    RETURNING name
+""")
+
+class PeriodicScheduler:
+    """Runs periodic tasks in exactly one process across all gunicorn workers
+    
+    Every serving process runs a background loop, but only the process holding
+    a Postgres session-level advisory lock acts as leader. Each process tries
+    for the lock on one dedicated connection that it keeps open. If the leader
+    dies its connection closes, the lock is released and another process takes
+    over on its next poll. Tasks run as a greenlet on the hub, like requests,
+    since they share the process's gevent-patched Redis and Socket.IO clients,
+    so they must be short; ones that run long queries enqueue a job for the
+    worker instead. The loop yields between tasks.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.tasks = {}  # name -> (func, interval_seconds)
+        self._started = False
+        self._lock_connection = None
+        self._leader = False
+        self._registered = False
+    
+    def init_app(self, app):
+        self.app = app
+        
+        if not app.config['PERIODIC_TASKS_ENABLED']:
+            return
+        
+        # Start with the first request, so CLI commands and migrations never run schedules
+        @app.before_request
+        def start_periodic_scheduler():
+            if not self._started:
+                self.start()
+    
+    def periodic(self, name, interval_seconds):
+        """Register a function to run every interval_seconds"""
+        def decorator(func):
+            self.tasks[name] = (func, interval_seconds)
+            return func
+        return decorator
+    
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        socketio.start_background_task(self._loop)
+    
+    @property
+    def lock_key(self):
+        return zlib.crc32(self.app.config['PERIODIC_TASK_LOCK_NAME'].encode('utf-8'))
+    
+    def _loop(self):
+        poll_seconds = self.app.config['PERIODIC_TASK_POLL_SECONDS']
+        while True:
+            try:
+                self._tick()
+            except Exception as e:
+                self.app.logger.error(f'Error in periodic scheduler: {str(e)}')
+                self._release_leadership()
+            socketio.sleep(poll_seconds)
+    
+    def _tick(self):
+        with self.app.app_context():
+            if not self._ensure_leadership():
+                return
+            
+            try:
+                if not self._registered:
+                    self._register_tasks()
+                    self._registered = True
+                for name in self.tasks:
+                    self._run_if_due(name)
+                    socketio.sleep(0)
+            finally:
+                db.session.remove()
+    
+    def _ensure_leadership(self):
+        """Take or keep the advisory lock on this process's dedicated connection
+        
+        Followers retry the lock on the same connection every poll rather than
+        opening a new one. The connection is only replaced after an error.
+        """
+        if self._lock_connection is None:
+            self._lock_connection = db.engine.connect()
+        
+        if self._leader:
+            self._lock_connection.execute(text('SELECT 1'))
+        elif self._lock_connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': self.lock_key}).scalar():
+            self._leader = True
+            self._registered = False
+            self.app.logger.info('Became the periodic task leader')
+        self._lock_connection.commit()
+        return self._leader
+    
+    def _release_leadership(self):
+        self._leader = False
+        if self._lock_connection is None:
+            return
+        try:
+            # Invalidating closes the DBAPI connection instead of returning it to the pool still holding the lock
+            self._lock_connection.invalidate()
+            self._lock_connection.close()
+        except Exception:
+            pass
+        self._lock_connection = None
+    
+    def _register_tasks(self):
+        """Make sure every registered task has a schedule row"""
+        now = datetime.utcnow()
+        for name, (_, interval_seconds) in self.tasks.items():
+            db.session.execute(insert(ScheduledTask.__table__).values(
+                id=uuid.uuid4(),
+                name=name,
+                interval_seconds=interval_seconds,
+                next_run_at=now,
+                run_count=0,
+                failure_count=0,
+                created_at=now,
+                updated_at=now
+            ).on_conflict_do_update(
+                index_elements=['name'],
+                set_={'interval_seconds': interval_seconds}
+            ))
+        db.session.commit()
+    
+    def _run_if_due(self, name):
+        func, interval_seconds = self.tasks[name]
+        now = datetime.utcnow()
+        
+        task = ScheduledTask.query.filter_by(name=name).first()
+        if task is None or task.next_run_at > now:
+            db.session.rollback()
+            return
+        
+        # Keep to the original cadence unless the task has fallen a whole interval behind
+        scheduled_for = task.next_run_at
+        next_run_at = scheduled_for + timedelta(seconds=interval_seconds)
+        if next_run_at <= now:
+            next_run_at = now + timedelta(seconds=interval_seconds)
+        
+        claimed = db.session.execute(CLAIM_RUN_SQL, {
+            'name': name,
+            'scheduled_for': scheduled_for,
+            'next_run_at': next_run_at
+        }).first()
+        db.session.commit()
+        if claimed is None:
+            return
+        
+        started_at = datetime.utcnow()
+        started = time.monotonic()
+        error = None
+        try:
+            func()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            self.app.logger.error(f'Periodic task {name} failed: {error}')
+        
+        db.session.execute(
+            ScheduledTask.__table__.update()
+            .where(ScheduledTask.__table__.c.name == name)
+            .values(
+                last_run_at=started_at,
+                last_duration_ms=int((time.monotonic() - started) * 1000),
+                last_lag_ms=max(0, int((started_at - scheduled_for).total_seconds() * 1000)),
+                last_error=error,
+                run_count=ScheduledTask.__table__.c.run_count + 1,
+                failure_count=ScheduledTask.__table__.c.failure_count + (1 if error else 0),
+                updated_at=datetime.utcnow()
+            )
+        )
+        db.session.commit()
+
+scheduler = PeriodicScheduler()
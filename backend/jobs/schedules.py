@@ -0,0 +1,35 @@
+from jobs.queue import job_queue
+from jobs.scheduler import scheduler
+from services.presence_service import presence_service
+from services.slot_hold_service import slot_holds
+
+# Tasks that run long database queries are handed to the job worker, since the
+# scheduler runs on the hub of a serving process and psycopg2 would block it
+
+@scheduler.periodic('send_appointment_reminders', interval_seconds=60)
+def send_appointment_reminders():
+    job_queue.enqueue('send_due_reminders')
+
+@scheduler.periodic('send_notification_digests', interval_seconds=24 * 60 * 60)
+def send_notification_digests():
+    job_queue.enqueue('send_notification_digests')
+
+@scheduler.periodic('purge_expired_data', interval_seconds=60 * 60)
+def purge_expired_data():
+    job_queue.enqueue('purge_expired_data')
+
+@scheduler.periodic('recompute_doctor_ratings', interval_seconds=15 * 60)
+def recompute_doctor_ratings():
+    job_queue.enqueue('recompute_doctor_ratings')
+
+@scheduler.periodic('sweep_expired_presence', interval_seconds=30)
+def sweep_expired_presence():
+    presence_service.sweep()
+
+@scheduler.periodic('persist_call_quality', interval_seconds=60)
+def persist_call_quality():
+    job_queue.enqueue('persist_call_quality')
+
+@scheduler.periodic('sweep_expired_slot_holds', interval_seconds=30)
+def sweep_expired_slot_holds():
+    slot_holds.sweep()
@@ -0,0 +1,118 @@
+import os
+
+from flask import current_app
+
+from extensions import db
+from jobs.queue import job_queue
+from models import Appointment, DoctorProfile, NotificationType, Role
+from models.file import File, FileType
+from services.call_quality_service import call_quality_service
+from services.consultation_service import ConsultationService
+from services.email_service import email_service
+from services.notification_service import NotificationService
+from services.reminder_service import ReminderService
+from services.retention_service import RetentionService
+
+@job_queue.task(queue='notifications', priority='high')
+def send_appointment_notification(appointment_id, notification_type, additional_message=None, recipient_id=None):
+    """Notify the participants of an appointment"""
+    appointment = Appointment.query.get(appointment_id)
+    if not appointment:
+        return
+    NotificationService.send_appointment_notification(
+        appointment=appointment,
+        notification_type=NotificationType(notification_type),
+        additional_message=additional_message,
+        recipient_id=recipient_id
+    )
+
+@job_queue.task(queue='notifications', priority='low')
+def send_notification_to_role(role, notification_type, title, message, resource_type=None, resource_id=None):
+    """Fan a notification out to every user with a role"""
+    NotificationService.send_notification_to_role(
+        role=Role(role),
+        type=NotificationType(notification_type),
+        title=title,
+        message=message,
+        resource_type=resource_type,
+        resource_id=resource_id
+    )
+
+@job_queue.task(queue='notifications', priority='low')
+def send_notification_to_all(notification_type, title, message, resource_type=None, resource_id=None):
+    """Fan a notification out to every user"""
+    NotificationService.send_notification_to_all(
+        type=NotificationType(notification_type),
+        title=title,
+        message=message,
+        resource_type=resource_type,
+        resource_id=resource_id
+    )
+
+@job_queue.task(queue='notifications')
+def announce_consultation_leave(appointment_id, user_id, left_at):
+    """Tell the chat a participant left, unless they reconnected in the meantime"""
+    ConsultationService.announce_leave(appointment_id, user_id, left_at)
+
+@job_queue.task(queue='email', max_retries=5)
+def send_email(to, subject, template, context):
+    """Deliver a templated email over a pooled SMTP connection"""
+    email_service.deliver(to, subject, template, **context)
+
+@job_queue.task(queue='files', priority='low')
+def process_uploaded_file(file_id):
+    """Sniff the real MIME type of an upload and build a thumbnail for images"""
+    import magic
+    from PIL import Image
+    
+    file_record = File.query.get(file_id)
+    if not file_record:
+        return
+    
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], file_record.file_path)
+    file_record.mime_type = magic.from_file(path, mime=True)
+    
+    if file_record.mime_type.startswith('image/'):
+        file_record.file_type = FileType.IMAGE
+        thumbnails_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'thumbnails')
+        os.makedirs(thumbnails_dir, exist_ok=True)
+        with Image.open(path) as image:
+            image.thumbnail(current_app.config['THUMBNAIL_SIZE'])
+            image.save(os.path.join(thumbnails_dir, file_record.filename))
+    
+    db.session.commit()
+
+# Periodic maintenance enqueued by jobs/schedules.py. These aren't retried, since the next run picks up what is left.
+
+@job_queue.task(queue='default', max_retries=0)
+def send_due_reminders():
+    """Send the appointment reminders that are due"""
+    sent = ReminderService.send_due_reminders()
+    if sent:
+        current_app.logger.info(f'Sent {sent} appointment reminders')
+
+@job_queue.task(queue='default', max_retries=0)
+def send_notification_digests():
+    """Email every user their pending notification digest"""
+    sent = NotificationService.send_digests()
+    if sent:
+        current_app.logger.info(f'Queued {sent} notification digests')
+
+@job_queue.task(queue='default', priority='low', max_retries=0)
+def purge_expired_data():
+    """Delete chat messages and files past their retention"""
+    messages_deleted, files_deleted = RetentionService.purge_expired()
+    current_app.logger.info(f'Purged {messages_deleted} messages and {files_deleted} files past retention')
+
+@job_queue.task(queue='default', priority='low', max_retries=0)
+def recompute_doctor_ratings():
+    """Recompute every doctor's average rating"""
+    DoctorProfile.recompute_all_ratings()
+    db.session.commit()
+
+@job_queue.task(queue='default', max_retries=0)
+def persist_call_quality():
+    """Persist the quality summaries of participants whose calls went idle"""
+    flushed = call_quality_service.flush_idle()
+    if flushed:
+        current_app.logger.info(f'Persisted call quality summaries of {flushed} participants')
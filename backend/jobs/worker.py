@@ -0,0 +1,107 @@
+import signal
+import threading
+import time
+
+from extensions import db
+from jobs.queue import job_queue
+
+class Worker:
+    """Runs jobs from one or more queues, with a concurrency limit per queue
+    
+    Every queue gets its own fetch loop and a fixed number of slots, so a
+    backlog of slow jobs (e.g. image processing) cannot starve other queues.
+    """
+    
+    def __init__(self, app, queues):
+        self.app = app
+        self.queues = queues
+        self.concurrency = {
+            queue: app.config['JOB_QUEUE_CONCURRENCY'].get(queue, app.config['JOB_QUEUE_DEFAULT_CONCURRENCY'])
+            for queue in queues
+        }
+        self._stopping = threading.Event()
+        self._threads = []
+    
+    def run(self):
+        """Process jobs until SIGINT or SIGTERM"""
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        
+        for queue in self.queues:
+            self._start(self._fetch_loop, queue, name=f'jobs-fetch-{queue}')
+        self._start(self._maintenance_loop, name='jobs-maintenance')
+        
+        self.app.logger.info(f'Job worker started for queues: {self.concurrency}')
+        while not self._stopping.is_set():
+            self._stopping.wait(1)
+        
+        # Let running jobs finish before exiting
+        for thread in self._threads:
+            thread.join()
+        self.app.logger.info('Job worker stopped')
+    
+    def _start(self, target, *args, name=None):
+        thread = threading.Thread(target=target, args=args, name=name)
+        thread.start()
+        self._threads.append(thread)
+    
+    def _handle_signal(self, signum, frame):
+        self._stopping.set()
+    
+    def _fetch_loop(self, queue):
+        slots = threading.BoundedSemaphore(self.concurrency[queue])
+        running = []
+        
+        while not self._stopping.is_set():
+            # Only take a job once a slot is free, so queued work stays visible to other workers
+            if not slots.acquire(timeout=1):
+                continue
+            try:
+                job = job_queue.dequeue(queue, timeout=1)
+            except Exception as e:
+                self.app.logger.error(f'Error fetching jobs from {queue}: {str(e)}')
+                slots.release()
+                time.sleep(1)
+                continue
+            
+            if job is None:
+                slots.release()
+                continue
+            
+            thread = threading.Thread(target=self._run_job, args=(job, slots), name=f"job-{job['id']}")
+            thread.start()
+            running = [t for t in running if t.is_alive()]
+            running.append(thread)
+        
+        for thread in running:
+            thread.join()
+    
+    def _run_job(self, job, slots):
+        started_at = time.monotonic()
+        try:
+            with self.app.app_context():
+                try:
+                    job_queue.execute(job)
+                except Exception as e:
+                    db.session.rollback()
+                    will_retry = job_queue.fail(job, e)
+                    self.app.logger.error(
+                        f"Job {job['task']} ({job['id']}) failed on attempt {job['attempts']}: {str(e)}"
+                        + ('' if will_retry else ', moved to dead letters')
+                    )
+                else:
+                    job_queue.ack(job)
+                    self.app.logger.info(f"Job {job['task']} ({job['id']}) done in {time.monotonic() - started_at:.2f}s")
+                finally:
+                    db.session.remove()
+        finally:
+            slots.release()
+    
+    def _maintenance_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job_queue.promote_delayed()
+                job_queue.requeue_expired()
+            except Exception as e:
+                self.app.logger.error(f'Error in job queue maintenance: {str(e)}')
+            self._stopping.wait(1)
@@ -2,11 +2,17 @@ from models.user import User, Role
 from models.doctor_profile import DoctorProfile
 from models.clinic import Clinic, ClinicDoctor
 from models.time_slot import TimeSlot
+from models.availability_exception import AvailabilityException, AvailabilityExceptionType
 from models.appointment import Appointment, AppointmentStatus
 from models.message import Message
+from models.message_read_state import MessageReadState
+from models.consultation_session import ConsultationSession
+from models.call_quality_summary import CallQualitySummary
 from models.prescription import Prescription
 from models.review import Review
 from models.file import File
 from models.audit_log import AuditLog, AuditAction
 from models.admin_settings import AdminSettings
-from models.notification import Notification, NotificationType, NotificationStatus
\ No newline at end of file
+from models.notification import Notification, NotificationType, NotificationStatus
+from models.notification_preference import NotificationPreference, DeliveryMode
+from models.scheduled_task import ScheduledTask
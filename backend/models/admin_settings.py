@@ -42,8 +42,21 @@ class AdminSettings(Base):
     
     def update(self, **kwargs):
         """Update settings with the provided values"""
+        reminder_hours_changed = 'reminder_hours_before' in kwargs and kwargs['reminder_hours_before'] != self.reminder_hours_before
+        templates_changed = any(key.startswith('email_template_') for key in kwargs)
         for key, value in kwargs.items():
             if hasattr(self, key):
                 setattr(self, key, value)
         db.session.commit()
+        
+        # Move pending reminders to the new offset
+        if reminder_hours_changed:
+            from models.appointment import Appointment
+            Appointment.reschedule_reminders(self.reminder_hours_before)
+        
+        # Render the new templates right away here; other processes pick them up within EMAIL_TEMPLATE_OVERRIDE_TTL
+        if templates_changed:
+            from services.email_service import email_service
+            if email_service.templates:
+                email_service.templates.invalidate_overrides()
         return self
\ No newline at end of file
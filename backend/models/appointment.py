@@ -1,7 +1,67 @@
 import enum
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, TSRANGE
+
+from config import Config
 from extensions import db
 from models.base import Base
 
+# Postgres channel that appointment inserts and status changes are announced on
+APPOINTMENT_CHANGES_CHANNEL = 'appointment_changes'
+
+# Notifies listeners of new appointments and status changes with a compact
+# JSON payload. Postgres delivers it when the writing transaction commits, so
+# changes made by any process or job reach the listener, and rolled back ones
+# never do.
+APPOINTMENT_NOTIFY_DDL = f"""
+CREATE OR REPLACE FUNCTION notify_appointment_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{APPOINTMENT_CHANGES_CHANNEL}', json_build_object(
+        'op', lower(TG_OP),
+        'id', NEW.id,
+        'doctor_id', NEW.doctor_id,
+        'patient_id', NEW.patient_id,
+        'time_slot_id', NEW.time_slot_id,
+        'status', NEW.status,
+        'previous_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS appointment_notify_insert ON appointment;
+CREATE TRIGGER appointment_notify_insert AFTER INSERT ON appointment
+    FOR EACH ROW EXECUTE FUNCTION notify_appointment_change();
+
+DROP TRIGGER IF EXISTS appointment_notify_status ON appointment;
+CREATE TRIGGER appointment_notify_status AFTER UPDATE OF status ON appointment
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status) EXECUTE FUNCTION notify_appointment_change();
+"""
+
+# Keeps booked_period in step with the appointment's time slot: the slot's
+# time plus the admin buffer, falling back to BUFFER_TIME_MINUTES before the
+# settings row exists. The exclusion constraints on booked_period then reject
+# overlapping bookings inside the index, whichever process inserts them.
+APPOINTMENT_PERIOD_DDL = f"""
+CREATE OR REPLACE FUNCTION set_appointment_booked_period() RETURNS trigger AS $$
+BEGIN
+    SELECT tsrange(timeslot.start_time, timeslot.end_time + make_interval(mins => COALESCE(
+        (SELECT buffer_time_minutes FROM adminsettings LIMIT 1), {Config.BUFFER_TIME_MINUTES}
+    )))
+    INTO NEW.booked_period
+    FROM timeslot
+    WHERE timeslot.id = NEW.time_slot_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS appointment_booked_period ON appointment;
+CREATE TRIGGER appointment_booked_period BEFORE INSERT OR UPDATE OF time_slot_id ON appointment
+    FOR EACH ROW EXECUTE FUNCTION set_appointment_booked_period();
+"""
+
+# Appointments in these statuses hold their time; must match the exclusion constraints' WHERE
+ACTIVE_APPOINTMENT_STATUSES_SQL = "status IN ('PENDING', 'CONFIRMED')"
+
 class AppointmentStatus(enum.Enum):
     PENDING = 'pending'
     CONFIRMED = 'confirmed'
@@ -11,9 +71,25 @@ class AppointmentStatus(enum.Enum):
 
 class Appointment(Base):
     """Appointment model for consultations between doctors and patients"""
+    __table_args__ = (
+        # Only appointments still waiting for a reminder stay in this index
+        db.Index('ix_appointment_reminder_due', 'reminder_due_at', postgresql_where=db.text('reminder_sent_at IS NULL')),
+        # A slot has one appointment at a time; cancelling gives it back to be booked again
+        db.Index('uq_appointment_time_slot', 'time_slot_id', unique=True, postgresql_where=db.text("status <> 'CANCELLED'")),
+        # Neither a doctor nor a patient can hold two active bookings closer than the buffer time
+        ExcludeConstraint(
+            ('doctor_id', '='), ('booked_period', '&&'),
+            name='excl_appointment_doctor_period', using='gist', where=db.text(ACTIVE_APPOINTMENT_STATUSES_SQL)
+        ),
+        ExcludeConstraint(
+            ('patient_id', '='), ('booked_period', '&&'),
+            name='excl_appointment_patient_period', using='gist', where=db.text(ACTIVE_APPOINTMENT_STATUSES_SQL)
+        ),
+    )
+    
     patient_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
     doctor_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
-    time_slot_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('timeslot.id'), nullable=False, unique=True)
+    time_slot_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('timeslot.id'), nullable=False)
     status = db.Column(db.Enum(AppointmentStatus), default=AppointmentStatus.PENDING, nullable=False)
     reason = db.Column(db.Text, nullable=True)
     symptoms = db.Column(db.Text, nullable=True)
@@ -24,13 +100,20 @@ class Appointment(Base):
     cancellation_reason = db.Column(db.Text, nullable=True)
     cancelled_by = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=True)
     room_id = db.Column(db.String(100), nullable=True)  # For WebRTC room
+    reminder_due_at = db.Column(db.DateTime, nullable=True)  # When the reminder should go out
+    reminder_sent_at = db.Column(db.DateTime, nullable=True)
+    last_message_seq = db.Column(db.Integer, default=0, nullable=False)  # Sequence number of the latest chat message
+    booked_period = db.Column(TSRANGE, nullable=True)  # Slot time plus buffer, set by the appointment_booked_period trigger
     
     # Relationships
     patient = db.relationship('User', foreign_keys=[patient_id], back_populates='appointments_as_patient')
     doctor = db.relationship('User', foreign_keys=[doctor_id], back_populates='appointments_as_doctor')
     canceller = db.relationship('User', foreign_keys=[cancelled_by])
-    time_slot = db.relationship('TimeSlot', back_populates='appointment')
+    time_slot = db.relationship('TimeSlot', back_populates='appointments')
     messages = db.relationship('Message', back_populates='appointment', cascade='all, delete-orphan')
+    read_states = db.relationship('MessageReadState', cascade='all, delete-orphan')
+    consultation_sessions = db.relationship('ConsultationSession', cascade='all, delete-orphan')
+    call_quality_summaries = db.relationship('CallQualitySummary', cascade='all, delete-orphan')
     prescription = db.relationship('Prescription', back_populates='appointment', uselist=False, cascade='all, delete-orphan')
     review = db.relationship('Review', back_populates='appointment', uselist=False, cascade='all, delete-orphan')
     files = db.relationship('File', back_populates='appointment', cascade='all, delete-orphan')
@@ -56,12 +139,45 @@ class Appointment(Base):
         self.cancellation_reason = reason
         self.cancelled_by = user_id
         
+        # Drop the appointment out of the reminder queue
+        self.reminder_due_at = None
+        
         # Make the time slot available again
         if self.time_slot:
             self.time_slot.is_available = True
         
         db.session.commit()
     
+    @classmethod
+    def reschedule_reminders(cls, hours_before):
+        """Recompute the due time of every reminder not yet sent"""
+        db.session.execute(db.text("""
+            UPDATE appointment
+            SET reminder_due_at = timeslot.start_time - make_interval(hours => :hours_before)
+            FROM timeslot
+            WHERE appointment.time_slot_id = timeslot.id
+              AND appointment.reminder_sent_at IS NULL
+              AND appointment.status IN ('PENDING', 'CONFIRMED')
+              AND timeslot.start_time > now() at time zone 'utc'
+        """), {'hours_before': hours_before})
+        db.session.commit()
+    
+    @classmethod
+    def backfill_reminders(cls, hours_before):
+        """Give upcoming appointments booked before reminder_due_at existed a due time; returns how many"""
+        result = db.session.execute(db.text("""
+            UPDATE appointment
+            SET reminder_due_at = timeslot.start_time - make_interval(hours => :hours_before)
+            FROM timeslot
+            WHERE appointment.time_slot_id = timeslot.id
+              AND appointment.reminder_due_at IS NULL
+              AND appointment.reminder_sent_at IS NULL
+              AND appointment.status IN ('PENDING', 'CONFIRMED')
+              AND timeslot.start_time > now() at time zone 'utc'
+        """), {'hours_before': hours_before})
+        db.session.commit()
+        return result.rowcount
+    
     def complete(self):
         """Mark the appointment as completed"""
         self.status = AppointmentStatus.COMPLETED
@@ -79,6 +195,7 @@ class Appointment(Base):
     
     def to_dict(self):
         data = super().to_dict()
+        data.pop('booked_period', None)  # Only there for the exclusion constraints
         # Add related data
         if self.patient:
             data['patient'] = {
@@ -103,4 +220,10 @@ class Appointment(Base):
                 'end_time': self.time_slot.end_time.isoformat(),
                 'duration_minutes': self.time_slot.duration_minutes
             }
-        return data
\ No newline at end of file
+        return data
+
+# Install the notify triggers along with the table; `flask install-appointment-triggers` adds them to existing databases
+db.event.listen(Appointment.__table__, 'after_create', db.DDL(APPOINTMENT_NOTIFY_DDL))
+
+# Likewise for the booked period trigger; `flask install-booking-constraints` adds it and the constraints
+db.event.listen(Appointment.__table__, 'after_create', db.DDL(APPOINTMENT_PERIOD_DDL))
@@ -0,0 +1,36 @@
+import enum
+from extensions import db
+from models.base import Base
+
+class AvailabilityExceptionType(enum.Enum):
+    TIME_OFF = 'time_off'  # Blocks time the recurring schedule would offer
+    EXTRA_HOURS = 'extra_hours'  # Offers time outside the recurring schedule
+
+class AvailabilityException(Base):
+    """A one-off change to a doctor's recurring availability"""
+    __table_args__ = (
+        db.Index('ix_availabilityexception_doctor_range', 'doctor_id', 'start_time', 'end_time'),
+    )
+    
+    doctor_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('doctorprofile.id'), nullable=False)
+    type = db.Column(db.Enum(AvailabilityExceptionType), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    reason = db.Column(db.String(255), nullable=True)
+    
+    # Relationships
+    doctor = db.relationship('DoctorProfile', backref=db.backref('availability_exceptions', lazy='dynamic', cascade='all, delete-orphan'))
+    
+    @classmethod
+    def overlapping(cls, doctor_id, start_time, end_time):
+        """Get a doctor's exceptions that overlap the given period"""
+        return cls.query.filter(
+            cls.doctor_id == doctor_id,
+            cls.start_time < end_time,
+            cls.end_time > start_time
+        ).order_by(cls.start_time).all()
+    
+    def to_dict(self):
+        data = super().to_dict()
+        data['type'] = self.type.value
+        return data
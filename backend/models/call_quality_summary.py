@@ -0,0 +1,78 @@
+from extensions import db
+from models.base import Base
+
+# Metrics averaged per minute; packet loss is summed from packet counters instead
+AVERAGED_METRICS = ('rtt_ms', 'jitter_ms', 'bitrate_kbps')
+
+def merge_minutes(existing, incoming):
+    """Combine two lists of per-minute aggregates, adding up minutes present in both"""
+    minutes = {minute['minute']: minute for minute in existing}
+    for minute in incoming:
+        current = minutes.get(minute['minute'])
+        if current is None:
+            minutes[minute['minute']] = minute
+            continue
+        
+        current['samples'] += minute['samples']
+        current['packets_lost'] += minute['packets_lost']
+        current['packets_received'] += minute['packets_received']
+        for metric in AVERAGED_METRICS:
+            count, total, peak = current[metric]
+            other_count, other_total, other_peak = minute[metric]
+            current[metric] = [count + other_count, total + other_total, max(peak, other_peak)]
+    return sorted(minutes.values(), key=lambda minute: minute['minute'])
+
+def render_minute(minute):
+    """Turn a minute's raw counters into averages, maxima and a loss percentage"""
+    rendered = {'minute': minute['minute'], 'samples': minute['samples']}
+    for metric in AVERAGED_METRICS:
+        count, total, peak = minute[metric]
+        rendered[f'{metric}_avg'] = round(total / count, 2) if count else None
+        rendered[f'{metric}_max'] = peak if count else None
+    packets = minute['packets_lost'] + minute['packets_received']
+    rendered['packet_loss_pct'] = round(minute['packets_lost'] / packets * 100, 2) if packets else None
+    return rendered
+
+class CallQualitySummary(Base):
+    """Per-minute call quality of one participant in an appointment's call
+    
+    Raw WebRTC stats samples never reach the database. They are aggregated
+    in Redis while the call runs and merged in here once it goes quiet, as
+    one JSON list of per-minute counters per participant.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'user_id', name='uq_callqualitysummary_appointment_user'),
+    )
+    
+    appointment_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('appointment.id'), nullable=False)
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
+    minutes = db.Column(db.JSON, default=list, nullable=False)  # [{minute, samples, rtt_ms: [n, sum, max], ...}]
+    
+    @classmethod
+    def merge(cls, appointment_id, user_id, minutes):
+        """Add per-minute aggregates to a participant's summary, creating it if needed"""
+        summary = cls.query.filter_by(appointment_id=appointment_id, user_id=user_id).with_for_update().first()
+        if summary is None:
+            summary = cls(appointment_id=appointment_id, user_id=user_id, minutes=[])
+            db.session.add(summary)
+        summary.minutes = merge_minutes([dict(minute) for minute in summary.minutes], minutes)
+        return summary
+    
+    def overall(self):
+        """Aggregate the whole call into one rendered minute"""
+        if not self.minutes:
+            return None
+        # Folding every minute onto the same key adds them all up
+        total, = merge_minutes([], [dict(minute, minute=0) for minute in self.minutes])
+        rendered = render_minute(total)
+        del rendered['minute']
+        return rendered
+    
+    def to_dict(self):
+        return {
+            'appointment_id': str(self.appointment_id),
+            'user_id': str(self.user_id),
+            'overall': self.overall(),
+            'minutes': [render_minute(minute) for minute in self.minutes],
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
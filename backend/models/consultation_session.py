@@ -0,0 +1,114 @@
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import insert
+
+from extensions import db
+from models.base import Base
+
+class ConsultationSession(Base):
+    """When one participant was in an appointment's consultation
+    
+    Attendance is kept as a compact list of [joined_at, left_at] epoch-second
+    pairs, with left_at None while the participant is still in the call. A
+    rejoin shortly after leaving reopens the last interval instead of adding
+    a new one, so a flapping connection doesn't grow the row or the chat.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'user_id', name='uq_consultationsession_appointment_user'),
+    )
+    
+    appointment_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('appointment.id'), nullable=False)
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
+    intervals = db.Column(db.JSON, default=list, nullable=False)
+    announced = db.Column(db.Boolean, default=False, nullable=False)  # Whether the chat currently shows them as in the call
+    
+    @property
+    def present(self):
+        return bool(self.intervals) and self.intervals[-1][1] is None
+    
+    @property
+    def last_left_at(self):
+        return self.intervals[-1][1] if self.intervals else None
+    
+    def duration_seconds(self, now=None):
+        now = int(now or time.time())
+        return sum((left_at or now) - joined_at for joined_at, left_at in self.intervals)
+    
+    @classmethod
+    def _locked(cls, appointment_id, user_id):
+        """Get the participant's session locked for update, creating it if needed
+        
+        The row is inserted with ON CONFLICT DO NOTHING before it is locked, so
+        two first joins racing each other both end up locking the same row
+        instead of one of them failing on the unique constraint.
+        """
+        now = datetime.utcnow()
+        db.session.execute(insert(cls.__table__).values(
+            id=uuid.uuid4(),
+            appointment_id=appointment_id,
+            user_id=user_id,
+            intervals=[],
+            announced=False,
+            created_at=now,
+            updated_at=now
+        ).on_conflict_do_nothing(constraint='uq_consultationsession_appointment_user'))
+        return cls.query.filter_by(appointment_id=appointment_id, user_id=user_id)\
+            .with_for_update().populate_existing().one()
+    
+    @classmethod
+    def record_join(cls, appointment_id, user_id, reconnect_grace_seconds, now=None):
+        """Open an attendance interval; returns the session and whether the join should be announced"""
+        now = int(now or time.time())
+        session = cls._locked(appointment_id, user_id)
+        if session.present:
+            return session, False
+        
+        intervals = [list(interval) for interval in session.intervals]
+        if intervals and now - intervals[-1][1] <= reconnect_grace_seconds:
+            intervals[-1][1] = None  # A quick reconnect continues the previous interval
+        else:
+            intervals.append([now, None])
+        session.intervals = intervals
+        
+        announce = not session.announced
+        session.announced = True
+        return session, announce
+    
+    @classmethod
+    def record_leave(cls, appointment_id, user_id, now=None):
+        """Close the open attendance interval; returns the session, or None if the user wasn't in the call"""
+        now = int(now or time.time())
+        session = cls.query.filter_by(appointment_id=appointment_id, user_id=user_id).with_for_update().first()
+        if session is None or not session.present:
+            return None
+        
+        intervals = [list(interval) for interval in session.intervals]
+        intervals[-1][1] = max(now, intervals[-1][0])
+        session.intervals = intervals
+        return session
+    
+    @classmethod
+    def summary(cls, appointment_id, now=None):
+        """Get each participant's attendance and how long they were in the call together"""
+        now = int(now or time.time())
+        sessions = cls.query.filter_by(appointment_id=appointment_id).all()
+        
+        together = 0
+        if len(sessions) == 2:
+            first, second = ([(joined_at, left_at or now) for joined_at, left_at in s.intervals] for s in sessions)
+            for start_a, end_a in first:
+                for start_b, end_b in second:
+                    together += max(0, min(end_a, end_b) - max(start_a, start_b))
+        
+        return {
+            'appointment_id': str(appointment_id),
+            'call_duration_seconds': together,
+            'participants': [{
+                'user_id': str(session.user_id),
+                'present': session.present,
+                'intervals': session.intervals,
+                'duration_seconds': session.duration_seconds(now)
+            } for session in sessions]
+        }
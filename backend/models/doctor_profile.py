@@ -45,6 +45,25 @@ class DoctorProfile(Base):
             self.total_reviews = 0
         db.session.commit()
     
+    @classmethod
+    def recompute_all_ratings(cls):
+        """Recompute every doctor's rating from reviews in a single statement"""
+        db.session.execute(db.text("""
+            UPDATE doctorprofile
+            SET average_rating = COALESCE(stats.average_rating, 0),
+                total_reviews = COALESCE(stats.total_reviews, 0)
+            FROM doctorprofile AS profile
+            LEFT JOIN (
+                SELECT doctor_id, AVG(rating) AS average_rating, COUNT(*) AS total_reviews
+                FROM review
+                GROUP BY doctor_id
+            ) AS stats ON stats.doctor_id = profile.user_id
+            WHERE doctorprofile.id = profile.id
+              AND (doctorprofile.average_rating IS DISTINCT FROM COALESCE(stats.average_rating, 0)
+                   OR doctorprofile.total_reviews IS DISTINCT FROM COALESCE(stats.total_reviews, 0))
+        """))
+        db.session.commit()
+    
     def to_dict(self):
         data = super().to_dict()
         # Add related data
@@ -11,6 +11,10 @@ class FileType(enum.Enum):
 
 class File(Base):
     """File model for handling file uploads"""
+    __table_args__ = (
+        db.Index('ix_file_created_at', 'created_at'),  # For the retention purge
+    )
+    
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(255), nullable=False)  # Path to the file in storage
@@ -1,7 +1,18 @@
 import enum
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
 from extensions import db
 from models.base import Base
 
+# Hands out the next sequence number of an appointment's chat. The row lock is
+# held until commit, so messages of one appointment commit in sequence order.
+NEXT_MESSAGE_SEQ_SQL = text("""
+    UPDATE appointment
+    SET last_message_seq = last_message_seq + 1
+    WHERE id = :appointment_id
+    RETURNING last_message_seq
+""")
+
 class MessageType(enum.Enum):
     TEXT = 'text'
     FILE = 'file'
@@ -9,25 +20,33 @@ class MessageType(enum.Enum):
 
 class Message(Base):
     """Message model for chat functionality during consultations"""
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'seq', name='uq_message_appointment_seq'),
+        db.Index('ix_message_created_at', 'created_at'),  # For the retention purge
+        db.Index('ix_message_file_id', 'file_id', postgresql_where=db.text('file_id IS NOT NULL')),
+    )
+    
     appointment_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('appointment.id'), nullable=False)
     sender_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
     message_type = db.Column(db.Enum(MessageType), default=MessageType.TEXT, nullable=False)
     content = db.Column(db.Text, nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # Increases by one per message within an appointment
     file_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('file.id'), nullable=True)
-    is_read = db.Column(db.Boolean, default=False, nullable=False)
-    read_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
     appointment = db.relationship('Appointment', back_populates='messages')
     sender = db.relationship('User', back_populates='messages_sent')
     file = db.relationship('File')
     
-    def mark_as_read(self):
-        """Mark the message as read"""
-        from datetime import datetime
-        self.is_read = True
-        self.read_at = datetime.utcnow()
-        db.session.commit()
+    @classmethod
+    def since(cls, appointment_id, seq, limit):
+        """Get up to limit messages of an appointment after a sequence number, and whether more follow"""
+        messages = cls.query.options(joinedload(cls.sender), joinedload(cls.file))\
+                            .filter(cls.appointment_id == appointment_id, cls.seq > seq)\
+                            .order_by(cls.seq)\
+                            .limit(limit + 1)\
+                            .all()
+        return messages[:limit], len(messages) > limit
     
     def to_dict(self):
         data = super().to_dict()
@@ -48,4 +67,9 @@ class Message(Base):
                 'file_size': self.file.file_size,
                 'file_path': self.file.file_path
             }
-        return data
\ No newline at end of file
+        return data
+
+@db.event.listens_for(Message, 'before_insert')
+def assign_message_seq(mapper, connection, target):
+    if target.seq is None:
+        target.seq = connection.execute(NEXT_MESSAGE_SEQ_SQL, {'appointment_id': target.appointment_id}).scalar()
@@ -0,0 +1,83 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from extensions import db
+from models.base import Base
+
+# Unread messages of one participant: messages from others past their read watermark
+UNREAD_COUNTS_SQL = text("""
+    SELECT m.appointment_id, count(*) AS unread
+    FROM message m
+    LEFT JOIN messagereadstate r ON r.appointment_id = m.appointment_id AND r.user_id = :user_id
+    WHERE m.appointment_id = ANY(CAST(:appointment_ids AS uuid[]))
+      AND m.sender_id <> :user_id
+      AND m.seq > COALESCE(r.last_read_seq, 0)
+    GROUP BY m.appointment_id
+""")
+
+class MessageReadState(Base):
+    """How far a participant has read an appointment's chat
+    
+    One row per participant per appointment holds the highest message seq
+    they have read, instead of a read flag on every message.
+    """
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'user_id', name='uq_messagereadstate_appointment_user'),
+    )
+    
+    appointment_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('appointment.id'), nullable=False)
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
+    last_read_seq = db.Column(db.Integer, default=0, nullable=False)
+    read_at = db.Column(db.DateTime, nullable=True)
+    
+    @classmethod
+    def advance(cls, appointment_id, user_id, seq):
+        """Move a participant's watermark up to seq with one UPSERT
+        
+        Returns the new watermark, or None if it was already at or past seq.
+        """
+        now = datetime.utcnow()
+        table = cls.__table__
+        statement = insert(table).values(
+            id=uuid.uuid4(),
+            appointment_id=appointment_id,
+            user_id=user_id,
+            last_read_seq=seq,
+            read_at=now,
+            created_at=now,
+            updated_at=now
+        )
+        statement = statement.on_conflict_do_update(
+            constraint='uq_messagereadstate_appointment_user',
+            set_={
+                'last_read_seq': statement.excluded.last_read_seq,
+                'read_at': statement.excluded.read_at,
+                'updated_at': statement.excluded.updated_at
+            },
+            where=table.c.last_read_seq < statement.excluded.last_read_seq
+        ).returning(table.c.last_read_seq)
+        return db.session.execute(statement).scalar()
+    
+    @classmethod
+    def get_for_appointment(cls, appointment_id):
+        """Get every participant's watermark as {user_id: last_read_seq}"""
+        rows = db.session.query(cls.user_id, cls.last_read_seq).filter(cls.appointment_id == appointment_id).all()
+        return {str(user_id): last_read_seq for user_id, last_read_seq in rows}
+    
+    @classmethod
+    def unread_counts(cls, user_id, appointment_ids):
+        """Get a participant's unread message count for each appointment in one query"""
+        counts = {str(appointment_id): 0 for appointment_id in appointment_ids}
+        if not counts:
+            return counts
+        
+        rows = db.session.execute(UNREAD_COUNTS_SQL, {
+            'user_id': str(user_id),
+            'appointment_ids': list(counts.keys())
+        })
+        for appointment_id, unread in rows:
+            counts[str(appointment_id)] = unread
+        return counts
@@ -21,6 +21,11 @@ class NotificationStatus(enum.Enum):
 
 class Notification(Base):
     """Notification model for user notifications"""
+    __table_args__ = (
+        # Only notifications still waiting for the email digest are indexed
+        db.Index('ix_notification_digest_pending', 'user_id', postgresql_where=db.text('digest_pending')),
+    )
+    
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False)
     type = db.Column(db.Enum(NotificationType), nullable=False)
     title = db.Column(db.String(255), nullable=False)
@@ -29,6 +34,7 @@ class Notification(Base):
     read_at = db.Column(db.DateTime, nullable=True)
     resource_type = db.Column(db.String(100), nullable=True)  # E.g., 'appointment', 'message', 'prescription'
     resource_id = db.Column(db.String(100), nullable=True)  # ID of the related resource
+    digest_pending = db.Column(db.Boolean, default=False, nullable=False)  # Not in an email digest yet
     
     # Relationships
     user = db.relationship('User', backref=db.backref('notifications', lazy='dynamic'))
@@ -41,8 +47,11 @@ class Notification(Base):
         db.session.commit()
     
     @classmethod
-    def create(cls, user_id, type, title, message, resource_type=None, resource_id=None):
-        """Create and save a notification"""
+    def create(cls, user_id, type, title, message, resource_type=None, resource_id=None, digest_pending=False, commit=True):
+        """Create and save a notification
+        
+        With commit=False the row is only flushed, so batch senders can commit once.
+        """
         notification = cls(
             user_id=user_id,
             type=type,
@@ -50,10 +59,14 @@ class Notification(Base):
             message=message,
             resource_type=resource_type,
             resource_id=resource_id,
-            status=NotificationStatus.UNREAD
+            status=NotificationStatus.UNREAD,
+            digest_pending=digest_pending
         )
         db.session.add(notification)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
         return notification
     
     def to_dict(self):
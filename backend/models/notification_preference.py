@@ -0,0 +1,54 @@
+import enum
+from extensions import db
+from models.base import Base
+from models.notification import NotificationType
+
+class DeliveryMode(enum.Enum):
+    PERSIST = 'persist'  # Store in the inbox and push over Socket.IO
+    PUSH_ONLY = 'push_only'  # Push over Socket.IO without storing
+    EMAIL_DIGEST = 'email_digest'  # Store for the digest without pushing
+    MUTE = 'mute'  # Drop entirely
+
+class NotificationPreference(Base):
+    """Per-user delivery preference for a notification type"""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'type', name='uq_notificationpreference_user_type'),
+    )
+    
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('user.id'), nullable=False, index=True)
+    type = db.Column(db.Enum(NotificationType), nullable=False)
+    delivery = db.Column(db.Enum(DeliveryMode), default=DeliveryMode.PERSIST, nullable=False)
+    
+    # Relationships
+    user = db.relationship('User', backref=db.backref('notification_preferences', lazy='dynamic', cascade='all, delete-orphan'))
+    
+    @classmethod
+    def get_for_users(cls, user_ids):
+        """Get preferences for several users as {user_id: {type: delivery}} in one query"""
+        preferences = {str(user_id): {} for user_id in user_ids}
+        if not preferences:
+            return preferences
+        
+        rows = db.session.query(cls.user_id, cls.type, cls.delivery)\
+                         .filter(cls.user_id.in_(list(preferences.keys())))\
+                         .all()
+        for user_id, type, delivery in rows:
+            preferences[str(user_id)][type] = delivery
+        return preferences
+    
+    @classmethod
+    def set_for_user(cls, user_id, updates):
+        """Upsert the given {type: delivery} preferences for a user"""
+        existing = {pref.type: pref for pref in cls.query.filter_by(user_id=user_id).all()}
+        for type, delivery in updates.items():
+            if type in existing:
+                existing[type].delivery = delivery
+            else:
+                db.session.add(cls(user_id=user_id, type=type, delivery=delivery))
+        db.session.commit()
+    
+    def to_dict(self):
+        return {
+            'type': self.type.value,
+            'delivery': self.delivery.value
+        }
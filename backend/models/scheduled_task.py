@@ -0,0 +1,22 @@
+from extensions import db
+from models.base import Base
+
+class ScheduledTask(Base):
+    """Schedule and run statistics for a periodic task"""
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    interval_seconds = db.Column(db.Integer, nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_duration_ms = db.Column(db.Integer, nullable=True)  # How long the last run took
+    last_lag_ms = db.Column(db.Integer, nullable=True)  # How late the last run started
+    last_error = db.Column(db.Text, nullable=True)
+    run_count = db.Column(db.Integer, default=0, nullable=False)
+    failure_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    def to_dict(self):
+        data = super().to_dict()
+        for field in ('next_run_at', 'last_run_at', 'created_at', 'updated_at'):
+            if data[field]:
+                data[field] = data[field].isoformat()
+        data['id'] = str(self.id)
+        return data
@@ -1,9 +1,18 @@
+import calendar
 import enum
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, TSRANGE
 
 from extensions import db
 from models.base import Base
 
+# GiST exclusion constraints compare the UUID doctor IDs with =, which needs btree_gist
+db.event.listen(db.metadata, 'before_create', db.DDL('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+
+# Slots in this state hold their time; must match excl_timeslot_doctor_period's WHERE
+TAKEN_SLOT_SQL = "slot_type = 'CUSTOM' AND NOT is_available"
+
 class SlotType(enum.Enum):
     RECURRING = 'recurring'
     CUSTOM = 'custom'
@@ -15,20 +24,40 @@ class RecurrencePattern(enum.Enum):
 
 class TimeSlot(Base):
     """Time slot model for doctor availability"""
+    __table_args__ = (
+        # A doctor has at most one bookable slot per start time, which booking that start time reuses
+        db.Index('uq_timeslot_doctor_start', 'doctor_id', 'start_time', unique=True, postgresql_where=db.text("slot_type = 'CUSTOM'")),
+        # Taken slots of a doctor never overlap. Free slots may, since availability can offer
+        # start times off the grid of slots created earlier, and recurring slots are templates
+        ExcludeConstraint(
+            ('doctor_id', '='), ('period', '&&'),
+            name='excl_timeslot_doctor_period', using='gist', where=db.text(TAKEN_SLOT_SQL)
+        ),
+    )
+    
     doctor_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('doctorprofile.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
     end_time = db.Column(db.DateTime, nullable=False)
     slot_type = db.Column(db.Enum(SlotType), nullable=False)
     is_available = db.Column(db.Boolean, default=True, nullable=False)
+    period = db.Column(TSRANGE, db.Computed('tsrange(start_time, end_time)', persisted=True))  # [start_time, end_time), for the exclusion constraint
     
     # For recurring slots
     recurrence_pattern = db.Column(db.Enum(RecurrencePattern), nullable=True)
     recurrence_day = db.Column(db.Integer, nullable=True)  # Day of week (0-6) or day of month (1-31)
     recurrence_end_date = db.Column(db.Date, nullable=True)
     
+    # For slots created from a recurring slot before availability was computed from the recurring slots
+    template_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('timeslot.id', ondelete='SET NULL'), nullable=True, index=True)
+    
     # Relationships
     doctor = db.relationship('DoctorProfile', back_populates='time_slots')
-    appointment = db.relationship('Appointment', back_populates='time_slot', uselist=False)
+    appointments = db.relationship('Appointment', back_populates='time_slot')
+    # The appointment holding the slot; a cancelled one gives the slot back to be booked again
+    appointment = db.relationship(
+        'Appointment', uselist=False, viewonly=True,
+        primaryjoin="and_(TimeSlot.id == Appointment.time_slot_id, Appointment.status != 'CANCELLED')"
+    )
     
     @property
     def duration_minutes(self):
@@ -46,6 +75,51 @@ class TimeSlot(Base):
         """Check if the time slot is in the past"""
         return self.end_time < datetime.utcnow()
     
+    @classmethod
+    def claim_statement(cls, slot_id):
+        """Build the UPDATE that takes an available slot, returning its ID if it did
+        
+        The row is picked by a subquery with FOR UPDATE SKIP LOCKED, so when
+        another transaction is already taking the same slot this matches
+        nothing and returns at once instead of queueing behind its lock. A slot
+        still held by an appointment that isn't cancelled is never taken, even
+        if it was marked available by mistake.
+        """
+        from models.appointment import Appointment
+        
+        candidate = cls.__table__.alias('candidate')
+        held = db.exists().where(Appointment.time_slot_id == candidate.c.id, Appointment.status != 'CANCELLED')
+        locked = db.select(candidate.c.id) \
+            .where(candidate.c.id == slot_id, candidate.c.is_available == True, ~held) \
+            .with_for_update(skip_locked=True) \
+            .scalar_subquery()
+        return db.update(cls).where(cls.id == locked).values(is_available=False).returning(cls.id)
+    
+    @classmethod
+    def claim(cls, slot_id):
+        """Atomically mark an available slot as taken in the current transaction; returns True if this caller got it"""
+        result = db.session.execute(cls.claim_statement(slot_id), execution_options={'synchronize_session': 'fetch'})
+        return result.first() is not None
+    
+    @classmethod
+    def remove_unbooked(cls, template_ids=None, from_time=None):
+        """Delete future slots created from recurring slots that nobody ever booked; returns how many were deleted
+        
+        Without template_ids the slots of every recurring slot are deleted.
+        """
+        from models.appointment import Appointment
+        
+        query = cls.query.filter(
+            cls.template_id != None,
+            cls.start_time >= (from_time or datetime.utcnow()),
+            ~db.exists().where(Appointment.time_slot_id == cls.id)
+        )
+        if template_ids is not None:
+            if not template_ids:
+                return 0
+            query = query.filter(cls.template_id.in_(template_ids))
+        return query.delete(synchronize_session=False)
+    
     @classmethod
     def get_available_slots(cls, doctor_id, start_date, end_date):
         """Get available time slots for a doctor within a date range"""
@@ -57,6 +131,39 @@ class TimeSlot(Base):
             ~cls.appointment.has()
         ).order_by(cls.start_time).all()
     
+    def occurrence_dates(self, start_date, end_date):
+        """Get the dates a recurring slot falls on between start_date and end_date, inclusive
+        
+        Dates are computed directly from the pattern (every day, every 7th day
+        from the first matching weekday, or the given day of each month)
+        instead of checking every day in the range.
+        """
+        first = max(start_date, self.start_time.date())
+        last = min(end_date, self.recurrence_end_date) if self.recurrence_end_date else end_date
+        if first > last:
+            return []
+        
+        if self.recurrence_pattern == RecurrencePattern.DAILY:
+            return [date.fromordinal(ordinal) for ordinal in range(first.toordinal(), last.toordinal() + 1)]
+        
+        if self.recurrence_pattern == RecurrencePattern.WEEKLY:
+            offset = (self.recurrence_day - first.weekday()) % 7
+            return [date.fromordinal(ordinal) for ordinal in range(first.toordinal() + offset, last.toordinal() + 1, 7)]
+        
+        if self.recurrence_pattern == RecurrencePattern.MONTHLY:
+            dates = []
+            year, month = first.year, first.month
+            while (year, month) <= (last.year, last.month):
+                # Months too short for the day are skipped, as day stepping would
+                if self.recurrence_day <= calendar.monthrange(year, month)[1]:
+                    occurrence = date(year, month, self.recurrence_day)
+                    if first <= occurrence <= last:
+                        dates.append(occurrence)
+                year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            return dates
+        
+        return []
+    
     @classmethod
     def generate_slots_from_recurring(cls, doctor_id, start_date, days_ahead):
         """Generate time slots from recurring patterns for a specific period"""
@@ -72,48 +179,18 @@ class TimeSlot(Base):
         
         generated_slots = []
         for recurring_slot in recurring_slots:
-            # Generate slots based on recurrence pattern
-            current_date = start_date
-            while current_date <= end_date:
-                if recurring_slot.recurrence_pattern == RecurrencePattern.DAILY:
-                    # Create a slot for each day
-                    slot_start = datetime.combine(current_date, recurring_slot.start_time.time())
-                    slot_end = datetime.combine(current_date, recurring_slot.end_time.time())
-                    generated_slots.append({
-                        'doctor_id': doctor_id,
-                        'start_time': slot_start,
-                        'end_time': slot_end,
-                        'slot_type': SlotType.CUSTOM,
-                        'is_available': True
-                    })
-                    current_date += timedelta(days=1)
-                
-                elif recurring_slot.recurrence_pattern == RecurrencePattern.WEEKLY:
-                    # Create a slot if the day of week matches
-                    if current_date.weekday() == recurring_slot.recurrence_day:
-                        slot_start = datetime.combine(current_date, recurring_slot.start_time.time())
-                        slot_end = datetime.combine(current_date, recurring_slot.end_time.time())
-                        generated_slots.append({
-                            'doctor_id': doctor_id,
-                            'start_time': slot_start,
-                            'end_time': slot_end,
-                            'slot_type': SlotType.CUSTOM,
-                            'is_available': True
-                        })
-                    current_date += timedelta(days=1)
-                
-                elif recurring_slot.recurrence_pattern == RecurrencePattern.MONTHLY:
-                    # Create a slot if the day of month matches
-                    if current_date.day == recurring_slot.recurrence_day:
-                        slot_start = datetime.combine(current_date, recurring_slot.start_time.time())
-                        slot_end = datetime.combine(current_date, recurring_slot.end_time.time())
-                        generated_slots.append({
-                            'doctor_id': doctor_id,
-                            'start_time': slot_start,
-                            'end_time': slot_end,
-                            'slot_type': SlotType.CUSTOM,
-                            'is_available': True
-                        })
-                    current_date += timedelta(days=1)
+            for occurrence in recurring_slot.occurrence_dates(start_date, end_date):
+                generated_slots.append({
+                    'doctor_id': doctor_id,
+                    'start_time': datetime.combine(occurrence, recurring_slot.start_time.time()),
+                    'end_time': datetime.combine(occurrence, recurring_slot.end_time.time()),
+                    'slot_type': SlotType.CUSTOM,
+                    'is_available': True
+                })
         
-        return generated_slots
\ No newline at end of file
+        return generated_slots
+    
+    def to_dict(self):
+        data = super().to_dict()
+        data.pop('period', None)  # Derived from start_time and end_time for the exclusion constraint
+        return data
@@ -7,6 +7,7 @@ from passlib.hash import pbkdf2_sha256
 
 from flask import Flask
 from app import create_app
+from config import Config
 from extensions import db
 from models.user import User, Role
 from models.doctor_profile import DoctorProfile, VerificationStatus
@@ -187,8 +188,14 @@ def seed_database():
     db.session.commit()
     
     # Create some appointments
-    # Get available slots
-    available_slots = TimeSlot.query.filter_by(is_available=True).order_by(TimeSlot.start_time).all()
+    # Get available slots, keeping each doctor's bookings the buffer time apart as the exclusion constraints require
+    buffer = timedelta(minutes=Config.BUFFER_TIME_MINUTES)
+    available_slots = []
+    booked_until = {}
+    for slot in TimeSlot.query.filter_by(is_available=True, slot_type=SlotType.CUSTOM).order_by(TimeSlot.start_time).all():
+        if slot.start_time >= booked_until.get(slot.doctor_id, slot.start_time):
+            available_slots.append(slot)
+            booked_until[slot.doctor_id] = slot.end_time + buffer
     
     # Create appointments with different statuses
     statuses = [AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED, 
@@ -196,7 +203,7 @@ def seed_database():
     
     for i in range(min(10, len(available_slots))):
         slot = available_slots[i]
-        patient = random.choice(patients)
+        patient = patients[i % len(patients)]  # Round robin, so no patient has two bookings at once
         doctor_profile = DoctorProfile.query.get(slot.doctor_id)
         
         appointment = Appointment(
@@ -0,0 +1,107 @@
+import json
+import select
+import zlib
+
+from extensions import db, socketio
+from services.event_bus import event_bus
+from models.appointment import APPOINTMENT_CHANGES_CHANNEL, AppointmentStatus
+
+class AppointmentFeed:
+    """Pushes appointment inserts and status changes to doctors as they commit
+    
+    Triggers on the appointment table NOTIFY a Postgres channel, so changes
+    made by any web process, job worker or script are seen. One process
+    across the deployment LISTENs on a dedicated connection, elected by a
+    session-level advisory lock held on that same connection, and emits a
+    compact diff into the doctor's user room. The Socket.IO message queue
+    fans it out to whichever process the doctor is connected to, and live
+    queue views need no polling queries.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self._started = False
+    
+    def init_app(self, app):
+        self.app = app
+        
+        if not app.config['APPOINTMENT_FEED_ENABLED']:
+            return
+        
+        # Start with the first request, so CLI commands and job workers never listen
+        @app.before_request
+        def start_appointment_feed():
+            if not self._started:
+                self.start()
+    
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        socketio.start_background_task(self._loop)
+    
+    @property
+    def lock_key(self):
+        return zlib.crc32(self.app.config['APPOINTMENT_FEED_LOCK_NAME'].encode('utf-8'))
+    
+    def _loop(self):
+        retry_seconds = self.app.config['APPOINTMENT_FEED_RETRY_SECONDS']
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                self.app.logger.error(f'Error in appointment feed: {str(e)}')
+            socketio.sleep(retry_seconds)
+    
+    def _listen(self):
+        """Listen for notifications for as long as this process holds the lock"""
+        with self.app.app_context():
+            connection = db.engine.raw_connection()
+        # Keep the connection out of the pool, so closing it drops the lock and the LISTEN
+        connection.detach()
+        try:
+            driver_connection = connection.driver_connection
+            driver_connection.autocommit = True
+            cursor = driver_connection.cursor()
+            
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', (self.lock_key,))
+            if not cursor.fetchone()[0]:
+                return
+            cursor.execute(f'LISTEN {APPOINTMENT_CHANGES_CHANNEL}')
+            self.app.logger.info('Listening for appointment changes')
+            
+            keepalive_seconds = self.app.config['APPOINTMENT_FEED_KEEPALIVE_SECONDS']
+            while True:
+                # select is cooperative under gevent, so waiting here never blocks the hub
+                readable, _, _ = select.select([driver_connection], [], [], keepalive_seconds)
+                if not readable:
+                    cursor.execute('SELECT 1')  # Notice a dead connection even when nothing changes
+                    continue
+                
+                driver_connection.poll()
+                while driver_connection.notifies:
+                    notification = driver_connection.notifies.pop(0)
+                    self._dispatch(notification.payload)
+        finally:
+            connection.close()
+    
+    def _dispatch(self, payload):
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            self.app.logger.warning(f'Ignoring malformed appointment notification: {payload}')
+            return
+        
+        previous_status = change.get('previous_status')
+        diff = {
+            'change': 'created' if change['op'] == 'insert' else 'status_changed',
+            'appointment_id': change['id'],
+            'patient_id': change['patient_id'],
+            'time_slot_id': change['time_slot_id'],
+            'status': AppointmentStatus[change['status']].value,
+            'previous_status': AppointmentStatus[previous_status].value if previous_status else None
+        }
+        socketio.emit('appointment_changed', diff, room=change['doctor_id'])
+        event_bus.publish('dashboard', 'appointment_changed', dict(diff, doctor_id=change['doctor_id']))
+
+appointment_feed = AppointmentFeed()
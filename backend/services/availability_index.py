@@ -0,0 +1,297 @@
+import heapq
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+
+from extensions import db, socketio
+from models.admin_settings import AdminSettings
+from models.doctor_profile import DoctorProfile, VerificationStatus
+from models.user import User
+from services.availability_service import availability_service, bitmap_to_intervals, slot_starts
+from services.event_bus import event_bus
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_minutes(value):
+    return int((value - EPOCH).total_seconds()) // 60
+
+def from_minutes(minutes):
+    return EPOCH + timedelta(minutes=minutes)
+
+class DoctorIntervals:
+    """One doctor's free intervals as parallel sorted arrays of epoch minutes"""
+    __slots__ = ('doctor_id', 'specialty', 'starts', 'ends')
+    
+    def __init__(self, doctor_id, specialty):
+        self.doctor_id = doctor_id
+        self.specialty = specialty
+        self.starts = array('q')
+        self.ends = array('q')
+    
+    def replace(self, first, last, intervals):
+        """Replace the intervals starting in [first, last) minutes with new (start, end) minute pairs"""
+        lo = bisect_left(self.starts, first)
+        hi = bisect_left(self.starts, last)
+        self.starts[lo:hi] = array('q', [start for start, _ in intervals])
+        self.ends[lo:hi] = array('q', [end for _, end in intervals])
+    
+    def between(self, first, last):
+        """Get the (start, end) minute pairs starting in [first, last)"""
+        lo = bisect_left(self.starts, first)
+        hi = bisect_left(self.starts, last)
+        return list(zip(self.starts[lo:hi], self.ends[lo:hi]))
+
+class SpecialtySlots:
+    """Bookable slot starts of every doctor in a specialty, sorted by time
+    
+    Parallel arrays of epoch minutes and doctor numbers, so the earliest slot
+    after a time is one bisect and a window is a contiguous run.
+    """
+    __slots__ = ('starts', 'owners')
+    
+    def __init__(self):
+        self.starts = array('q')
+        self.owners = array('l')
+    
+    def replace(self, owner, first, last, starts):
+        """Replace one doctor's slot starts in [first, last) minutes"""
+        lo = bisect_left(self.starts, first)
+        hi = bisect_left(self.starts, last)
+        entries = [(start, other) for start, other in zip(self.starts[lo:hi], self.owners[lo:hi]) if other != owner]
+        entries.extend((start, owner) for start in starts)
+        entries.sort()
+        self.starts[lo:hi] = array('q', [start for start, _ in entries])
+        self.owners[lo:hi] = array('l', [other for _, other in entries])
+    
+    def scan(self, first, last):
+        """Yield (start, owner) for slots starting in [first, last), soonest first"""
+        index = bisect_left(self.starts, first)
+        starts, owners = self.starts, self.owners
+        while index < len(starts) and starts[index] < last:
+            yield starts[index], owners[index]
+            index += 1
+
+class AvailabilityIndex:
+    """In-memory index of free time across all doctors, grouped by specialty
+    
+    Answers "who is free soonest" without touching the database: every
+    doctor's free intervals are kept as sorted arrays, and every specialty
+    keeps the bookable slot starts of its doctors in one sorted array, so
+    queries are a bisect plus a short scan. Each process builds its own
+    index from the cached availability bitmaps, rebuilds it periodically to
+    roll the booking horizon forward, and applies the 'availability' events
+    bookings, cancellations and slot holds publish on the event bus in between.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.ready = False
+        self.slot_minutes = 30
+        self.buffer_minutes = 10
+        self._doctors = {}  # doctor_id -> DoctorIntervals
+        self._owners = {}  # doctor_id -> owner number used in SpecialtySlots
+        self._owner_ids = []  # owner number -> doctor_id
+        self._specialties = {}  # lowercased specialty -> SpecialtySlots
+        self._lock = threading.RLock()
+        self._started = False
+    
+    def init_app(self, app):
+        self.app = app
+        
+        if not app.config['AVAILABILITY_INDEX_ENABLED']:
+            return
+        
+        # Start with the first request, so CLI commands and job workers never build it
+        @app.before_request
+        def start_availability_index():
+            if not self._started:
+                self.start()
+    
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        socketio.start_background_task(self._loop)
+    
+    def load(self, doctors, slot_minutes, buffer_minutes):
+        """Replace the index with doctors given as (doctor_id, specialty, {date: [(start, end)]})"""
+        index = AvailabilityIndex()
+        index.slot_minutes = slot_minutes
+        index.buffer_minutes = buffer_minutes
+        for doctor_id, specialty, days in doctors:
+            for day, intervals in days.items():
+                index._set_day(doctor_id, specialty, day, intervals, bulk=True)
+            socketio.sleep(0)
+        for slots in index._specialties.values():
+            order = sorted(range(len(slots.starts)), key=slots.starts.__getitem__)
+            slots.starts = array('q', [slots.starts[i] for i in order])
+            slots.owners = array('l', [slots.owners[i] for i in order])
+            socketio.sleep(0)
+        
+        with self._lock:
+            self.slot_minutes = slot_minutes
+            self.buffer_minutes = buffer_minutes
+            self._doctors = index._doctors
+            self._owners = index._owners
+            self._owner_ids = index._owner_ids
+            self._specialties = index._specialties
+            self.ready = True
+    
+    def update_day(self, doctor_id, specialty, day, intervals):
+        """Replace one doctor's free intervals on a day"""
+        with self._lock:
+            self._set_day(doctor_id, specialty, day, intervals)
+    
+    def remove_doctor(self, doctor_id):
+        with self._lock:
+            doctor = self._doctors.pop(doctor_id, None)
+            if doctor is None:
+                return
+            slots = self._specialties.get(doctor.specialty)
+            if slots is not None:
+                slots.replace(self._owners[doctor_id], 0, 2 ** 62, [])
+    
+    def earliest(self, specialty=None, after=None, before=None, limit=10):
+        """Get the earliest bookable slot of up to limit doctors as [(start, doctor_id)], soonest first
+        
+        Only slots starting in [after, before) count, and each doctor appears
+        once, with their first slot. Without a specialty all doctors are
+        searched.
+        """
+        first = to_minutes(after or datetime.utcnow())
+        last = to_minutes(before) if before else 2 ** 62
+        with self._lock:
+            if specialty is not None:
+                groups = [self._specialties.get(specialty.lower())]
+            else:
+                groups = list(self._specialties.values())
+            streams = [slots.scan(first, last) for slots in groups if slots is not None]
+            
+            results = []
+            seen = set()
+            for start, owner in heapq.merge(*streams):
+                if owner in seen:
+                    continue
+                seen.add(owner)
+                results.append((from_minutes(start), self._owner_ids[owner]))
+                if len(results) >= limit:
+                    break
+            return results
+    
+    def available_in_window(self, start, end, specialty=None, limit=50):
+        """Get up to limit doctors with a bookable slot starting in [start, end), with their first one"""
+        return self.earliest(specialty, after=start, before=end, limit=limit)
+    
+    def free_intervals(self, doctor_id, start, end):
+        """Get a doctor's indexed free intervals starting in [start, end)"""
+        with self._lock:
+            doctor = self._doctors.get(doctor_id)
+            if doctor is None:
+                return []
+            return [(from_minutes(first), from_minutes(last)) for first, last in doctor.between(to_minutes(start), to_minutes(end))]
+    
+    def _set_day(self, doctor_id, specialty, day, intervals, bulk=False):
+        specialty = specialty.lower()
+        doctor = self._doctors.get(doctor_id)
+        if doctor is None:
+            doctor = self._doctors[doctor_id] = DoctorIntervals(doctor_id, specialty)
+        if doctor_id not in self._owners:
+            self._owners[doctor_id] = len(self._owner_ids)
+            self._owner_ids.append(doctor_id)
+        owner = self._owners[doctor_id]
+        
+        day_start = to_minutes(datetime.combine(day, datetime.min.time()))
+        day_end = day_start + 24 * 60
+        doctor.replace(day_start, day_end, [(to_minutes(start), to_minutes(end)) for start, end in intervals])
+        
+        starts = [to_minutes(start) for start in slot_starts(intervals, self.slot_minutes, self.buffer_minutes)]
+        slots = self._specialties.setdefault(specialty, SpecialtySlots())
+        if bulk:
+            # Bulk loads append and sort once at the end
+            slots.starts.extend(starts)
+            slots.owners.extend([owner] * len(starts))
+        else:
+            slots.replace(owner, day_start, day_end, starts)
+    
+    def rebuild(self):
+        """Load every bookable doctor's availability through the booking horizon
+        
+        This runs as a background task in the API processes, so it yields to
+        other greenlets after every doctor instead of holding the hub for the
+        whole rebuild.
+        """
+        settings = AdminSettings.get_settings()
+        today = datetime.utcnow().date()
+        horizon = today + timedelta(days=settings.max_booking_days_ahead)
+        months = []
+        month = today.replace(day=1)
+        while month <= horizon:
+            months.append(month)
+            month = (month + timedelta(days=32)).replace(day=1)
+        
+        doctors = []
+        for doctor_id, specialty in self._bookable_doctors().all():
+            days = {}
+            for month in months:
+                for day, bitmap in availability_service.month_bitmaps(doctor_id, month.year, month.month).items():
+                    if today <= day <= horizon:
+                        days[day] = bitmap_to_intervals(bitmap, day)
+            doctors.append((doctor_id, specialty, days))
+            socketio.sleep(0)
+        
+        self.load(doctors, settings.appointment_duration_minutes, settings.buffer_time_minutes)
+        return len(doctors)
+    
+    def refresh_doctor(self, doctor_id, days=None):
+        """Reload some days of one doctor, or their whole horizon, from the availability cache"""
+        profile = self._bookable_doctors().filter(DoctorProfile.id == doctor_id).first()
+        if profile is None:
+            self.remove_doctor(doctor_id)
+            return
+        
+        if days is None:
+            today = datetime.utcnow().date()
+            horizon = today + timedelta(days=AdminSettings.get_settings().max_booking_days_ahead)
+            days = [today + timedelta(days=offset) for offset in range((horizon - today).days + 1)]
+        for day in days:
+            intervals = availability_service.free_intervals(doctor_id, day)
+            self.update_day(doctor_id, profile.specialty, day, intervals)
+    
+    @staticmethod
+    def _bookable_doctors():
+        return db.session.query(DoctorProfile.id, DoctorProfile.specialty) \
+            .join(User, User.id == DoctorProfile.user_id) \
+            .filter(
+                DoctorProfile.verification_status == VerificationStatus.APPROVED,
+                DoctorProfile.available_for_appointments == True,
+                User.is_active == True
+            )
+    
+    def _loop(self):
+        rebuild_seconds = self.app.config['AVAILABILITY_INDEX_REBUILD_SECONDS']
+        while True:
+            # Subscribe before rebuilding, so changes made during the rebuild are applied after it
+            subscription = event_bus.subscribe('availability')
+            try:
+                with self.app.app_context():
+                    count = self.rebuild()
+                self.app.logger.info(f'Availability index built for {count} doctors')
+                
+                rebuilt_at = datetime.utcnow()
+                while not subscription.overflowed and datetime.utcnow() - rebuilt_at < timedelta(seconds=rebuild_seconds):
+                    item = subscription.get(timeout=5)
+                    if item is None:
+                        continue
+                    _, _, data = item
+                    days = [date.fromisoformat(day) for day in data['days']] if data.get('days') else None
+                    with self.app.app_context():
+                        self.refresh_doctor(uuid.UUID(data['doctor_id']), days)
+            except Exception as e:
+                self.app.logger.error(f'Error in availability index: {str(e)}')
+                socketio.sleep(5)
+            finally:
+                event_bus.unsubscribe(subscription)
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,409 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+from extensions import db, redis_client
+from models.admin_settings import AdminSettings
+from models.appointment import Appointment
+from models.availability_exception import AvailabilityException, AvailabilityExceptionType
+from models.time_slot import TimeSlot, SlotType
+from services.event_bus import event_bus
+from services.slot_hold_service import slot_holds
+
+def merge_intervals(intervals):
+    """Sort (start, end) intervals and merge the ones that overlap or touch"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def subtract_intervals(intervals, blocks):
+    """Remove blocked periods from merged intervals; both must be sorted"""
+    free = []
+    blocks = merge_intervals(blocks)
+    for start, end in intervals:
+        for block_start, block_end in blocks:
+            if block_end <= start or block_start >= end:
+                continue
+            if block_start > start:
+                free.append((start, block_start))
+            start = max(start, block_end)
+            if start >= end:
+                break
+        if start < end:
+            free.append((start, end))
+    return free
+
+def slot_starts(intervals, slot_minutes, buffer_minutes):
+    """Cut free intervals into appointment start times, each followed by the buffer"""
+    slot = timedelta(minutes=slot_minutes)
+    step = slot + timedelta(minutes=buffer_minutes)
+    starts = []
+    for start, end in intervals:
+        while start + slot <= end:
+            starts.append(start)
+            start += step
+    return starts
+
+CELL_MINUTES = 5
+CELLS_PER_DAY = 24 * 60 // CELL_MINUTES
+DAY_BYTES = CELLS_PER_DAY // 8
+HEADER_BYTES = 4  # One bit per day of the month, set once that day's bitmap is filled
+
+# Clears a range of cells in a day bitmap, if that day is cached at all. The day's
+# generation moves on either way, so a bitmap computed before the booking isn't stored.
+MARK_BUSY_SCRIPT = """
+redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+if redis.call('GETBIT', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+for bit = tonumber(ARGV[2]), tonumber(ARGV[3]) - 1 do
+    redis.call('SETBIT', KEYS[1], bit, 0)
+end
+return 1
+"""
+
+# Stores computed day bitmaps, skipping every day whose generation moved on since the
+# caller read it. ARGV is the TTL, then (day index, generation, byte offset, bitmap) per day.
+STORE_SCRIPT = """
+local stored = 0
+for i = 2, #ARGV, 4 do
+    if (redis.call('HGET', KEYS[2], ARGV[i]) or '0') == ARGV[i + 1] then
+        redis.call('SETRANGE', KEYS[1], ARGV[i + 2], ARGV[i + 3])
+        redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+        stored = stored + 1
+    end
+end
+if stored > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+end
+return stored
+"""
+
+def intervals_to_bitmap(intervals, day):
+    """Turn free intervals on a day into a bitmap of the 5-minute cells they fully cover"""
+    cell = timedelta(minutes=CELL_MINUTES)
+    day_start = datetime.combine(day, datetime.min.time())
+    bits = bytearray(DAY_BYTES)
+    for start, end in intervals:
+        first = max(0, -((day_start - start) // cell))  # Round up to the next whole cell
+        last = min(CELLS_PER_DAY, (end - day_start) // cell)
+        for index in range(first, last):
+            bits[index // 8] |= 0x80 >> (index % 8)
+    return bytes(bits)
+
+def bitmap_to_intervals(bitmap, day):
+    """Turn a day bitmap back into merged free intervals"""
+    cell = timedelta(minutes=CELL_MINUTES)
+    day_start = datetime.combine(day, datetime.min.time())
+    intervals = []
+    run_start = None
+    for index in range(CELLS_PER_DAY + 1):
+        free = index < CELLS_PER_DAY and bitmap[index // 8] & (0x80 >> (index % 8))
+        if free and run_start is None:
+            run_start = index
+        elif not free and run_start is not None:
+            intervals.append((day_start + run_start * cell, day_start + index * cell))
+            run_start = None
+    return intervals
+
+def _bit_is_set(data, index):
+    return len(data) > index // 8 and bool(data[index // 8] & (0x80 >> (index % 8)))
+
+def _day_offset(day):
+    """Byte offset of a day's bitmap in its month string"""
+    return HEADER_BYTES + (day.day - 1) * DAY_BYTES
+
+def _cells_by_day(start_time, end_time):
+    """Split a period into (day, first cell, last cell) ranges, rounding outwards to whole cells"""
+    cell = timedelta(minutes=CELL_MINUTES)
+    ranges = []
+    day = start_time.date()
+    while datetime.combine(day, datetime.min.time()) < end_time:
+        day_start = datetime.combine(day, datetime.min.time())
+        first = max(0, (start_time - day_start) // cell)
+        last = min(CELLS_PER_DAY, -((day_start - end_time) // cell))
+        if first < last:
+            ranges.append((day, first, last))
+        day += timedelta(days=1)
+    return ranges
+
+class AvailabilityService:
+    """Computes doctors' free time from rules instead of stored slots
+    
+    A doctor's availability on a day is the windows of their recurring slots
+    and any extra hours, minus time off and minus booked slots padded by the
+    buffer time. It is cached as a bitmap of 5-minute cells, one bit each and
+    set when the cell is free, so a day takes 36 bytes. Every doctor has one
+    Redis string per month: a 4-byte header flagging which days are filled,
+    then the day bitmaps in order, so a month renders from a single GET.
+    Bookings clear their cells in place, cancellations recompute their day
+    and schedule changes drop the affected days. Each of those also moves the
+    day's generation on, in a hash next to the month string, and a computed
+    day is only stored if its generation is still the one read before
+    computing it, so a slow reader can't overwrite a newer booking with the
+    free time it saw earlier. A concrete time slot row is
+    only created when a patient books one of the computed start times, after
+    checking the database again. Time patients hold while booking is left out
+    when bitmaps are read, so the cache never has to be restored when a hold
+    lapses.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.prefix = 'carebridge:availability'
+        self.ttl = 3600
+        self._mark_busy = None
+        self._store_days = None
+    
+    def init_app(self, app):
+        self.app = app
+        self.prefix = app.config['AVAILABILITY_CACHE_KEY_PREFIX']
+        self.ttl = app.config['AVAILABILITY_CACHE_TTL']
+    
+    def day_bitmap(self, doctor_id, day, include_holds=True):
+        """Get a doctor's free-cell bitmap for a day, computing and caching it if needed"""
+        return self.month_bitmaps(doctor_id, day.year, day.month, days=[day], include_holds=include_holds)[day]
+    
+    def month_bitmaps(self, doctor_id, year, month, days=None, include_holds=True):
+        """Get a doctor's bitmaps for the days of a month as {date: bytes}
+        
+        Reads the whole month in one GET and computes only the days that
+        aren't cached yet. Held time, plus the buffer around it, is cleared
+        unless include_holds is False.
+        """
+        days = days or [date(year, month, number) for number in range(1, calendar.monthrange(year, month)[1] + 1)]
+        key = self._key(doctor_id, year, month)
+        try:
+            pipe = redis_client.pipeline()
+            pipe.get(key)
+            pipe.hmget(self._generations_key(key), [day.day - 1 for day in days])
+            cached, generations = pipe.execute()
+            cached = cached or b''
+        except Exception as e:
+            self.app.logger.error(f'Error reading cached availability: {str(e)}')
+            cached, generations = b'', [None] * len(days)
+        
+        bitmaps = {}
+        missing = {}  # day -> generation read before computing it
+        for day, generation in zip(days, generations):
+            offset = _day_offset(day)
+            if _bit_is_set(cached, day.day - 1) and len(cached) >= offset + DAY_BYTES:
+                bitmaps[day] = cached[offset:offset + DAY_BYTES]
+            else:
+                missing[day] = int(generation or 0)
+        
+        if missing:
+            buffer_minutes = AdminSettings.get_settings().buffer_time_minutes
+            for day in missing:
+                bitmaps[day] = intervals_to_bitmap(self.compute_free_intervals(doctor_id, day, buffer_minutes), day)
+            self._store(key, {day: (bitmaps[day], generation) for day, generation in missing.items()})
+        return self._without_holds(doctor_id, bitmaps) if include_holds else bitmaps
+    
+    def free_intervals(self, doctor_id, day):
+        """Get a doctor's free (start, end) intervals on a day, to the nearest 5-minute cell"""
+        return bitmap_to_intervals(self.day_bitmap(doctor_id, day), day)
+    
+    def bookable_starts(self, doctor_id, day, settings=None, now=None, bitmap=None):
+        """Get the start times a patient can book with a doctor on a day"""
+        settings = settings or AdminSettings.get_settings()
+        now = now or datetime.utcnow()
+        earliest = now + timedelta(hours=settings.min_booking_notice_hours)
+        if day > (now + timedelta(days=settings.max_booking_days_ahead)).date():
+            return []
+        
+        bitmap = bitmap if bitmap is not None else self.day_bitmap(doctor_id, day)
+        starts = slot_starts(bitmap_to_intervals(bitmap, day), settings.appointment_duration_minutes, settings.buffer_time_minutes)
+        return [start for start in starts if start > earliest]
+    
+    @staticmethod
+    def compute_free_intervals(doctor_id, day, buffer_minutes=None):
+        """Work out a doctor's free intervals on a day from rules, exceptions and bookings"""
+        if buffer_minutes is None:
+            buffer_minutes = AdminSettings.get_settings().buffer_time_minutes
+        buffer = timedelta(minutes=buffer_minutes)
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        
+        windows = []
+        templates = TimeSlot.query.filter(
+            TimeSlot.doctor_id == doctor_id,
+            TimeSlot.slot_type == SlotType.RECURRING,
+            db.or_(TimeSlot.recurrence_end_date == None, TimeSlot.recurrence_end_date >= day)
+        ).all()
+        for template in templates:
+            for occurrence in template.occurrence_dates(day, day):
+                start = datetime.combine(occurrence, template.start_time.time())
+                windows.append((start, start + (template.end_time - template.start_time)))
+        
+        blocks = []
+        for exception in AvailabilityException.overlapping(doctor_id, day_start, day_end):
+            if exception.type == AvailabilityExceptionType.EXTRA_HOURS:
+                windows.append((exception.start_time, exception.end_time))
+            else:
+                blocks.append((exception.start_time, exception.end_time))
+        
+        # Slots created one at a time, rather than from a recurring slot or by a booking, offer
+        # their own time when free and, like every other taken slot, block it plus the buffer on
+        # both sides. A slot freed by a cancellation only counts where the doctor's hours allow.
+        was_booked = db.exists().where(Appointment.time_slot_id == TimeSlot.id)
+        slots = db.session.query(TimeSlot.start_time, TimeSlot.end_time, TimeSlot.is_available, TimeSlot.template_id, was_booked).filter(
+            TimeSlot.doctor_id == doctor_id,
+            TimeSlot.slot_type == SlotType.CUSTOM,
+            TimeSlot.start_time < day_end + buffer,
+            TimeSlot.end_time > day_start - buffer
+        ).all()
+        for start, end, is_available, template_id, booked in slots:
+            if not is_available:
+                blocks.append((start - buffer, end + buffer))
+            elif template_id is None and not booked:
+                windows.append((start, end))
+        
+        windows = [(max(start, day_start), min(end, day_end)) for start, end in windows if start < day_end and end > day_start]
+        return subtract_intervals(merge_intervals(windows), blocks)
+    
+    def claim_slot(self, doctor_id, start_time, settings=None):
+        """Create the time slot for a booking at start_time, if the doctor is free then
+        
+        Availability is recomputed rather than read from the cache. Returns a
+        TimeSlot already marked as taken, or None if the time isn't free; the
+        caller books and commits it. Nothing is locked up front: an existing
+        slot is taken with TimeSlot.claim, and a new one that races another
+        booking is rejected by the overlap exclusion constraint on insert.
+        """
+        settings = settings or AdminSettings.get_settings()
+        
+        day = start_time.date()
+        bitmap = intervals_to_bitmap(self.compute_free_intervals(doctor_id, day, settings.buffer_time_minutes), day)
+        starts = slot_starts(bitmap_to_intervals(bitmap, day), settings.appointment_duration_minutes, settings.buffer_time_minutes)
+        if start_time not in starts:
+            return None
+        
+        # A slot already at this time, freed by a cancellation or made from a recurring slot, is booked again rather than duplicated
+        existing = TimeSlot.query.filter_by(doctor_id=doctor_id, start_time=start_time, slot_type=SlotType.CUSTOM).first()
+        if existing:
+            return existing if TimeSlot.claim(existing.id) else None
+        
+        time_slot = TimeSlot(
+            doctor_id=doctor_id,
+            start_time=start_time,
+            end_time=start_time + timedelta(minutes=settings.appointment_duration_minutes),
+            slot_type=SlotType.CUSTOM,
+            is_available=False
+        )
+        db.session.add(time_slot)
+        return time_slot
+    
+    def mark_booked(self, doctor_id, start_time, end_time, buffer_minutes=None):
+        """Clear the cells of a new booking, plus the buffer around it, in the cached days"""
+        if buffer_minutes is None:
+            buffer_minutes = AdminSettings.get_settings().buffer_time_minutes
+        buffer = timedelta(minutes=buffer_minutes)
+        if self._mark_busy is None:
+            self._mark_busy = redis_client.register_script(MARK_BUSY_SCRIPT)
+        
+        cells = _cells_by_day(start_time - buffer, end_time + buffer)
+        try:
+            for day, first_cell, last_cell in cells:
+                offset = _day_offset(day) * 8
+                key = self._key(doctor_id, day.year, day.month)
+                self._mark_busy(
+                    keys=[key, self._generations_key(key)],
+                    args=[day.day - 1, offset + first_cell, offset + last_cell, self.ttl]
+                )
+        except Exception as e:
+            self.app.logger.error(f'Error updating cached availability: {str(e)}')
+        self._publish(doctor_id, [day for day, _, _ in cells])
+    
+    def refresh(self, doctor_id, *days):
+        """Recompute and cache the bitmaps of some days, e.g. after a cancellation freed time"""
+        days = set(days)
+        self._forget(doctor_id, days)
+        months = {}
+        for day in days:
+            months.setdefault((day.year, day.month), []).append(day)
+        for (year, month), month_days in months.items():
+            self.month_bitmaps(doctor_id, year, month, days=month_days, include_holds=False)
+        self._publish(doctor_id, days)
+    
+    def invalidate(self, doctor_id, *days):
+        """Drop cached availability for some days of a doctor, or all of it through the booking horizon"""
+        if days:
+            self._forget(doctor_id, set(days))
+        else:
+            today = datetime.utcnow().date()
+            last = today + timedelta(days=AdminSettings.get_settings().max_booking_days_ahead)
+            months = {(today.year, today.month)}
+            while (today.year, today.month) < (last.year, last.month):
+                today = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+                months.add((today.year, today.month))
+            self._forget(doctor_id, [
+                date(year, month, number)
+                for year, month in months
+                for number in range(1, calendar.monthrange(year, month)[1] + 1)
+            ])
+        self._publish(doctor_id, days or None)
+    
+    def _forget(self, doctor_id, days):
+        """Unflag cached days and move their generations on, so bitmaps being computed for them aren't stored"""
+        try:
+            pipe = redis_client.pipeline()
+            for day in days:
+                key = self._key(doctor_id, day.year, day.month)
+                pipe.setbit(key, day.day - 1, 0)
+                pipe.hincrby(self._generations_key(key), day.day - 1, 1)
+                pipe.expire(self._generations_key(key), self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self.app.logger.error(f'Error invalidating cached availability: {str(e)}')
+    
+    def _without_holds(self, doctor_id, bitmaps):
+        """Clear held cells, plus the buffer around them, from day bitmaps"""
+        holds = slot_holds.active(doctor_id)
+        if not holds:
+            return bitmaps
+        
+        buffer = timedelta(minutes=AdminSettings.get_settings().buffer_time_minutes)
+        cleared = {day: bytearray(bitmap) for day, bitmap in bitmaps.items()}
+        for start, end, _ in holds:
+            for day, first_cell, last_cell in _cells_by_day(start - buffer, end + buffer):
+                if day in cleared:
+                    for index in range(first_cell, last_cell):
+                        cleared[day][index // 8] &= ~(0x80 >> (index % 8)) & 0xFF
+        return {day: bytes(bitmap) for day, bitmap in cleared.items()}
+    
+    def _store(self, key, bitmaps):
+        """Write {day: (bitmap, generation)} into a month string, for the days still at that generation"""
+        if self._store_days is None:
+            self._store_days = redis_client.register_script(STORE_SCRIPT)
+        
+        args = [self.ttl]
+        for day, (bitmap, generation) in bitmaps.items():
+            args.extend((day.day - 1, generation, _day_offset(day), bitmap))
+        try:
+            self._store_days(keys=[key, self._generations_key(key)], args=args)
+        except Exception as e:
+            self.app.logger.error(f'Error caching availability: {str(e)}')
+    
+    def _publish(self, doctor_id, days):
+        """Tell availability indexes which days of a doctor changed; None means all of them"""
+        try:
+            event_bus.publish('availability', 'availability_changed', {
+                'doctor_id': str(doctor_id),
+                'days': sorted({day.isoformat() for day in days}) if days is not None else None
+            })
+        except Exception as e:
+            self.app.logger.error(f'Error publishing availability change: {str(e)}')
+    
+    def _key(self, doctor_id, year, month):
+        return f'{self.prefix}:{doctor_id}:{year:04d}-{month:02d}'
+    
+    @staticmethod
+    def _generations_key(key):
+        return f'{key}:generations'
+
+availability_service = AvailabilityService()
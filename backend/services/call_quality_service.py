@@ -0,0 +1,226 @@
+import json
+import time
+
+from flask import current_app
+
+from extensions import db, redis_client
+from models.call_quality_summary import AVERAGED_METRICS, CallQualitySummary
+
+# Adds a batch of samples to a call's ring buffer and per-minute counters
+INGEST_SCRIPT = """
+local samples = cjson.decode(ARGV[1])
+local metrics = {'rtt_ms', 'jitter_ms', 'bitrate_kbps'}
+for _, sample in ipairs(samples) do
+    local minute = tostring(sample['minute'])
+    redis.call('HINCRBY', KEYS[2], minute .. ':samples', 1)
+    for _, metric in ipairs(metrics) do
+        local value = sample[metric]
+        if type(value) == 'number' then
+            local prefix = minute .. ':' .. metric
+            redis.call('HINCRBY', KEYS[2], prefix .. ':n', 1)
+            redis.call('HINCRBYFLOAT', KEYS[2], prefix .. ':sum', value)
+            local peak = tonumber(redis.call('HGET', KEYS[2], prefix .. ':max'))
+            if peak == nil or value > peak then
+                redis.call('HSET', KEYS[2], prefix .. ':max', value)
+            end
+        end
+    end
+    for _, counter in ipairs({'packets_lost', 'packets_received'}) do
+        local value = sample[counter]
+        if type(value) == 'number' then
+            redis.call('HINCRBY', KEYS[2], minute .. ':' .. counter, value)
+        end
+    end
+    redis.call('RPUSH', KEYS[1], cjson.encode(sample))
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[2]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[5])
+return #samples
+"""
+
+# Takes a call's counters out of Redis if it has had no samples since the cutoff
+TAKE_IDLE_SCRIPT = """
+local last_seen = tonumber(redis.call('ZSCORE', KEYS[3], ARGV[2]))
+if last_seen == nil or last_seen > tonumber(ARGV[1]) then
+    return false
+end
+local counters = redis.call('HGETALL', KEYS[2])
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('ZREM', KEYS[3], ARGV[2])
+return counters
+"""
+
+# Puts counters taken by TAKE_IDLE_SCRIPT back when persisting them failed, adding to
+# any that came in since, and marks the call for the next flush to try again
+RESTORE_SCRIPT = """
+local counters = cjson.decode(ARGV[1])
+for field, value in pairs(counters) do
+    if string.sub(field, -4) == ':max' then
+        local peak = tonumber(redis.call('HGET', KEYS[1], field))
+        if peak == nil or tonumber(value) > peak then
+            redis.call('HSET', KEYS[1], field, value)
+        end
+    elseif string.sub(field, -4) == ':sum' then
+        redis.call('HINCRBYFLOAT', KEYS[1], field, value)
+    else
+        redis.call('HINCRBY', KEYS[1], field, value)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], 'GT', ARGV[2], ARGV[4])
+return 1
+"""
+
+# Fields a client may report for one stats sample
+SAMPLE_FIELDS = AVERAGED_METRICS + ('packets_lost', 'packets_received')
+
+class CallQualityService:
+    """Ingests WebRTC stats samples and keeps per-minute call quality aggregates
+    
+    Each participant of a call has a short ring buffer of raw samples for live
+    views and a hash of per-minute counters (count, sum and max of RTT, jitter
+    and bitrate, plus packets lost and received), both in Redis and updated
+    by a single script call per batch. Once a call has been quiet for a while
+    its counters are merged into a CallQualitySummary row, so the database
+    sees one write per participant per call instead of one per sample.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.prefix = 'carebridge:call_quality'
+        self.ring_size = 120
+        self.ttl = 24 * 60 * 60
+        self._ingest = None
+        self._take_idle = None
+        self._restore = None
+    
+    def init_app(self, app):
+        self.app = app
+        self.prefix = app.config['CALL_QUALITY_KEY_PREFIX']
+        self.ring_size = app.config['CALL_QUALITY_RING_SIZE']
+        self.ttl = app.config['CALL_QUALITY_KEY_TTL']
+    
+    def ingest(self, appointment_id, user_id, samples, now=None):
+        """Record a batch of stats samples from one participant; returns how many were kept"""
+        now = now or time.time()
+        cleaned = [sample for sample in (self._clean_sample(sample, now) for sample in samples) if sample]
+        if not cleaned:
+            return 0
+        
+        if self._ingest is None:
+            self._ingest = redis_client.register_script(INGEST_SCRIPT)
+        return self._ingest(
+            keys=[
+                self._samples_key(appointment_id, user_id),
+                self._minutes_key(appointment_id, user_id),
+                self._key('calls')
+            ],
+            args=[json.dumps(cleaned), self.ring_size, now, self.ttl, f'{appointment_id}:{user_id}']
+        )
+    
+    def recent_samples(self, appointment_id, user_id):
+        """Get the raw samples still in a participant's ring buffer, oldest first"""
+        return [json.loads(sample) for sample in redis_client.lrange(self._samples_key(appointment_id, user_id), 0, -1)]
+    
+    def live_minutes(self, appointment_id, user_id):
+        """Get the per-minute aggregates of a participant's call that are not persisted yet"""
+        return self._parse_counters(redis_client.hgetall(self._minutes_key(appointment_id, user_id)))
+    
+    def flush_idle(self, idle_seconds=None, limit=1000):
+        """Persist the aggregates of calls that have stopped sending samples; returns how many were flushed"""
+        idle_seconds = idle_seconds or current_app.config['CALL_QUALITY_IDLE_SECONDS']
+        if self._take_idle is None:
+            self._take_idle = redis_client.register_script(TAKE_IDLE_SCRIPT)
+        
+        cutoff = time.time() - idle_seconds
+        calls_key = self._key('calls')
+        flushed = 0
+        for member in redis_client.zrangebyscore(calls_key, '-inf', cutoff, start=0, num=limit):
+            appointment_id, user_id = member.decode().split(':')
+            counters = self._take_idle(
+                keys=[
+                    self._samples_key(appointment_id, user_id),
+                    self._minutes_key(appointment_id, user_id),
+                    calls_key
+                ],
+                args=[cutoff, member]
+            )
+            if not counters:
+                continue
+            
+            counters = dict(zip(counters[::2], counters[1::2]))
+            try:
+                CallQualitySummary.merge(appointment_id, user_id, self._parse_counters(counters))
+                db.session.commit()
+                flushed += 1
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f'Error persisting call quality for appointment {appointment_id}: {str(e)}')
+                self._put_back(appointment_id, user_id, member, counters, cutoff)
+        return flushed
+    
+    def _put_back(self, appointment_id, user_id, member, counters, cutoff):
+        """Return counters that couldn't be persisted to Redis, so the next flush retries them"""
+        if self._restore is None:
+            self._restore = redis_client.register_script(RESTORE_SCRIPT)
+        self._restore(
+            keys=[self._minutes_key(appointment_id, user_id), self._key('calls')],
+            args=[
+                json.dumps({field.decode(): value.decode() for field, value in counters.items()}),
+                cutoff,
+                self.ttl,
+                member
+            ]
+        )
+    
+    def _clean_sample(self, sample, now):
+        """Keep only known numeric fields of a sample and bucket it into a minute"""
+        if not isinstance(sample, dict):
+            return None
+        cleaned = {}
+        for field in SAMPLE_FIELDS:
+            value = sample.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+                cleaned[field] = int(value) if field.startswith('packets_') else float(value)
+        if not cleaned:
+            return None
+        
+        # Trust the client clock only within a few minutes of ours
+        timestamp = sample.get('ts')
+        if not isinstance(timestamp, (int, float)) or abs(timestamp / 1000 - now) > 300:
+            timestamp = now * 1000
+        cleaned['ts'] = int(timestamp)
+        cleaned['minute'] = int(timestamp / 1000 // 60 * 60)
+        return cleaned
+    
+    @staticmethod
+    def _parse_counters(counters):
+        """Turn a hash of 'minute:metric:stat' counters into a sorted list of minute aggregates"""
+        minutes = {}
+        for field, value in counters.items():
+            minute, _, name = (field.decode() if isinstance(field, bytes) else field).partition(':')
+            aggregate = minutes.get(minute)
+            if aggregate is None:
+                aggregate = minutes[minute] = {'minute': int(minute), 'samples': 0, 'packets_lost': 0, 'packets_received': 0}
+                for metric in AVERAGED_METRICS:
+                    aggregate[metric] = [0, 0.0, 0.0]
+            
+            metric, _, stat = name.rpartition(':')
+            if metric in AVERAGED_METRICS:
+                aggregate[metric][('n', 'sum', 'max').index(stat)] = float(value) if stat != 'n' else int(value)
+            else:
+                aggregate[name] = int(value)
+        return sorted(minutes.values(), key=lambda minute: minute['minute'])
+    
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+    
+    def _samples_key(self, appointment_id, user_id):
+        return f'{self.prefix}:call:{appointment_id}:{user_id}:samples'
+    
+    def _minutes_key(self, appointment_id, user_id):
+        return f'{self.prefix}:call:{appointment_id}:{user_id}:minutes'
+
+call_quality_service = CallQualityService()
@@ -0,0 +1,101 @@
+import uuid
+
+from flask import current_app
+
+from extensions import db, socketio
+from jobs import job_queue
+from models import ConsultationSession, User
+from models.message import Message, MessageType
+
+class ConsultationService:
+    @staticmethod
+    def join(appointment_id, user_id, name, role):
+        """Record a participant joining the call; only the first join after being away reaches the chat"""
+        session, announce = ConsultationSession.record_join(
+            appointment_id,
+            user_id,
+            current_app.config['CONSULTATION_RECONNECT_GRACE_SECONDS']
+        )
+        
+        system_message = None
+        if announce:
+            system_message = ConsultationService._post_system_message(
+                appointment_id, user_id, f"{name} joined the consultation"
+            )
+        db.session.commit()
+        
+        socketio.emit('user_joined', {
+            'user': {
+                'id': str(user_id),
+                'name': name,
+                'role': role.value
+            },
+            'message': system_message.to_dict() if system_message else None,
+            'reconnected': not announce
+        }, room=f'appointment_{appointment_id}')
+        return session
+    
+    @staticmethod
+    def leave(appointment_id, user_id, name, role):
+        """Record a participant leaving the call
+        
+        Peers hear about it right away so they can tear down the call, but the
+        chat message waits out the reconnect grace period and is skipped if the
+        participant is back by then.
+        """
+        session = ConsultationSession.record_leave(appointment_id, user_id)
+        if session is None:
+            return None
+        left_at = session.last_left_at
+        db.session.commit()
+        
+        socketio.emit('user_left', {
+            'user': {
+                'id': str(user_id),
+                'name': name,
+                'role': role.value
+            },
+            'message': None
+        }, room=f'appointment_{appointment_id}')
+        
+        job_queue.enqueue(
+            'announce_consultation_leave',
+            appointment_id=str(appointment_id),
+            user_id=str(user_id),
+            left_at=left_at,
+            delay=current_app.config['CONSULTATION_RECONNECT_GRACE_SECONDS']
+        )
+        return session
+    
+    @staticmethod
+    def announce_leave(appointment_id, user_id, left_at):
+        """Post the 'left' chat message unless the participant came back since leaving at left_at"""
+        session = ConsultationSession.query.filter_by(appointment_id=appointment_id, user_id=user_id)\
+                                           .with_for_update().first()
+        if session is None or session.present or not session.announced or session.last_left_at != left_at:
+            db.session.rollback()
+            return None
+        
+        user = User.query.get(user_id)
+        session.announced = False
+        system_message = ConsultationService._post_system_message(
+            appointment_id, user_id, f"{user.first_name} {user.last_name} left the consultation"
+        )
+        db.session.commit()
+        
+        socketio.emit('new_message', {
+            'message': system_message.to_dict()
+        }, room=f'appointment_{appointment_id}')
+        return system_message
+    
+    @staticmethod
+    def _post_system_message(appointment_id, user_id, content):
+        system_message = Message(
+            id=uuid.uuid4(),
+            appointment_id=appointment_id,
+            sender_id=user_id,
+            message_type=MessageType.SYSTEM,
+            content=content
+        )
+        db.session.add(system_message)
+        return system_message
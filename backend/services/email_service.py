@@ -0,0 +1,344 @@
+import hashlib
+import heapq
+import queue
+import random
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+# Templates admins can override from the admin settings page
+ADMIN_TEMPLATE_FIELDS = {
+    'booking': 'email_template_booking',
+    'reminder': 'email_template_reminder',
+    'cancellation': 'email_template_cancellation',
+    'prescription': 'email_template_prescription'
+}
+
+class EmailDeliveryError(Exception):
+    """Raised when an email could not be delivered but may succeed on retry"""
+    pass
+
+class SMTPConnectionPool:
+    """Pool of logged-in SMTP connections reused across batches"""
+    
+    def __init__(self, host, port, username=None, password=None, use_tls=True, max_size=2, timeout=10, max_idle_seconds=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle_seconds = max_idle_seconds
+        self._idle = []  # (returned_at, connection)
+        self._lock = threading.Lock()
+    
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            connection.starttls()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        return connection
+    
+    def acquire(self):
+        """Get a live connection, reusing an idle one when possible"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                returned_at, connection = self._idle.pop()
+            
+            # Connections idle for a while may have been dropped by the server
+            if time.monotonic() - returned_at < self.max_idle_seconds:
+                return connection
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._close(connection)
+        
+        return self._connect()
+    
+    def release(self, connection, broken=False):
+        """Return a connection to the pool, or close it if broken or the pool is full"""
+        if broken:
+            self._close(connection)
+            return
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((time.monotonic(), connection))
+                return
+        self._close(connection)
+    
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, connection in idle:
+            self._close(connection)
+    
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+class EmailTemplateCache:
+    """Compiles email templates once, including admin overrides from AdminSettings
+    
+    Overrides are edited through the admin settings rather than shipped with
+    the code, so they are compiled in a sandbox that can't reach Python
+    internals or modify the context.
+    """
+    
+    def __init__(self, template_folder, override_ttl_seconds=60):
+        # auto_reload is off so compiled file templates are never re-checked on disk
+        self.environment = Environment(
+            loader=FileSystemLoader(template_folder),
+            autoescape=select_autoescape(['html']),
+            auto_reload=False
+        )
+        self.override_environment = ImmutableSandboxedEnvironment(
+            loader=self.environment.loader,
+            autoescape=select_autoescape(['html']),
+            auto_reload=False
+        )
+        self.override_ttl_seconds = override_ttl_seconds
+        self._overrides = {}  # name -> source
+        self._overrides_loaded_at = None
+        self._compiled_overrides = {}  # (name, source digest) -> Template
+    
+    def _load_overrides(self):
+        """Refresh admin override sources at most once per TTL"""
+        now = time.monotonic()
+        if self._overrides_loaded_at is not None and now - self._overrides_loaded_at < self.override_ttl_seconds:
+            return
+        
+        from models.admin_settings import AdminSettings
+        settings = AdminSettings.get_settings()
+        self._overrides = {
+            name: getattr(settings, field)
+            for name, field in ADMIN_TEMPLATE_FIELDS.items()
+            if getattr(settings, field)
+        }
+        self._overrides_loaded_at = now
+    
+    def invalidate_overrides(self):
+        """Force admin overrides to be reloaded on the next render"""
+        self._overrides_loaded_at = None
+    
+    def get(self, name):
+        """Get the compiled template for a name such as 'booking' or 'password_reset'"""
+        if name in ADMIN_TEMPLATE_FIELDS:
+            self._load_overrides()
+            source = self._overrides.get(name)
+            if source:
+                key = (name, hashlib.sha1(source.encode('utf-8')).hexdigest())
+                template = self._compiled_overrides.get(key)
+                if template is None:
+                    # Drop the stale compiled version of this override
+                    self._compiled_overrides = {k: v for k, v in self._compiled_overrides.items() if k[0] != name}
+                    template = self.override_environment.from_string(source)
+                    self._compiled_overrides[key] = template
+                return template
+        
+        return self.environment.get_template(f'{name}.html')
+    
+    def render(self, name, context):
+        return self.get(name).render(**context)
+
+class EmailService:
+    """Queues emails and sends them in batches from a background sender
+    
+    Messages are rendered and delivered off the request path over pooled
+    SMTP connections. Failed deliveries are retried with exponential backoff.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.pool = None
+        self.templates = None
+        self._queue = queue.Queue()
+        self._retries = []  # heap of (next_attempt_at, sequence, message)
+        self._sequence = 0
+        self._sender = None
+        self._stopped = threading.Event()
+    
+    def init_app(self, app):
+        self.app = app
+        self.pool = SMTPConnectionPool(
+            host=app.config['SMTP_SERVER'],
+            port=app.config['SMTP_PORT'],
+            username=app.config['SMTP_USERNAME'],
+            password=app.config['SMTP_PASSWORD'],
+            use_tls=app.config['SMTP_USE_TLS'],
+            max_size=app.config['SMTP_POOL_SIZE']
+        )
+        self.templates = EmailTemplateCache(
+            template_folder=app.config['EMAIL_TEMPLATE_FOLDER'],
+            override_ttl_seconds=app.config['EMAIL_TEMPLATE_OVERRIDE_TTL']
+        )
+    
+    def send_template(self, to, subject, template, **context):
+        """Queue a templated email for delivery
+        
+        The context is rendered later on the sender thread, so it should only
+        hold plain values rather than model instances.
+        """
+        message = self._message(to, subject, template, context)
+        
+        if not self.app.config['SMTP_SERVER']:
+            self.app.logger.warning(f'SMTP_SERVER is not configured, dropping email to {to}')
+            return
+        
+        if not self.app.config['EMAIL_SEND_ASYNC']:
+            # Without the background sender, transient failures are retried by the job worker
+            if self.send_batch([message]):
+                from jobs import job_queue
+                job_queue.enqueue('send_email', to=to, subject=subject, template=template, context=context,
+                                  delay=self.app.config['EMAIL_RETRY_BASE_DELAY'])
+            return
+        
+        self._ensure_sender()
+        self._queue.put(message)
+    
+    def deliver(self, to, subject, template, **context):
+        """Send a templated email right away, raising EmailDeliveryError on a transient failure"""
+        if self.send_batch([self._message(to, subject, template, context)]):
+            raise EmailDeliveryError(f'Could not deliver email to {to}')
+    
+    def send_batch(self, messages):
+        """Render and deliver messages over one pooled connection
+        
+        Returns the messages that failed with a transient error.
+        """
+        failed = []
+        with self.app.app_context():
+            rendered = []
+            for message in messages:
+                try:
+                    rendered.append((message, self._build(message)))
+                except Exception as e:
+                    self.app.logger.error(f"Error rendering email template {message['template']}: {str(e)}")
+        
+        if not rendered:
+            return failed
+        
+        try:
+            connection = self.pool.acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            self.app.logger.warning(f'Error connecting to SMTP server: {str(e)}')
+            return [message for message, _ in rendered]
+        
+        broken = False
+        for message, email in rendered:
+            if broken:
+                failed.append(message)
+                continue
+            try:
+                connection.send_message(email)
+            except smtplib.SMTPRecipientsRefused:
+                self.app.logger.error(f"Email to {message['to']} was refused, not retrying")
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                self.app.logger.warning(f'SMTP connection lost: {str(e)}')
+                broken = True
+                failed.append(message)
+            except smtplib.SMTPException as e:
+                self.app.logger.warning(f"Error sending email to {message['to']}: {str(e)}")
+                failed.append(message)
+        
+        self.pool.release(connection, broken=broken)
+        return failed
+    
+    def flush(self):
+        """Block until every queued email has been attempted at least once"""
+        self._queue.join()
+    
+    def stop(self):
+        self._stopped.set()
+        if self.pool:
+            self.pool.close_all()
+    
+    @staticmethod
+    def _message(to, subject, template, context):
+        return {
+            'to': to,
+            'subject': subject,
+            'template': template,
+            'context': context,
+            'attempts': 0
+        }
+    
+    def _build(self, message):
+        email = EmailMessage()
+        email['Subject'] = message['subject']
+        email['From'] = formataddr((self.app.config['SMTP_FROM_NAME'], self.app.config['SMTP_FROM_EMAIL']))
+        email['To'] = message['to']
+        email.set_content(message['subject'])
+        email.add_alternative(self.templates.render(message['template'], message['context']), subtype='html')
+        return email
+    
+    def _ensure_sender(self):
+        if self._sender is None or not self._sender.is_alive():
+            self._sender = threading.Thread(target=self._run_sender, name='email-sender', daemon=True)
+            self._sender.start()
+    
+    def _run_sender(self):
+        """Drain the queue in batches, rescheduling transient failures"""
+        batch_size = self.app.config['EMAIL_BATCH_SIZE']
+        
+        while not self._stopped.is_set():
+            batch = self._due_retries(batch_size)
+            
+            # Wait for new mail, but wake up in time for the next retry
+            timeout = 1.0
+            if self._retries:
+                timeout = max(0.0, min(timeout, self._retries[0][0] - time.monotonic()))
+            
+            taken = 0
+            try:
+                if not batch:
+                    batch.append(self._queue.get(timeout=timeout))
+                    taken += 1
+                while len(batch) < batch_size:
+                    batch.append(self._queue.get_nowait())
+                    taken += 1
+            except queue.Empty:
+                pass
+            
+            if batch:
+                for message in self.send_batch(batch):
+                    self._schedule_retry(message)
+            
+            for _ in range(taken):
+                self._queue.task_done()
+    
+    def _due_retries(self, limit):
+        due = []
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now and len(due) < limit:
+            due.append(heapq.heappop(self._retries)[2])
+        return due
+    
+    def _schedule_retry(self, message):
+        message['attempts'] += 1
+        if message['attempts'] > self.app.config['EMAIL_MAX_RETRIES']:
+            self.app.logger.error(f"Giving up on email to {message['to']} after {message['attempts']} attempts")
+            return
+        
+        # Exponential backoff with jitter
+        delay = self.app.config['EMAIL_RETRY_BASE_DELAY'] * (2 ** (message['attempts'] - 1))
+        delay *= random.uniform(0.8, 1.2)
+        self._sequence += 1
+        heapq.heappush(self._retries, (time.monotonic() + delay, self._sequence, message))
+
+email_service = EmailService()
@@ -0,0 +1,151 @@
+import json
+import queue
+import threading
+
+from sqlalchemy import event as sqlalchemy_event
+
+from extensions import db, redis_client, socketio
+
+def parse_event_id(event_id):
+    """Turn a Redis stream ID into a comparable (milliseconds, sequence) pair; None if it isn't one"""
+    try:
+        milliseconds, _, sequence = str(event_id).partition('-')
+        return int(milliseconds), int(sequence or 0)
+    except (TypeError, ValueError):
+        return None
+
+class Subscription:
+    """A bounded queue of live events for one stream consumer"""
+    
+    def __init__(self, topic, maxsize):
+        self.topic = topic
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+    
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # A consumer this far behind resumes from its Last-Event-ID instead
+            self.overflowed = True
+    
+    def get(self, timeout):
+        """Wait for the next (id, event, data) tuple; None if nothing came within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBus:
+    """Internal publish/subscribe of app events on capped Redis streams
+    
+    Every topic is a stream trimmed to roughly EVENT_BUS_MAXLEN entries, so
+    stream IDs double as resumable event IDs. Each process runs one reader per
+    topic that blocks on XREAD and hands events to its local subscribers, so a
+    subscriber costs a queue rather than its own Redis connection.
+    
+    Events about database changes can be held on the session with
+    publish_on_commit; they are appended in one pipeline once the session
+    commits, and dropped if it rolls back.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.prefix = 'carebridge:events'
+        self.maxlen = 10000
+        self._subscribers = {}  # topic -> set of Subscription
+        self._readers = set()
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.app = app
+        self.prefix = app.config['EVENT_BUS_KEY_PREFIX']
+        self.maxlen = app.config['EVENT_BUS_MAXLEN']
+        if not sqlalchemy_event.contains(db.session, 'after_commit', self._publish_pending):
+            sqlalchemy_event.listen(db.session, 'after_commit', self._publish_pending)
+            sqlalchemy_event.listen(db.session, 'after_rollback', self._discard_pending)
+    
+    def publish(self, topic, event, data):
+        """Append an event to a topic; returns its ID"""
+        event_id = redis_client.xadd(
+            self._key(topic),
+            {'event': event, 'data': json.dumps(data, default=str)},
+            maxlen=self.maxlen,
+            approximate=True
+        )
+        return event_id.decode()
+    
+    def publish_on_commit(self, topic, event, data):
+        """Append an event to a topic once the current database session commits"""
+        db.session.info.setdefault('event_bus_pending', []).append((topic, event, data))
+    
+    def since(self, topic, last_event_id, limit):
+        """Get up to limit events published after last_event_id, oldest first"""
+        entries = redis_client.xrange(self._key(topic), min=f'({last_event_id}', max='+', count=limit)
+        return [self._decode(entry_id, fields) for entry_id, fields in entries]
+    
+    def subscribe(self, topic, maxsize=1000):
+        subscription = Subscription(topic, maxsize)
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            start_reader = topic not in self._readers
+            self._readers.add(topic)
+        if start_reader:
+            socketio.start_background_task(self._read_loop, topic)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.get(subscription.topic, set()).discard(subscription)
+    
+    def _read_loop(self, topic):
+        key = self._key(topic)
+        last_id = '$'
+        while True:
+            try:
+                response = redis_client.xread({key: last_id}, count=100, block=5000)
+            except Exception as e:
+                self.app.logger.error(f'Error reading event bus topic {topic}: {str(e)}')
+                socketio.sleep(1)
+                continue
+            
+            for _, entries in response:
+                for entry_id, fields in entries:
+                    event = self._decode(entry_id, fields)
+                    last_id = event[0]
+                    with self._lock:
+                        subscribers = list(self._subscribers.get(topic, ()))
+                    for subscription in subscribers:
+                        subscription.deliver(event)
+    
+    def _publish_pending(self, session):
+        pending = session.info.pop('event_bus_pending', None)
+        if not pending:
+            return
+        
+        pipeline = redis_client.pipeline(transaction=False)
+        for topic, event, data in pending:
+            pipeline.xadd(
+                self._key(topic),
+                {'event': event, 'data': json.dumps(data, default=str)},
+                maxlen=self.maxlen,
+                approximate=True
+            )
+        try:
+            pipeline.execute()
+        except Exception as e:
+            # The commit already went through, so losing these events must not fail the request
+            self.app.logger.error(f'Error publishing {len(pending)} event bus events: {str(e)}')
+    
+    @staticmethod
+    def _discard_pending(session):
+        session.info.pop('event_bus_pending', None)
+    
+    @staticmethod
+    def _decode(entry_id, fields):
+        return entry_id.decode(), fields[b'event'].decode(), json.loads(fields[b'data'])
+    
+    def _key(self, topic):
+        return f'{self.prefix}:{topic}'
+
+event_bus = EventBus()
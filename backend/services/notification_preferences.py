@@ -0,0 +1,102 @@
+import time
+
+from extensions import socketio
+from models.notification_preference import NotificationPreference, DeliveryMode
+from services.event_bus import event_bus
+
+class NotificationPreferenceCache:
+    """In-process cache of per-user notification delivery preferences
+    
+    Most users never change their preferences, so empty results are cached
+    too. A user's preferences are loaded at most once per TTL, and fan-out
+    paths prime every recipient with a single query before sending. Changes
+    are announced on the event bus, so every process drops its copy.
+    """
+    
+    def __init__(self, ttl_seconds=300, max_users=50000):
+        self.app = None
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self._entries = {}  # user_id -> (expires_at, {NotificationType: DeliveryMode})
+        self._listening = False
+    
+    def init_app(self, app):
+        self.app = app
+        self.configure(ttl_seconds=app.config['NOTIFICATION_PREFERENCE_CACHE_TTL'])
+    
+    def configure(self, ttl_seconds=None, max_users=None):
+        """Apply settings from the Flask config"""
+        if ttl_seconds is not None:
+            self.ttl_seconds = ttl_seconds
+        if max_users is not None:
+            self.max_users = max_users
+    
+    def prime(self, user_ids):
+        """Load preferences for every user not already cached, in one query"""
+        self._ensure_listener()
+        now = time.monotonic()
+        missing = []
+        for user_id in user_ids:
+            entry = self._entries.get(str(user_id))
+            if entry is None or entry[0] <= now:
+                missing.append(str(user_id))
+        
+        if not missing:
+            return
+        
+        if len(self._entries) + len(missing) > self.max_users:
+            self._evict(now)
+        
+        expires_at = now + self.ttl_seconds
+        for user_id, preferences in NotificationPreference.get_for_users(missing).items():
+            self._entries[user_id] = (expires_at, preferences)
+    
+    def get_delivery(self, user_id, type):
+        """Get the delivery mode a user has chosen for a notification type"""
+        entry = self._entries.get(str(user_id))
+        if entry is None or entry[0] <= time.monotonic():
+            self.prime([user_id])
+            entry = self._entries[str(user_id)]
+        return entry[1].get(type, DeliveryMode.PERSIST)
+    
+    def invalidate(self, user_id):
+        """Drop a user's cached preferences after they change, in every process"""
+        self._entries.pop(str(user_id), None)
+        if self.app is None:
+            return
+        try:
+            event_bus.publish('preferences', 'preferences_changed', {'user_id': str(user_id)})
+        except Exception as e:
+            self.app.logger.error(f'Error publishing preference change: {str(e)}')
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def _ensure_listener(self):
+        if self.app is None or self._listening:
+            return
+        self._listening = True
+        socketio.start_background_task(self._listen)
+    
+    def _listen(self):
+        """Drop the preferences other processes announce as changed"""
+        subscription = event_bus.subscribe('preferences')
+        while True:
+            item = subscription.get(timeout=5)
+            if subscription.overflowed:
+                # Some changes were missed, so nothing cached can be trusted
+                event_bus.unsubscribe(subscription)
+                self.clear()
+                subscription = event_bus.subscribe('preferences')
+                continue
+            if item is not None:
+                _, _, data = item
+                self._entries.pop(data['user_id'], None)
+    
+    def _evict(self, now):
+        """Drop expired entries, or everything if the cache is still full"""
+        self._entries = {user_id: entry for user_id, entry in self._entries.items() if entry[0] > now}
+        if len(self._entries) >= self.max_users:
+            self._entries.clear()
+
+preference_cache = NotificationPreferenceCache()
@@ -1,12 +1,51 @@
-from models import Notification, NotificationType, User, Role
+from models import Notification, NotificationType, NotificationStatus, User, Role, DeliveryMode
 from extensions import db, socketio
+from services.notification_preferences import preference_cache
+from services.event_bus import event_bus
+from jobs import job_queue
 from datetime import datetime
 import json
+import uuid
 
 class NotificationService:
     @staticmethod
-    def send_notification(user_id, type, title, message, resource_type=None, resource_id=None):
-        """Send a notification to a specific user"""
+    def send_notification(user_id, type, title, message, resource_type=None, resource_id=None, commit=True):
+        """Send a notification to a specific user, routed by their delivery preference
+        
+        With commit=False the socket event is held until the caller commits
+        and calls emit_pending, so clients never see a notification that was
+        rolled back.
+        """
+        delivery = preference_cache.get_delivery(user_id, type)
+        
+        # Muted notifications are dropped without touching the database
+        if delivery == DeliveryMode.MUTE:
+            return None
+        
+        # Dashboards follow notification activity on the event bus, without the content;
+        # it is published together with the other events of the transaction once it commits
+        event_bus.publish_on_commit('dashboard', 'notification', {
+            'type': type.value,
+            'user_id': str(user_id),
+            'resource_type': resource_type,
+            'resource_id': str(resource_id) if resource_id else None,
+            'delivery': delivery.value
+        })
+        
+        # Push-only notifications are emitted but never stored
+        if delivery == DeliveryMode.PUSH_ONLY:
+            if commit:
+                db.session.commit()  # Nothing is stored, but the commit publishes the dashboard event
+            NotificationService._emit(user_id, NotificationService._transient_payload(
+                user_id=user_id,
+                type=type,
+                title=title,
+                message=message,
+                resource_type=resource_type,
+                resource_id=resource_id
+            ), commit)
+            return None
+        
         # Create the notification in the database
         notification = Notification.create(
             user_id=user_id,
@@ -14,19 +53,116 @@ class NotificationService:
             title=title,
             message=message,
             resource_type=resource_type,
-            resource_id=resource_id
+            resource_id=resource_id,
+            digest_pending=delivery == DeliveryMode.EMAIL_DIGEST,
+            commit=commit
         )
         
+        # Digest notifications stay in the inbox for the email digest instead of being pushed
+        if delivery == DeliveryMode.EMAIL_DIGEST:
+            return notification
+        
         # Emit a socket.io event to the user
         notification_data = notification.to_dict()
-        socketio.emit('notification', notification_data, room=str(user_id))
+        NotificationService._emit(user_id, notification_data, commit)
         
         return notification
     
+    @staticmethod
+    def emit_pending():
+        """Emit the socket events held by send_notification(commit=False), once the batch has committed"""
+        for user_id, payload in db.session.info.pop('pending_notification_emits', []):
+            socketio.emit('notification', payload, room=str(user_id))
+    
+    @staticmethod
+    def discard_pending():
+        """Drop the held socket events of a batch that was rolled back"""
+        db.session.info.pop('pending_notification_emits', None)
+    
+    @staticmethod
+    def _emit(user_id, payload, immediately):
+        if immediately:
+            socketio.emit('notification', payload, room=str(user_id))
+        else:
+            db.session.info.setdefault('pending_notification_emits', []).append((user_id, payload))
+    
+    @staticmethod
+    def _transient_payload(user_id, type, title, message, resource_type=None, resource_id=None):
+        """Build a notification payload shaped like Notification.to_dict for push-only delivery"""
+        now = datetime.utcnow()
+        return {
+            'id': str(uuid.uuid4()),
+            'user_id': str(user_id),
+            'type': type.value,
+            'title': title,
+            'message': message,
+            'status': NotificationStatus.UNREAD.value,
+            'read_at': None,
+            'resource_type': resource_type,
+            'resource_id': resource_id,
+            'created_at': now.isoformat(),
+            'updated_at': now.isoformat(),
+            'transient': True
+        }
+    
+    @staticmethod
+    def send_digests(batch_size=500):
+        """Email every user the unread notifications held for their digest; returns how many digests were queued
+        
+        Users are handled batch_size at a time. Each batch is marked as sent
+        and committed before its emails are queued, so a digest is never
+        emailed twice.
+        """
+        sent = 0
+        while True:
+            user_ids = [user_id for (user_id,) in db.session.query(Notification.user_id)
+                        .filter(Notification.digest_pending == True)
+                        .distinct()
+                        .limit(batch_size)]
+            if not user_ids:
+                return sent
+            
+            pending = Notification.query.filter(
+                Notification.digest_pending == True,
+                Notification.user_id.in_(user_ids)
+            ).order_by(Notification.created_at).all()
+            users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+            
+            unread = {}
+            for notification in pending:
+                notification.digest_pending = False
+                if notification.status == NotificationStatus.UNREAD:
+                    unread.setdefault(notification.user_id, []).append(notification)
+            
+            digests = []
+            for user_id, notifications in unread.items():
+                user = users.get(user_id)
+                if user is None or not user.email:
+                    continue
+                digests.append({
+                    'to': user.email,
+                    'subject': f'You have {len(notifications)} new CareBridge notifications',
+                    'template': 'digest',
+                    'context': {
+                        'name': user.first_name,
+                        'notifications': [{
+                            'title': notification.title,
+                            'message': notification.message,
+                            'created_at': notification.created_at.strftime('%Y-%m-%d at %H:%M')
+                        } for notification in notifications]
+                    }
+                })
+            db.session.commit()
+            
+            for digest in digests:
+                job_queue.enqueue('send_email', **digest)
+            sent += len(digests)
+    
     @staticmethod
     def send_notification_to_role(role, type, title, message, resource_type=None, resource_id=None):
         """Send a notification to all users with a specific role"""
         users = User.query.filter_by(role=role).all()
+        preference_cache.prime([user.id for user in users])
         notifications = []
         
         for user in users:
@@ -38,7 +174,8 @@ class NotificationService:
                 resource_type=resource_type,
                 resource_id=resource_id
             )
-            notifications.append(notification)
+            if notification:
+                notifications.append(notification)
         
         return notifications
     
@@ -46,6 +183,7 @@ class NotificationService:
     def send_notification_to_all(type, title, message, resource_type=None, resource_id=None):
         """Send a notification to all users"""
         users = User.query.all()
+        preference_cache.prime([user.id for user in users])
         notifications = []
         
         for user in users:
@@ -57,17 +195,26 @@ class NotificationService:
                 resource_type=resource_type,
                 resource_id=resource_id
             )
-            notifications.append(notification)
+            if notification:
+                notifications.append(notification)
         
         return notifications
     
     @staticmethod
-    def send_appointment_notification(appointment, notification_type, additional_message=None):
-        """Send appointment-related notifications to relevant users"""
+    def send_appointment_notification(appointment, notification_type, additional_message=None, recipient_id=None, commit=True):
+        """Send appointment-related notifications to relevant users
+        
+        If recipient_id is given, only that participant is notified. With
+        commit=False the caller is responsible for committing the batch and
+        then calling emit_pending.
+        """
         # Get the appointment details
         patient = appointment.patient
         doctor = appointment.doctor
         
+        # Load both participants' preferences with a single query
+        preference_cache.prime([patient.id, doctor.id])
+        
         # Determine the notification title and message based on the type
         title_map = {
             NotificationType.APPOINTMENT_CREATED: "New Appointment",
@@ -79,7 +226,7 @@ class NotificationService:
         }
         
         message_map = {
-            NotificationType.APPOINTMENT_CREATED: f"Appointment scheduled with Dr. {doctor.user.last_name} on {appointment.start_time.strftime('%Y-%m-%d at %H:%M')}",
+            NotificationType.APPOINTMENT_CREATED: f"Appointment scheduled with Dr. {doctor.last_name} on {appointment.start_time.strftime('%Y-%m-%d at %H:%M')}",
             NotificationType.APPOINTMENT_UPDATED: f"Your appointment on {appointment.start_time.strftime('%Y-%m-%d at %H:%M')} has been updated",
             NotificationType.APPOINTMENT_CANCELLED: f"Your appointment on {appointment.start_time.strftime('%Y-%m-%d at %H:%M')} has been cancelled",
             NotificationType.APPOINTMENT_CONFIRMED: f"Your appointment on {appointment.start_time.strftime('%Y-%m-%d at %H:%M')} has been confirmed",
@@ -104,24 +251,30 @@ class NotificationService:
             patient_message += f". {additional_message}"
             doctor_message += f". {additional_message}"
         
+        notifications = []
+        
         # Send notification to patient
-        patient_notification = NotificationService.send_notification(
-            user_id=patient.id,
-            type=notification_type,
-            title=title,
-            message=patient_message,
-            resource_type='appointment',
-            resource_id=str(appointment.id)
-        )
+        if recipient_id is None or str(recipient_id) == str(patient.id):
+            notifications.append(NotificationService.send_notification(
+                user_id=patient.id,
+                type=notification_type,
+                title=title,
+                message=patient_message,
+                resource_type='appointment',
+                resource_id=str(appointment.id),
+                commit=commit
+            ))
         
         # Send notification to doctor
-        doctor_notification = NotificationService.send_notification(
-            user_id=doctor.user_id,
-            type=notification_type,
-            title=title,
-            message=doctor_message,
-            resource_type='appointment',
-            resource_id=str(appointment.id)
-        )
+        if recipient_id is None or str(recipient_id) == str(doctor.id):
+            notifications.append(NotificationService.send_notification(
+                user_id=doctor.id,
+                type=notification_type,
+                title=title,
+                message=doctor_message,
+                resource_type='appointment',
+                resource_id=str(appointment.id),
+                commit=commit
+            ))
         
-        return [patient_notification, doctor_notification]
\ No newline at end of file
+        return [notification for notification in notifications if notification]
\ No newline at end of file
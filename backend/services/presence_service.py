@@ -0,0 +1,148 @@
+import time
+
+from extensions import redis_client, socketio
+
+# Refreshes a connection in a room; returns 1 if its user just came online there
+TOUCH_SCRIPT = """
+local was_online = redis.call('ZCOUNT', KEYS[2], '(' .. ARGV[1], '+inf') > 0
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('ZADD', KEYS[1], 'GT', ARGV[2], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('ZADD', KEYS[3], 'GT', ARGV[2], ARGV[6])
+if was_online then
+    return 0
+end
+return 1
+"""
+
+# Drops a connection from a room; returns 1 if its user has no live connection left there
+LEAVE_SCRIPT = """
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+local latest = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+if #latest == 0 then
+    return redis.call('ZREM', KEYS[1], ARGV[3])
+end
+redis.call('ZADD', KEYS[1], latest[2], ARGV[3])
+return 0
+"""
+
+# Removes users whose heartbeats stopped without a disconnect, e.g. because their server died
+SWEEP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+end
+return expired
+"""
+
+class PresenceService:
+    """Tracks which users are online in user and appointment rooms
+    
+    Every room has a sorted set of user IDs scored by when their presence
+    expires, and every user in a room has a sorted set of their connections
+    scored the same way. Heartbeats push the expiry forward, so checking if a
+    user is online is a single ZSCORE and nothing touches the database. Online
+    and offline transitions are emitted to the room as 'presence' events.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.prefix = 'carebridge:presence'
+        self.ttl = 60
+        self._touch = None
+        self._leave = None
+        self._sweep = None
+    
+    def init_app(self, app):
+        self.app = app
+        self.prefix = app.config['PRESENCE_KEY_PREFIX']
+        self.ttl = app.config['PRESENCE_TTL_SECONDS']
+    
+    def join(self, session, room):
+        """Mark a connection as present in a room; returns True if its user just came online there"""
+        session.presence_rooms.add(room)
+        return self._touch_room(session, room, time.time())
+    
+    def heartbeat(self, session):
+        """Keep a connection present in all of its rooms"""
+        now = time.time()
+        for room in list(session.presence_rooms):
+            self._touch_room(session, room, now)
+    
+    def leave(self, session, room):
+        """Remove a connection from a room; returns True if its user has no connection left there"""
+        session.presence_rooms.discard(room)
+        if self._leave is None:
+            self._leave = redis_client.register_script(LEAVE_SCRIPT)
+        went_offline = self._leave(
+            keys=[self._room_key(room), self._connections_key(room, session.user_id)],
+            args=[time.time(), session.sid, session.user_id]
+        )
+        if went_offline:
+            self._publish(room, session.user_id, False)
+        return bool(went_offline)
+    
+    def leave_all(self, session):
+        """Remove a connection from every room, e.g. when it disconnects; returns the rooms its user went offline in"""
+        return [room for room in list(session.presence_rooms) if self.leave(session, room)]
+    
+    def online_users(self, room):
+        """Get the IDs of users online in a room"""
+        return [
+            user_id.decode() for user_id in
+            redis_client.zrangebyscore(self._room_key(room), f'({time.time()}', '+inf')
+        ]
+    
+    def is_online(self, room, user_id):
+        """Check if a user has a live connection in a room"""
+        expires_at = redis_client.zscore(self._room_key(room), str(user_id))
+        return expires_at is not None and expires_at > time.time()
+    
+    def is_user_online(self, user_id):
+        """Check if a user is connected at all"""
+        return self.is_online(str(user_id), user_id)
+    
+    def sweep(self, limit=1000):
+        """Publish offline events for users whose presence expired; returns how many were removed"""
+        if self._sweep is None:
+            self._sweep = redis_client.register_script(SWEEP_SCRIPT)
+        
+        now = time.time()
+        removed = 0
+        rooms_key = self._key('rooms')
+        for room in redis_client.zrange(rooms_key, 0, limit - 1):
+            room = room.decode()
+            for user_id in self._sweep(keys=[self._room_key(room)], args=[now]):
+                self._publish(room, user_id.decode(), False)
+                removed += 1
+        
+        # Forget rooms nobody has been in for a full TTL
+        redis_client.zremrangebyscore(rooms_key, '-inf', now - self.ttl)
+        return removed
+    
+    def _touch_room(self, session, room, now):
+        if self._touch is None:
+            self._touch = redis_client.register_script(TOUCH_SCRIPT)
+        came_online = self._touch(
+            keys=[self._room_key(room), self._connections_key(room, session.user_id), self._key('rooms')],
+            args=[now, now + self.ttl, session.sid, session.user_id, self.ttl * 2, room]
+        )
+        if came_online:
+            self._publish(room, session.user_id, True)
+        return bool(came_online)
+    
+    def _publish(self, room, user_id, online):
+        socketio.emit('presence', {'room': room, 'user_id': user_id, 'online': online}, room=room)
+    
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+    
+    def _room_key(self, room):
+        return f'{self.prefix}:room:{room}'
+    
+    def _connections_key(self, room, user_id):
+        return f'{self.prefix}:room:{room}:user:{user_id}'
+
+presence_service = PresenceService()
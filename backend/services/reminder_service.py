@@ -0,0 +1,115 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import Appointment, AppointmentStatus, AdminSettings, NotificationType
+from services.notification_preferences import preference_cache
+from services.notification_service import NotificationService
+from jobs import job_queue
+
+# Claims a batch of due reminders. The partial index on reminder_due_at only
+# holds appointments that still need a reminder, so this never sweeps the
+# table, and SKIP LOCKED lets concurrent runners take disjoint batches.
+CLAIM_DUE_REMINDERS_SQL = text("""
+    UPDATE appointment
+    SET reminder_sent_at = :now
+    WHERE id IN (
+        SELECT id FROM appointment
+        WHERE reminder_sent_at IS NULL
+          AND reminder_due_at <= :now
+        ORDER BY reminder_due_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+""")
+
+class ReminderService:
+    @staticmethod
+    def send_due_reminders(now=None, batch_size=None):
+        """Send reminders for every appointment whose reminder is due
+        
+        Each appointment is claimed before its reminder is sent, so a reminder
+        goes out at most once even when several runners overlap. Returns the
+        number of appointments reminded.
+        """
+        settings = AdminSettings.get_settings()
+        if not settings.send_appointment_reminders:
+            return 0
+        
+        now = now or datetime.utcnow()
+        batch_size = batch_size or current_app.config['REMINDER_BATCH_SIZE']
+        sent = 0
+        
+        while True:
+            claimed_ids = [row.id for row in db.session.execute(
+                CLAIM_DUE_REMINDERS_SQL,
+                {'now': now, 'batch_size': batch_size}
+            )]
+            
+            if not claimed_ids:
+                db.session.commit()
+                break
+            
+            try:
+                sent += ReminderService._send_batch(claimed_ids, now)
+                
+                # One commit per batch keeps transactions short on the primary
+                db.session.commit()
+            except Exception:
+                NotificationService.discard_pending()
+                raise
+            
+            # Push the batch's notifications only once they are stored
+            NotificationService.emit_pending()
+            
+            if len(claimed_ids) < batch_size:
+                break
+        
+        return sent
+    
+    @staticmethod
+    def _send_batch(appointment_ids, now):
+        """Notify both participants of each claimed appointment"""
+        appointments = Appointment.query.options(
+            joinedload(Appointment.patient),
+            joinedload(Appointment.doctor),
+            joinedload(Appointment.time_slot)
+        ).filter(Appointment.id.in_(appointment_ids)).all()
+        
+        # Load every recipient's preferences with a single query
+        user_ids = set()
+        for appointment in appointments:
+            user_ids.update((appointment.patient_id, appointment.doctor_id))
+        preference_cache.prime(user_ids)
+        
+        sent = 0
+        for appointment in appointments:
+            # Appointments that already started, or are no longer active, are only marked as handled
+            if appointment.start_time is None or appointment.start_time <= now:
+                continue
+            if appointment.status not in (AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED):
+                continue
+            
+            NotificationService.send_appointment_notification(
+                appointment=appointment,
+                notification_type=NotificationType.APPOINTMENT_REMINDER,
+                commit=False
+            )
+            job_queue.enqueue(
+                'send_email',
+                to=appointment.patient.email,
+                subject='Reminder: upcoming CareBridge appointment',
+                template='reminder',
+                context={
+                    'patient_name': appointment.patient.full_name,
+                    'doctor_name': appointment.doctor.full_name,
+                    'start_time': appointment.start_time.strftime('%Y-%m-%d at %H:%M')
+                }
+            )
+            sent += 1
+        
+        return sent
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import text
+
+from extensions import db
+from models import AdminSettings
+
+# Deletes in small batches so a purge never holds long locks on the primary
+PURGE_MESSAGES_SQL = text("""
+    DELETE FROM message
+    WHERE id IN (
+        SELECT id FROM message
+        WHERE created_at < :cutoff
+        LIMIT :batch_size
+    )
+""")
+
+PURGE_FILES_SQL = text("""
+    DELETE FROM file
+    WHERE id IN (
+        SELECT id FROM file
+        WHERE created_at < :cutoff
+          AND NOT EXISTS (SELECT 1 FROM message WHERE message.file_id = file.id)
+        LIMIT :batch_size
+    )
+    RETURNING file_path
+""")
+
+class RetentionService:
+    @staticmethod
+    def purge_expired(now=None, batch_size=1000):
+        """Delete chat messages and files older than the admin retention settings"""
+        settings = AdminSettings.get_settings()
+        now = now or datetime.utcnow()
+        
+        messages_deleted = RetentionService._purge_messages(now - timedelta(days=settings.retention_days_chat), batch_size)
+        files_deleted = RetentionService._purge_files(now - timedelta(days=settings.retention_days_files), batch_size)
+        
+        return messages_deleted, files_deleted
+    
+    @staticmethod
+    def _purge_messages(cutoff, batch_size):
+        deleted = 0
+        while True:
+            result = db.session.execute(PURGE_MESSAGES_SQL, {'cutoff': cutoff, 'batch_size': batch_size})
+            db.session.commit()
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                return deleted
+    
+    @staticmethod
+    def _purge_files(cutoff, batch_size):
+        deleted = 0
+        while True:
+            file_paths = [row.file_path for row in db.session.execute(PURGE_FILES_SQL, {'cutoff': cutoff, 'batch_size': batch_size})]
+            db.session.commit()
+            
+            # Remove the stored files once their rows are gone
+            for file_path in file_paths:
+                try:
+                    os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], file_path))
+                except OSError:
+                    pass
+            
+            deleted += len(file_paths)
+            if len(file_paths) < batch_size:
+                return deleted
@@ -0,0 +1,197 @@
+import time
+from datetime import datetime, timedelta
+
+from extensions import redis_client
+from services.event_bus import event_bus
+
+EPOCH = datetime(1970, 1, 1)
+
+# Holds a period for a patient unless another patient holds time within the buffer of it;
+# returns 1 if the hold was placed. A patient's previous hold is replaced.
+HOLD_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local start, finish, buffer = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+for _, member in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    local held_start, held_end, patient_id = string.match(member, '^(%d+):(%d+):(.+)$')
+    if patient_id ~= ARGV[6] and tonumber(held_start) < finish + buffer and tonumber(held_end) > start - buffer then
+        return 0
+    end
+end
+if ARGV[9] ~= '' and redis.call('GET', KEYS[2]) == ARGV[9] then
+    redis.call('ZREM', KEYS[4], ARGV[10])
+    redis.call('ZREM', KEYS[3], ARGV[9])
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[7])
+redis.call('EXPIRE', KEYS[1], ARGV[11])
+redis.call('SET', KEYS[2], ARGV[8], 'EX', ARGV[11])
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[8])
+return 1
+"""
+
+# Drops a patient's hold, if it is still the one the caller read
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[1], ARGV[2])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return 1
+"""
+
+# Takes the holds that have expired off the expiry schedule
+SWEEP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+end
+return expired
+"""
+
+def _to_seconds(value):
+    return int((value - EPOCH).total_seconds())
+
+def _from_seconds(seconds):
+    return EPOCH + timedelta(seconds=int(seconds))
+
+def _days(start_time, end_time):
+    last = (end_time - timedelta(microseconds=1)).date()
+    return [start_time.date() + timedelta(days=offset) for offset in range((last - start_time.date()).days + 1)]
+
+class SlotHoldService:
+    """Short-lived holds patients put on a slot while they fill in the booking form
+    
+    Every doctor has a sorted set of held periods scored by when the hold
+    expires, and every patient has a key naming their one hold, which expires
+    with it. Placing a hold checks the doctor's other holds, with the buffer
+    time between them, in a single Lua script, so patients racing for a slot
+    are arbitrated by Redis instead of by the database. Availability readers
+    leave held time out, bookings of time someone else holds are refused
+    before the slot is claimed, and expired holds are swept periodically so
+    the availability index hears they are free again.
+    """
+    
+    def __init__(self):
+        self.app = None
+        self.prefix = 'carebridge:holds'
+        self.ttl = 300
+        self._hold = None
+        self._release = None
+        self._sweep = None
+    
+    def init_app(self, app):
+        self.app = app
+        self.prefix = app.config['SLOT_HOLD_KEY_PREFIX']
+        self.ttl = app.config['SLOT_HOLD_SECONDS']
+    
+    def hold(self, doctor_id, patient_id, start_time, end_time, buffer_minutes):
+        """Hold a doctor's period for a patient; returns when the hold expires, or None if someone else holds it"""
+        if self._hold is None:
+            self._hold = redis_client.register_script(HOLD_SCRIPT)
+        
+        now = time.time()
+        member = f'{_to_seconds(start_time)}:{_to_seconds(end_time)}:{patient_id}'
+        entry = f'{doctor_id}|{member}'
+        previous = self._current_entry(patient_id)
+        previous_doctor_id, previous_member = previous.split('|', 1) if previous else (doctor_id, '')
+        held = self._hold(
+            keys=[self._doctor_key(doctor_id), self._patient_key(patient_id), self._key('expiries'), self._doctor_key(previous_doctor_id)],
+            args=[
+                now, now + self.ttl, _to_seconds(start_time), _to_seconds(end_time), buffer_minutes * 60,
+                str(patient_id), member, entry, previous or '', previous_member, self.ttl
+            ]
+        )
+        if not held:
+            return None
+        
+        if previous and previous != entry:
+            self._publish_entry(previous)
+        self._publish(doctor_id, _days(start_time, end_time))
+        return datetime.utcfromtimestamp(now + self.ttl)
+    
+    def release(self, patient_id):
+        """Drop a patient's hold, e.g. once they booked or gave up; returns True if they had one"""
+        if self._release is None:
+            self._release = redis_client.register_script(RELEASE_SCRIPT)
+        
+        try:
+            entry = self._current_entry(patient_id)
+            if not entry:
+                return False
+            doctor_id, member = entry.split('|', 1)
+            if not self._release(keys=[self._doctor_key(doctor_id), self._patient_key(patient_id), self._key('expiries')], args=[entry, member]):
+                return False
+        except Exception as e:
+            self.app.logger.error(f'Error releasing slot hold: {str(e)}')
+            return False
+        self._publish_entry(entry)
+        return True
+    
+    def active(self, doctor_id):
+        """Get a doctor's unexpired holds as [(start_time, end_time, patient_id)]"""
+        try:
+            members = redis_client.zrangebyscore(self._doctor_key(doctor_id), f'({time.time()}', '+inf')
+        except Exception as e:
+            self.app.logger.error(f'Error reading slot holds: {str(e)}')
+            return []
+        holds = []
+        for member in members:
+            start, end, patient_id = member.decode().split(':', 2)
+            holds.append((_from_seconds(start), _from_seconds(end), patient_id))
+        return holds
+    
+    def held_by_other(self, doctor_id, patient_id, start_time, end_time, buffer_minutes):
+        """Check if another patient holds time within the buffer of a period"""
+        buffer = timedelta(minutes=buffer_minutes)
+        return any(
+            holder != str(patient_id) and start < end_time + buffer and end > start_time - buffer
+            for start, end, holder in self.active(doctor_id)
+        )
+    
+    def sweep(self, limit=1000):
+        """Forget expired holds and announce their time as free again; returns how many were removed"""
+        if self._sweep is None:
+            self._sweep = redis_client.register_script(SWEEP_SCRIPT)
+        
+        now = time.time()
+        expired = [entry.decode() for entry in self._sweep(keys=[self._key('expiries')], args=[now, limit])]
+        if not expired:
+            return 0
+        
+        pipe = redis_client.pipeline()
+        for doctor_id in {entry.split('|', 1)[0] for entry in expired}:
+            pipe.zremrangebyscore(self._doctor_key(doctor_id), '-inf', now)
+        pipe.execute()
+        for entry in expired:
+            self._publish_entry(entry)
+        return len(expired)
+    
+    def _current_entry(self, patient_id):
+        entry = redis_client.get(self._patient_key(patient_id))
+        return entry.decode() if entry else None
+    
+    def _publish_entry(self, entry):
+        doctor_id, member = entry.split('|', 1)
+        start, end, _ = member.split(':', 2)
+        self._publish(doctor_id, _days(_from_seconds(start), _from_seconds(end)))
+    
+    def _publish(self, doctor_id, days):
+        """Tell availability indexes which days of a doctor changed"""
+        try:
+            event_bus.publish('availability', 'availability_changed', {
+                'doctor_id': str(doctor_id),
+                'days': sorted({day.isoformat() for day in days})
+            })
+        except Exception as e:
+            self.app.logger.error(f'Error publishing availability change: {str(e)}')
+    
+    def _doctor_key(self, doctor_id):
+        return self._key(f'doctor:{doctor_id}')
+    
+    def _patient_key(self, patient_id):
+        return self._key(f'patient:{patient_id}')
+    
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+
+slot_holds = SlotHoldService()
@@ -0,0 +1,157 @@
+import time
+import uuid
+from functools import wraps
+
+from flask import request
+from flask_jwt_extended import decode_token
+from flask_socketio import disconnect
+from sqlalchemy import or_
+
+from extensions import socketio
+from models.appointment import Appointment, AppointmentStatus
+from models.user import User
+from services.event_bus import event_bus
+
+# Appointments whose rooms a participant may still join
+OPEN_APPOINTMENT_STATUSES = (AppointmentStatus.PENDING, AppointmentStatus.CONFIRMED)
+
+class SocketSession:
+    """Identity and room permissions of one authenticated Socket.IO connection"""
+    
+    def __init__(self, sid, user_id, role, name, expires_at, appointment_ids):
+        self.sid = sid
+        self.user_id = user_id
+        self.role = role
+        self.name = name
+        self.expires_at = expires_at
+        self.appointment_ids = appointment_ids
+        self.presence_rooms = set()
+    
+    @property
+    def user_room(self):
+        return self.user_id
+    
+    @property
+    def expired(self):
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+class SocketSessionRegistry:
+    """Per-process registry of authenticated Socket.IO connections, keyed by sid
+    
+    The access token is checked once on connect, and the appointments the user
+    takes part in are loaded with it. Later events read the session from memory
+    instead of decoding the token and querying the user on every event. When an
+    appointment closes, close_appointment announces it on the event bus and
+    every process drops it from its sessions.
+    """
+    
+    def __init__(self):
+        self._sessions = {}
+        self._listening = False
+    
+    def open(self, sid, token):
+        """Validate an access token and register the connection; returns None if it is not valid"""
+        try:
+            claims = decode_token(token)
+        except Exception:
+            return None
+        if claims.get('type') != 'access':
+            return None
+        
+        user = User.query.with_entities(User.id, User.first_name, User.last_name, User.role, User.is_active) \
+            .filter(User.id == claims['sub']).first()
+        if not user or not user.is_active:
+            return None
+        
+        appointment_ids = {
+            str(appointment_id) for (appointment_id,) in Appointment.query.with_entities(Appointment.id).filter(
+                or_(Appointment.patient_id == user.id, Appointment.doctor_id == user.id),
+                Appointment.status.in_(OPEN_APPOINTMENT_STATUSES)
+            )
+        }
+        
+        session = SocketSession(
+            sid=sid,
+            user_id=str(user.id),
+            role=user.role,
+            name=f'{user.first_name} {user.last_name}',
+            expires_at=claims.get('exp'),
+            appointment_ids=appointment_ids
+        )
+        self._sessions[sid] = session
+        self._ensure_listener()
+        return session
+    
+    def get(self, sid):
+        return self._sessions.get(sid)
+    
+    def close(self, sid):
+        return self._sessions.pop(sid, None)
+    
+    def current(self):
+        """Get the session of the connection handling the current event"""
+        return self._sessions.get(request.sid)
+    
+    def can_access_appointment(self, session, appointment_id):
+        """Check if the user takes part in an appointment, hitting the database only for appointments booked after connecting"""
+        appointment_id = str(appointment_id)
+        if appointment_id in session.appointment_ids:
+            return True
+        
+        try:
+            uuid.UUID(appointment_id)
+        except ValueError:
+            return False
+        
+        allowed = Appointment.query.with_entities(Appointment.id).filter(
+            Appointment.id == appointment_id,
+            or_(Appointment.patient_id == session.user_id, Appointment.doctor_id == session.user_id),
+            Appointment.status.in_(OPEN_APPOINTMENT_STATUSES)
+        ).first() is not None
+        if allowed:
+            session.appointment_ids.add(appointment_id)
+        return allowed
+    
+    @staticmethod
+    def close_appointment(appointment_id):
+        """Revoke access to a cancelled or finished appointment's rooms in every process"""
+        event_bus.publish('socket_acl', 'appointment_closed', {'appointment_id': str(appointment_id)})
+    
+    def _ensure_listener(self):
+        if self._listening:
+            return
+        self._listening = True
+        socketio.start_background_task(self._listen)
+    
+    def _listen(self):
+        """Drop the appointments other processes announce as closed from every session"""
+        subscription = event_bus.subscribe('socket_acl')
+        while True:
+            item = subscription.get(timeout=5)
+            if subscription.overflowed:
+                # Some closures were missed, so check every appointment against the database again
+                event_bus.unsubscribe(subscription)
+                for session in list(self._sessions.values()):
+                    session.appointment_ids.clear()
+                subscription = event_bus.subscribe('socket_acl')
+                continue
+            if item is not None:
+                _, _, data = item
+                for session in list(self._sessions.values()):
+                    session.appointment_ids.discard(data['appointment_id'])
+
+socket_sessions = SocketSessionRegistry()
+
+def socket_auth_required(f):
+    """Only run a Socket.IO handler for an authenticated, unexpired connection"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        session = socket_sessions.current()
+        if session is None:
+            return
+        if session.expired:
+            socket_sessions.close(session.sid)
+            disconnect()
+            return
+        return f(*args, **kwargs)
+    return decorated
@@ -0,0 +1,110 @@
+import base64
+import hashlib
+import hmac
+import threading
+import time
+
+from flask import current_app
+
+from extensions import socketio
+
+def call_room(appointment_id):
+    """Get the room of an appointment's call, kept apart from its chat room so hanging up leaves the chat open"""
+    return f'call_{appointment_id}'
+
+def turn_credentials(secret, user_id, ttl, now=None):
+    """Mint a time-limited TURN username and password
+    
+    Follows the TURN REST API convention coturn checks with use-auth-secret:
+    the username is the expiry timestamp and the user ID, and the password is
+    the base64 HMAC-SHA1 of the username keyed with the shared secret, so the
+    TURN server can verify it without calling back into the API.
+    """
+    expires_at = int(now or time.time()) + ttl
+    username = f'{expires_at}:{user_id}'
+    digest = hmac.new(secret.encode(), username.encode(), hashlib.sha1).digest()
+    return username, base64.b64encode(digest).decode(), expires_at
+
+def build_ice_servers(config, user_id, now=None):
+    """Get the ICE server list for a user and when it stops being valid"""
+    ice_servers = [{'urls': url} for url in config['CAREBRIDGE_STUN_SERVERS'] if url]
+    expires_at = None
+    
+    turn_server = config.get('CAREBRIDGE_TURN_SERVER')
+    if turn_server and config.get('CAREBRIDGE_TURN_SECRET'):
+        username, credential, expires_at = turn_credentials(
+            config['CAREBRIDGE_TURN_SECRET'], user_id, config['CAREBRIDGE_TURN_CREDENTIAL_TTL'], now
+        )
+        ice_servers.append({'urls': turn_server, 'username': username, 'credential': credential})
+    elif turn_server and config.get('CAREBRIDGE_TURN_USERNAME'):
+        ice_servers.append({
+            'urls': turn_server,
+            'username': config['CAREBRIDGE_TURN_USERNAME'],
+            'credential': config['CAREBRIDGE_TURN_CREDENTIAL']
+        })
+    return ice_servers, expires_at
+
+def ice_servers_for(session, now=None):
+    """Get the ICE servers of a socket session, minting new TURN credentials only when the cached ones are running out"""
+    now = now or time.time()
+    cached = getattr(session, 'ice_servers', None)
+    if cached is not None:
+        ice_servers, expires_at = cached
+        # Hand out credentials with at least half their lifetime left, so a long call can still renegotiate
+        if expires_at is None or expires_at - now > current_app.config['CAREBRIDGE_TURN_CREDENTIAL_TTL'] / 2:
+            return ice_servers
+    
+    ice_servers, expires_at = build_ice_servers(current_app.config, session.user_id, now)
+    session.ice_servers = (ice_servers, expires_at)
+    return ice_servers
+
+class IceCandidateBatcher:
+    """Relays trickled ICE candidates in short batches
+    
+    Browsers emit a burst of candidates right after setLocalDescription. The
+    first candidate from a connection opens a window, anything gathered
+    during it is queued, and the whole batch goes to the room as one event.
+    """
+    
+    def __init__(self):
+        self._pending = {}  # (sid, appointment_id) -> batch
+        self._lock = threading.Lock()
+    
+    def add(self, sid, appointment_id, user_id, candidate, window_seconds):
+        key = (sid, appointment_id)
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is not None:
+                batch['candidates'].append(candidate)
+                return
+            self._pending[key] = {'user_id': user_id, 'candidates': [candidate]}
+        
+        if window_seconds <= 0:
+            self.flush(key)
+        else:
+            socketio.start_background_task(self._flush_later, key, window_seconds)
+    
+    def _flush_later(self, key, window_seconds):
+        socketio.sleep(window_seconds)
+        self.flush(key)
+    
+    def flush(self, key):
+        with self._lock:
+            batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        
+        sid, appointment_id = key
+        socketio.emit('webrtc:ice-candidates', {
+            'roomId': appointment_id,
+            'userId': batch['user_id'],
+            'candidates': batch['candidates']
+        }, room=call_room(appointment_id), skip_sid=sid)
+    
+    def discard(self, sid):
+        """Forget the unsent candidates of a connection that went away"""
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == sid]:
+                del self._pending[key]
+
+ice_candidate_batcher = IceCandidateBatcher()
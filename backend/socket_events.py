@@ -1,70 +1,106 @@
-from flask_socketio import emit, join_room, leave_room
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import uuid
+from datetime import datetime
+
+from flask import request
+from flask_socketio import emit, join_room, leave_room, ConnectionRefusedError
 from extensions import socketio, db
-from models import User, Notification, NotificationStatus
+from models import Notification, NotificationStatus
+from services.socket_sessions import socket_sessions, socket_auth_required
+from services.presence_service import presence_service
+from services.consultation_service import ConsultationService
+from services.webrtc_service import ice_candidate_batcher
+
+def _connect_token(auth):
+    """Get the access token from the Socket.IO auth payload, or from the Authorization header"""
+    if isinstance(auth, dict) and auth.get('token'):
+        return auth['token']
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):]
+    return request.args.get('token')
 
 # Socket.IO event handlers for notifications
 @socketio.on('connect')
-def handle_connect():
-    """Handle client connection"""
-    # This is a placeholder for any connection setup logic
-    pass
+def handle_connect(auth=None):
+    """Authenticate the client once and join its user room"""
+    token = _connect_token(auth)
+    session = socket_sessions.open(request.sid, token) if token else None
+    if session is None:
+        raise ConnectionRefusedError('unauthorized')
+    
+    join_room(session.user_room)
+    presence_service.join(session, session.user_room)
+    emit('room_joined', {'room': session.user_room})
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    """Handle client disconnection"""
-    # This is a placeholder for any disconnection cleanup logic
-    pass
+    """Forget the connection's session and take it out of presence and calls"""
+    ice_candidate_batcher.discard(request.sid)
+    session = socket_sessions.close(request.sid)
+    if not session:
+        return
+    
+    # A dropped connection leaves any call its user is no longer connected to
+    for room in presence_service.leave_all(session):
+        if room.startswith('call_'):
+            ConsultationService.leave(room[len('call_'):], session.user_id, session.name, session.role)
+
+@socketio.on('presence_heartbeat')
+@socket_auth_required
+def on_presence_heartbeat():
+    """Keep the connection marked online in its rooms"""
+    presence_service.heartbeat(socket_sessions.current())
 
 @socketio.on('join_user_room')
-@jwt_required()
+@socket_auth_required
 def on_join_user_room():
     """Join a room specific to the user for receiving notifications"""
-    current_user_id = get_jwt_identity()
-    if not current_user_id:
-        return
+    session = socket_sessions.current()
     
-    # Join a room named after the user's ID
-    join_room(str(current_user_id))
-    emit('room_joined', {'room': str(current_user_id)}, room=str(current_user_id))
+    # Clients are put in their room on connect, this keeps older clients working
+    join_room(session.user_room)
+    presence_service.join(session, session.user_room)
+    emit('room_joined', {'room': session.user_room})
 
 @socketio.on('leave_user_room')
-@jwt_required()
+@socket_auth_required
 def on_leave_user_room():
     """Leave the user-specific room"""
-    current_user_id = get_jwt_identity()
-    if not current_user_id:
-        return
-    
-    # Leave the room
-    leave_room(str(current_user_id))
+    session = socket_sessions.current()
+    leave_room(session.user_room)
+    presence_service.leave(session, session.user_room)
 
 @socketio.on('mark_notification_read')
-@jwt_required()
+@socket_auth_required
 def on_mark_notification_read(data):
     """Mark a notification as read via socket.io"""
-    current_user_id = get_jwt_identity()
-    notification_id = data.get('notification_id')
+    session = socket_sessions.current()
+    notification_id = (data or {}).get('notification_id')
     
     if not notification_id:
         return
+    try:
+        uuid.UUID(str(notification_id))
+    except ValueError:
+        return
     
-    # Find the notification
-    notification = Notification.query.filter_by(
-        id=notification_id, 
-        user_id=current_user_id
-    ).first()
+    # Scoping the update to the user's own notifications is the authorization check
+    updated = Notification.query.filter_by(
+        id=notification_id,
+        user_id=session.user_id
+    ).update({
+        'status': NotificationStatus.READ,
+        'read_at': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
     
-    if not notification:
+    if not updated:
         return
     
-    # Mark as read
-    notification.mark_as_read()
-    
     # Emit an event back to confirm
     emit('notification_marked_read', {
-        'notification_id': str(notification.id)
-    }, room=str(current_user_id))
+        'notification_id': str(notification_id)
+    }, room=session.user_room)
 
 # Register socket events with Flask app
 def register_socket_events(app):
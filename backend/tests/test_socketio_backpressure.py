@@ -0,0 +1,77 @@
+import json
+import queue
+
+import pytest
+from engineio import packet as eio_packet
+from flask import Flask
+from flask_socketio import SocketIO
+
+from utils.socketio_backpressure import COALESCE, enable_backpressure, _outbound_queue_factory
+
+def make_queue():
+    return _outbound_queue_factory(queue.Queue)()
+
+def test_coalesced_packet_is_skipped_without_being_modified():
+    outbound = make_queue()
+    older = eio_packet.Packet(eio_packet.MESSAGE, '2["typing",{"room":"a","typing":true}]')
+    outbound.put(older)
+    outbound.track_last(('typing', 'a'))
+    
+    assert outbound.supersede(('typing', 'a'))
+    newer = eio_packet.Packet(eio_packet.MESSAGE, '2["typing",{"room":"a","typing":false}]')
+    outbound.put(newer)
+    
+    assert outbound.get(block=False) is newer
+    assert older.data == '2["typing",{"room":"a","typing":true}]'
+    assert outbound.qsize() == 0
+    assert outbound.queued_bytes == 0
+
+def test_discard_all_empties_the_backlog():
+    outbound = make_queue()
+    for number in range(100):
+        outbound.put(eio_packet.Packet(eio_packet.MESSAGE, f'2["message",{number}]'))
+    outbound.discard_all(queue.Empty)
+    assert outbound.qsize() == 0
+    assert outbound.queued_bytes == 0
+    outbound.join()  # Every discarded packet was marked as done
+
+@pytest.fixture
+def server():
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='threading', monitor_clients=False, ping_interval=1)
+    enable_backpressure(
+        socketio.server,
+        policies={'typing': COALESCE},
+        soft_limit_bytes=1024,
+        max_bytes=4096,
+        max_packets=100,
+        metrics_interval=1
+    )
+    socketio.server.test_client = app.test_client()
+    return socketio.server
+
+def test_connecting_starts_the_metrics_publisher(server, monkeypatch):
+    started = []
+    start_background_task = server.start_background_task
+    
+    def record_task(target, *args, **kwargs):
+        if target == server._publish_metrics_loop:
+            started.append(args)
+            return None
+        return start_background_task(target, *args, **kwargs)
+    monkeypatch.setattr(server, 'start_background_task', record_task)
+    server.backpressure['publish'] = lambda snapshot: None
+    
+    response = server.test_client.get('/socket.io/?EIO=4&transport=polling')
+    assert response.status_code == 200
+    assert len(started) == 1
+
+def test_slow_connection_is_dropped_and_its_backlog_freed(server):
+    response = server.test_client.get('/socket.io/?EIO=4&transport=polling')
+    sid = json.loads(response.get_data(as_text=True)[1:])['sid']
+    eio_socket = server.eio.sockets[sid]
+    
+    server._drop_connection(sid)
+    assert sid not in server.eio.sockets
+    assert eio_socket.closed
+    assert eio_socket.queue.queued_bytes == 0
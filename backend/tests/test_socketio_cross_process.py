@@ -0,0 +1,108 @@
+"""Socket.IO events reach clients on every server process through the Redis message queue
+
+Starts two server processes configured the way app.py configures the API
+(gevent, RedisManager on a shared channel), connects a client to each, then
+emits from the test process the way the job worker does. Skipped when no
+Redis is reachable at REDIS_URL.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+import redis
+from socketio import RedisManager
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+def serve(port, channel):
+    from gevent import monkey
+    monkey.patch_all()
+    
+    from flask import Flask, request
+    from flask_socketio import SocketIO, emit, join_room
+    
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='gevent', client_manager=RedisManager(REDIS_URL, channel=channel))
+    
+    @socketio.on('connect')
+    def on_connect():
+        join_room(request.args['room'])
+        emit('room_joined', {'room': request.args['room']})
+    
+    socketio.run(app, host='127.0.0.1', port=port)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+@pytest.fixture
+def channel():
+    try:
+        redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1).ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip(f'Redis is not available at {REDIS_URL}')
+    return f'carebridge-socketio-test-{uuid.uuid4().hex}'
+
+@pytest.fixture
+def server_ports(channel):
+    ports = [free_port(), free_port()]
+    servers = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), str(port), channel])
+        for port in ports
+    ]
+    try:
+        for port in ports:
+            wait_for_port(port)
+        yield ports
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+def test_emit_reaches_clients_on_every_server_process(channel, server_ports):
+    import socketio as socketio_client
+    
+    received = {port: [] for port in server_ports}
+    joined = {port: threading.Event() for port in server_ports}
+    clients = []
+    try:
+        for port in server_ports:
+            client = socketio_client.Client()
+            client.on('room_joined', lambda data, port=port: joined[port].set())
+            client.on('notification', lambda data, port=port: received[port].append(data))
+            client.connect(f'http://127.0.0.1:{port}?room=room-{port}', transports=['websocket'])
+            clients.append(client)
+        for port, event in joined.items():
+            assert event.wait(5), f'Client on port {port} never joined its room'
+        
+        # Published only, like the job worker does
+        manager = RedisManager(REDIS_URL, channel=channel, write_only=True)
+        for port in server_ports:
+            manager.emit('notification', {'port': port}, room=f'room-{port}')
+        
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not all(received.values()):
+            time.sleep(0.01)
+        assert received == {port: [{'port': port}] for port in server_ports}
+    finally:
+        for client in clients:
+            client.disconnect()
+
+if __name__ == '__main__':
+    serve(int(sys.argv[1]), sys.argv[2])
@@ -0,0 +1,48 @@
+import base64
+import json
+
+import msgpack
+import pytest
+from flask import Flask
+from flask_socketio import SocketIO
+
+from utils.socketio_serializer import enable_serializer_negotiation
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    # A short ping interval lets the per-connection ping threads finish soon after the test
+    socketio = SocketIO(app, async_mode='threading', monitor_clients=False, ping_interval=1)
+    enable_serializer_negotiation(socketio.server)
+    return app.test_client()
+
+def open_session(client, query=''):
+    """Open an Engine.IO long-polling session; returns its sid"""
+    response = client.get(f'/socket.io/?EIO=4&transport=polling{query}')
+    assert response.status_code == 200
+    return json.loads(response.get_data(as_text=True)[1:])['sid']
+
+def send(client, sid, payload):
+    assert client.post(f'/socket.io/?EIO=4&transport=polling&sid={sid}', data=payload).status_code == 200
+
+def receive(client, sid):
+    """Get the first Engine.IO packet waiting for a session"""
+    payload = client.get(f'/socket.io/?EIO=4&transport=polling&sid={sid}').get_data(as_text=True)
+    return payload.split('\x1e')[0]
+
+def test_msgpack_connection_gets_binary_packets(client):
+    sid = open_session(client, '&serializer=msgpack')
+    send(client, sid, 'b' + base64.b64encode(msgpack.dumps({'type': 0, 'nsp': '/', 'data': None})).decode())
+    
+    # Long-polling carries binary messages base64 encoded behind a 'b'
+    packet = receive(client, sid)
+    assert packet.startswith('b')
+    decoded = msgpack.loads(base64.b64decode(packet[1:]))
+    assert decoded['type'] == 0
+    assert decoded['nsp'] == '/'
+    assert 'sid' in decoded['data']
+
+def test_json_connection_gets_text_packets(client):
+    sid = open_session(client)
+    send(client, sid, '40')
+    assert receive(client, sid).startswith('40{"sid":')
@@ -0,0 +1,10 @@
+from datetime import datetime, timezone
+
+def parse_utc(value):
+    """Parse an ISO datetime as naive UTC, converting one that carries an offset or a Z suffix"""
+    if isinstance(value, str) and value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
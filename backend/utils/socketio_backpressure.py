@@ -0,0 +1,244 @@
+import json
+import os
+import socket
+import threading
+from collections import Counter
+
+from socketio import packet
+
+from utils.socketio_serializer import NegotiatedPacket, NegotiatingServer, upgrade_server_class
+
+# What to do with an event when the client's outbound queue is backed up
+KEEP = 'keep'  # Always queue; disconnect the client once the hard limit is hit
+COALESCE = 'coalesce'  # Replace a still-queued event with the same key by the newest one
+DROP = 'drop'  # Skip the event while the queue is over its soft limit
+
+def _packet_size(pkt):
+    data = pkt.data if pkt is not None else None
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    return 0
+
+class OutboundQueueMixin:
+    """Keeps count of the bytes waiting in an Engine.IO socket's outbound queue
+    
+    Queued packets can also be registered under a coalesce key. When a newer
+    event of the same kind is queued, the older one is marked as superseded
+    and skipped by the writer when it reaches it, so the client only gets the
+    newest state. Queued packets are never modified, since the writer may be
+    encoding one of them at the time.
+    """
+    
+    def init_accounting(self):
+        self.queued_bytes = 0
+        self.last_put = None
+        self.pending = {}  # coalesce key -> queued Engine.IO packet
+        self.superseded = set()  # ids of queued packets the writer skips
+        self.over_limit = False
+    
+    def put(self, item, *args, **kwargs):
+        self.queued_bytes += _packet_size(item)
+        self.last_put = item
+        return super().put(item, *args, **kwargs)
+    
+    def get(self, *args, **kwargs):
+        while True:
+            item = super().get(*args, **kwargs)
+            self._forget(item)
+            if id(item) not in self.superseded:
+                return item
+            # A newer packet with the same key is queued behind this one
+            self.superseded.discard(id(item))
+            self.task_done()
+    
+    def supersede(self, key):
+        """Mark the queued packet with a coalesce key as skipped; returns False if none is queued"""
+        pending = self.pending.pop(key, None)
+        if pending is None:
+            return False
+        self.superseded.add(id(pending))
+        return True
+    
+    def track_last(self, key):
+        if self.last_put is not None:
+            self.pending[key] = self.last_put
+    
+    def discard_all(self, empty_exception):
+        """Throw away everything still queued, so it can be freed before the connection closes"""
+        while True:
+            try:
+                item = super().get(block=False)
+            except empty_exception:
+                break
+            self._forget(item)
+            self.task_done()
+        self.pending.clear()
+        self.superseded.clear()
+    
+    def _forget(self, item):
+        self.queued_bytes = max(0, self.queued_bytes - _packet_size(item))
+        if self.pending:
+            for key, pending in list(self.pending.items()):
+                if pending is item:
+                    del self.pending[key]
+
+_queue_classes = {}
+
+def _outbound_queue_factory(base_class):
+    queue_class = _queue_classes.get(base_class)
+    if queue_class is None:
+        queue_class = _queue_classes[base_class] = type('OutboundQueue', (OutboundQueueMixin, base_class), {})
+    
+    def create_queue(*args, **kwargs):
+        queue = queue_class(*args, **kwargs)
+        queue.init_accounting()
+        return queue
+    return create_queue
+
+class SocketMetrics:
+    """Backpressure counters for one server process"""
+    
+    def __init__(self):
+        self.dropped = Counter()
+        self.coalesced = Counter()
+        self.backpressure_disconnects = 0
+        self._lock = threading.Lock()
+    
+    def count_dropped(self, event):
+        with self._lock:
+            self.dropped[event] += 1
+    
+    def count_coalesced(self, event):
+        with self._lock:
+            self.coalesced[event] += 1
+    
+    def count_disconnect(self):
+        with self._lock:
+            self.backpressure_disconnects += 1
+    
+    def snapshot(self, eio_server):
+        queues = [s.queue for s in list(eio_server.sockets.values()) if isinstance(s.queue, OutboundQueueMixin)]
+        with self._lock:
+            return {
+                'connections': len(queues),
+                'queued_bytes': sum(queue.queued_bytes for queue in queues),
+                'max_queued_bytes': max((queue.queued_bytes for queue in queues), default=0),
+                'queued_packets': sum(queue.qsize() for queue in queues),
+                'dropped': dict(self.dropped),
+                'coalesced': dict(self.coalesced),
+                'backpressure_disconnects': self.backpressure_disconnects
+            }
+
+class BackpressureServer(NegotiatingServer):
+    """Socket.IO server with bounded outbound queues per connection
+    
+    Events are handled according to their policy: coalesced events keep only
+    the newest state per key while it is still queued, droppable events are
+    skipped once a connection is over its soft limit, and a connection that
+    reaches the hard limit on anything else is disconnected. It reconnects
+    and catches up from the last message seq it saw.
+    """
+    
+    def _send_packet(self, eio_sid, pkt):
+        settings = self.__dict__.get('backpressure')
+        queue = self._outbound_queue(eio_sid)
+        if settings is None or queue is None:
+            return super()._send_packet(eio_sid, pkt)
+        if queue.over_limit:
+            return
+        
+        event = pkt.data[0] if pkt.packet_type in (packet.EVENT, packet.BINARY_EVENT) and pkt.data else None
+        policy = settings['policies'].get(event, KEEP)
+        
+        if policy == DROP and queue.queued_bytes >= settings['soft_limit_bytes']:
+            self.backpressure_metrics.count_dropped(event)
+            return
+        
+        key = self._coalesce_key(event, pkt.data) if policy == COALESCE and pkt.packet_type == packet.EVENT else None
+        if key is not None and queue.supersede(key):
+            self.backpressure_metrics.count_coalesced(event)
+        
+        if queue.queued_bytes >= settings['max_bytes'] or queue.qsize() >= settings['max_packets']:
+            queue.over_limit = True
+            self.backpressure_metrics.count_disconnect()
+            self.logger.warning('Disconnecting %s: %d bytes queued for a slow client', eio_sid, queue.queued_bytes)
+            # Disconnect outside of the current emit, which may still be iterating the room
+            self.start_background_task(self._drop_connection, eio_sid)
+            return
+        
+        super()._send_packet(eio_sid, pkt)
+        if key is not None:
+            queue.track_last(key)
+    
+    def _drop_connection(self, eio_sid):
+        eio_socket = self.eio.sockets.pop(eio_sid, None)
+        if eio_socket is None:
+            return
+        # Empty the backlog first, since closing only queues a stop marker behind it
+        if isinstance(eio_socket.queue, OutboundQueueMixin):
+            eio_socket.queue.discard_all(self.eio.get_queue_empty_exception())
+        eio_socket.close(wait=False, abort=True)
+    
+    def _handle_eio_connect(self, eio_sid, environ):
+        self._start_metrics_publisher()
+        return super()._handle_eio_connect(eio_sid, environ)
+    
+    def _outbound_queue(self, eio_sid):
+        eio_socket = self.eio.sockets.get(eio_sid)
+        if eio_socket is None or not isinstance(eio_socket.queue, OutboundQueueMixin):
+            return None
+        return eio_socket.queue
+    
+    @staticmethod
+    def _coalesce_key(event, data):
+        payload = data[1] if len(data) > 1 else None
+        if isinstance(payload, dict):
+            return (event, payload.get('room'), payload.get('appointment_id'), payload.get('user_id'))
+        return (event,)
+    
+    def _start_metrics_publisher(self):
+        settings = self.__dict__.get('backpressure')
+        if settings is None or settings['publish'] is None or self.__dict__.get('_metrics_started'):
+            return
+        self.__dict__['_metrics_started'] = True
+        self.start_background_task(self._publish_metrics_loop, settings['publish'], settings['metrics_interval'])
+    
+    def _publish_metrics_loop(self, publish, interval):
+        while True:
+            self.sleep(interval)
+            try:
+                publish(self.backpressure_metrics.snapshot(self.eio))
+            except Exception as e:
+                self.logger.error(f'Error publishing socket metrics: {str(e)}')
+
+def enable_backpressure(server, policies, soft_limit_bytes, max_bytes, max_packets, publish=None, metrics_interval=10):
+    """Bound the outbound queue of every connection to an already configured server"""
+    server.backpressure = {
+        'policies': policies,
+        'soft_limit_bytes': soft_limit_bytes,
+        'max_bytes': max_bytes,
+        'max_packets': max_packets,
+        'publish': publish,
+        'metrics_interval': metrics_interval
+    }
+    server.backpressure_metrics = SocketMetrics()
+    server.packet_class = NegotiatedPacket
+    server.eio.create_queue = _outbound_queue_factory(server.eio._async['queue'])
+    upgrade_server_class(server, BackpressureServer)
+
+def redis_metrics_publisher(redis, prefix, ttl):
+    """Publish each process's metrics snapshot to its own expiring Redis key"""
+    key = f'{prefix}:{socket.gethostname()}:{os.getpid()}'
+    
+    def publish(snapshot):
+        redis.set(key, json.dumps(snapshot), ex=ttl)
+    return publish
+
+def collect_metrics(redis, prefix):
+    """Get the latest metrics snapshot of every live server process"""
+    snapshots = {}
+    for key in redis.scan_iter(match=f'{prefix}:*'):
+        payload = redis.get(key)
+        if payload:
+            snapshots[key.decode()[len(prefix) + 1:]] = json.loads(payload)
+    return snapshots
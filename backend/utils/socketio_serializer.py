@@ -0,0 +1,96 @@
+from urllib.parse import parse_qs
+
+import socketio
+from socketio import packet
+
+try:
+    import msgpack
+    from socketio.msgpack_packet import MsgPackPacket
+except ImportError:  # MessagePack support is optional
+    msgpack = None
+    MsgPackPacket = None
+
+# Packet types that only exist in the JSON format, for events carrying binary attachments
+JSON_ONLY_PACKET_TYPES = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}
+
+def msgpack_available():
+    return msgpack is not None
+
+class NegotiatedPacket(packet.Packet):
+    """Socket.IO packet that decodes either JSON or MessagePack
+    
+    MessagePack packets always arrive as bytes. JSON connections also send
+    bytes, but only as attachments of a binary event, which the server hands
+    to the pending packet before it ever builds a new one, so any bytes
+    decoded here are MessagePack.
+    """
+    
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, bytes) and MsgPackPacket is not None:
+            decoded = msgpack.loads(encoded_packet)
+            self.packet_type = decoded['type']
+            self.data = decoded.get('data')
+            self.id = decoded.get('id')
+            self.namespace = decoded['nsp']
+            return 0
+        return super().decode(encoded_packet)
+
+class NegotiatingServer(socketio.Server):
+    """Socket.IO server that picks the packet format for each connection
+    
+    Clients ask for MessagePack with ?serializer=msgpack in the connection URL,
+    everyone else gets the default JSON format. Each packet is encoded in the
+    format of the connection it goes to, so rooms can mix both kinds of client.
+    """
+    
+    def _handle_eio_connect(self, eio_sid, environ):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if self.__dict__.get('msgpack_enabled') and query.get('serializer', [None])[0] == 'msgpack':
+            self._msgpack_sids.add(eio_sid)
+        return super()._handle_eio_connect(eio_sid, environ)
+    
+    def _handle_eio_disconnect(self, eio_sid):
+        try:
+            return super()._handle_eio_disconnect(eio_sid)
+        finally:
+            self._msgpack_sids.discard(eio_sid)
+    
+    def _send_packet(self, eio_sid, pkt):
+        if eio_sid not in self._msgpack_sids:
+            return super()._send_packet(eio_sid, pkt)
+        self.eio.send(eio_sid, self._msgpack_packet(pkt).encode())
+    
+    @staticmethod
+    def _msgpack_packet(pkt):
+        return MsgPackPacket(
+            JSON_ONLY_PACKET_TYPES.get(pkt.packet_type, pkt.packet_type),
+            data=pkt.data,
+            namespace=pkt.namespace,
+            id=pkt.id
+        )
+    
+    @property
+    def _msgpack_sids(self):
+        sids = self.__dict__.get('_msgpack_sid_set')
+        if sids is None:
+            sids = self.__dict__['_msgpack_sid_set'] = set()
+        return sids
+
+def upgrade_server_class(server, server_class):
+    """Give an already configured server the behaviour of a socketio.Server subclass
+    
+    Flask-SocketIO always builds a plain socketio.Server, and its constructor
+    bound the Engine.IO event handlers to that class's methods, so they are
+    registered again to reach the subclass overrides.
+    """
+    if not isinstance(server, server_class):
+        server.__class__ = server_class
+    server.eio.on('connect', server._handle_eio_connect)
+    server.eio.on('message', server._handle_eio_message)
+    server.eio.on('disconnect', server._handle_eio_disconnect)
+
+def enable_serializer_negotiation(server):
+    """Switch an already configured server to per-connection packet formats"""
+    server.packet_class = NegotiatedPacket
+    server.msgpack_enabled = True
+    upgrade_server_class(server, NegotiatingServer)
@@ -0,0 +1,22 @@
+import argparse
+import os
+
+# Workers run jobs in plain threads and only publish Socket.IO events for the API processes to deliver
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
+os.environ.setdefault('SOCKETIO_WRITE_ONLY', 'True')
+
+from app import create_app
+from jobs.worker import Worker
+
+def main():
+    parser = argparse.ArgumentParser(description='Run CareBridge background job workers')
+    parser.add_argument('--queues', default=os.getenv('JOB_QUEUES', 'notifications,email,files,default'),
+                        help='Comma-separated list of queues to process')
+    args = parser.parse_args()
+    
+    app = create_app(os.getenv('FLASK_CONFIG', 'development'))
+    queues = [queue.strip() for queue in args.queues.split(',') if queue.strip()]
+    Worker(app, queues).run()
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useEffect, useState, ReactNode } from 'react';
 import { io, Socket } from 'socket.io-client';
+import msgpackParser from 'socket.io-msgpack-parser';
 import { useAuth } from './AuthContext';
 
 interface SocketContextType {
@@ -17,6 +18,12 @@ export const useSocket = () => {
   return context;
 };
 
+// Binary MessagePack packets are smaller and cheaper to encode than JSON; the server picks the format per connection
+const USE_MSGPACK = process.env.REACT_APP_SOCKET_MSGPACK !== 'false';
+
+// Keeps the connection marked online; the server expires presence after 60 seconds without one
+const PRESENCE_HEARTBEAT_MS = 20000;
+
 interface SocketProviderProps {
   children: ReactNode;
 }
@@ -37,6 +44,7 @@ export const SocketProvider: React.FC<SocketProviderProps> = ({ children }) => {
           userType: user.userType,
         },
         transports: ['websocket'],
+        ...(USE_MSGPACK ? { parser: msgpackParser, query: { serializer: 'msgpack' } } : {}),
         reconnection: true,
         reconnectionAttempts: 5,
         reconnectionDelay: 1000,
@@ -52,6 +60,12 @@ export const SocketProvider: React.FC<SocketProviderProps> = ({ children }) => {
         setIsConnected(false);
       });
 
+      const heartbeat = setInterval(() => {
+        if (socketInstance.connected) {
+          socketInstance.emit('presence_heartbeat');
+        }
+      }, PRESENCE_HEARTBEAT_MS);
+
       socketInstance.on('connect_error', (error) => {
         console.error('Socket connection error:', error);
         setIsConnected(false);
@@ -61,6 +75,7 @@ export const SocketProvider: React.FC<SocketProviderProps> = ({ children }) => {
 
       // Cleanup on unmount
       return () => {
+        clearInterval(heartbeat);
         socketInstance.disconnect();
       };
     } else {
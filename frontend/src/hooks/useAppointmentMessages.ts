@@ -0,0 +1,159 @@
+import { useState, useEffect, useRef, useCallback } from 'react';
+import { useSocket } from '../context/SocketContext';
+import { messageAPI } from '../services/api';
+
+export interface ChatMessage {
+  id: string;
+  appointment_id: string;
+  sender_id: string;
+  message_type: string;
+  content: string;
+  seq: number;
+  created_at: string;
+  sender?: {
+    id: string;
+    first_name: string;
+    last_name: string;
+    role: string;
+    profile_picture?: string;
+  };
+}
+
+interface MessageBatch {
+  appointment_id: string;
+  messages: ChatMessage[];
+  latest_seq: number;
+  has_more: boolean;
+}
+
+interface UseAppointmentMessagesReturn {
+  messages: ChatMessage[];
+  isLoading: boolean;
+  sendMessage: (content: string) => Promise<void>;
+}
+
+/**
+ * Custom hook to follow an appointment's chat over Socket.IO
+ *
+ * Messages carry a per-appointment sequence number. The hook remembers the
+ * last one it applied, sends it when joining the room so the server replays
+ * what was missed while disconnected, and fetches the missing range over
+ * REST whenever a message arrives out of order.
+ * @param appointmentId - The ID of the appointment whose chat to follow
+ * @returns The messages in sequence order and a way to send one
+ */
+export const useAppointmentMessages = (appointmentId: string | undefined): UseAppointmentMessagesReturn => {
+  const { socket } = useSocket();
+  
+  const [messages, setMessages] = useState<ChatMessage[]>([]);
+  const [isLoading, setIsLoading] = useState(true);
+  
+  const lastSeqRef = useRef(0);
+  const catchingUpRef = useRef(false);
+  const catchUpAgainRef = useRef(false);
+  
+  // Append messages that continue the sequence; returns false if one left a gap
+  const apply = useCallback((incoming: ChatMessage[]) => {
+    const next: ChatMessage[] = [];
+    let complete = true;
+    
+    [...incoming].sort((a, b) => a.seq - b.seq).forEach(message => {
+      if (message.seq <= lastSeqRef.current) return;
+      if (message.seq !== lastSeqRef.current + 1) {
+        complete = false;
+        return;
+      }
+      next.push(message);
+      lastSeqRef.current = message.seq;
+    });
+    
+    if (next.length > 0) {
+      setMessages(prev => [...prev, ...next]);
+    }
+    return complete;
+  }, []);
+  
+  // Fetch everything after the last applied message, page by page
+  const catchUp = useCallback(async () => {
+    if (!appointmentId) return;
+    if (catchingUpRef.current) {
+      catchUpAgainRef.current = true;
+      return;
+    }
+    
+    catchingUpRef.current = true;
+    try {
+      do {
+        catchUpAgainRef.current = false;
+        let batch: MessageBatch;
+        do {
+          batch = await messageAPI.getMessagesSince(appointmentId, lastSeqRef.current);
+          apply(batch.messages);
+        } while (batch.has_more && batch.messages.length > 0);
+      } while (catchUpAgainRef.current);
+    } catch (error) {
+      console.error('Error fetching missed messages:', error);
+    } finally {
+      catchingUpRef.current = false;
+    }
+  }, [appointmentId, apply]);
+  
+  // Load the history, then join the room from where it ends
+  useEffect(() => {
+    if (!socket || !appointmentId) return;
+    
+    lastSeqRef.current = 0;
+    setMessages([]);
+    setIsLoading(true);
+    
+    const join = () => {
+      socket.emit('join', { appointment_id: appointmentId, last_seq: lastSeqRef.current });
+    };
+    
+    const handleNewMessage = ({ message }: { message: ChatMessage }) => {
+      if (!message || String(message.appointment_id) !== appointmentId) return;
+      if (!apply([message])) {
+        catchUp();
+      }
+    };
+    
+    const handleReplay = (batch: MessageBatch) => {
+      if (String(batch.appointment_id) !== appointmentId) return;
+      if (!apply(batch.messages) || batch.has_more) {
+        catchUp();
+      }
+    };
+    
+    socket.on('new_message', handleNewMessage);
+    socket.on('messages_replay', handleReplay);
+    // Rejoining after a reconnect replays whatever was sent in the meantime
+    socket.on('connect', join);
+    
+    catchUp().finally(() => {
+      setIsLoading(false);
+      if (socket.connected) join();
+    });
+    
+    return () => {
+      socket.off('new_message', handleNewMessage);
+      socket.off('messages_replay', handleReplay);
+      socket.off('connect', join);
+      socket.emit('leave', { appointment_id: appointmentId });
+    };
+  }, [socket, appointmentId, apply, catchUp]);
+  
+  // Send a message; it is shown in sequence order, from the response or the socket, whichever comes first
+  const sendMessage = useCallback(async (content: string) => {
+    if (!appointmentId) return;
+    const response = await messageAPI.sendMessage(appointmentId, content);
+    if (response.message_data && !apply([response.message_data])) {
+      catchUp();
+    }
+  }, [appointmentId, apply, catchUp]);
+  
+  return {
+    messages,
+    isLoading,
+    sendMessage
+  };
+};
\ No newline at end of file
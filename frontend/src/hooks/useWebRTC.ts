@@ -1,5 +1,8 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 import { useSocket } from '../context/SocketContext';
+import { webrtcAPI } from '../services/api';
+
+const FALLBACK_ICE_SERVERS: RTCIceServer[] = [{ urls: 'stun:stun.l.google.com:19302' }];
 
 interface PeerConnection {
   peerConnection: RTCPeerConnection | null;
@@ -66,13 +69,19 @@ export const useWebRTC = ({ roomId, userId }: UseWebRTCProps): UseWebRTCReturn =
         setLocalStream(stream);
         originalStreamRef.current = stream;
         
+        // Get the STUN/TURN servers to use
+        let iceServers = FALLBACK_ICE_SERVERS;
+        try {
+          const response = await webrtcAPI.getIceServers();
+          if (response.ice_servers?.length) {
+            iceServers = response.ice_servers;
+          }
+        } catch (error) {
+          console.error('Error fetching ICE servers:', error);
+        }
+        
         // Create peer connection
-        const peerConnection = new RTCPeerConnection({
-          iceServers: [
-            { urls: 'stun:stun.l.google.com:19302' },
-            { urls: 'stun:stun1.l.google.com:19302' }
-          ]
-        });
+        const peerConnection = new RTCPeerConnection({ iceServers });
         
         // Create data channel for messages
         const dataChannel = peerConnection.createDataChannel('messages');
@@ -147,7 +156,7 @@ export const useWebRTC = ({ roomId, userId }: UseWebRTCProps): UseWebRTCReturn =
           dataChannel
         };
         
-        // Join room
+        // Join room only now, so offers and ICE candidates from the other peer find the connection ready
         socket?.emit('webrtc:join-room', { roomId, userId });
       } catch (error) {
         console.error('Error initializing WebRTC:', error);
@@ -213,6 +222,11 @@ export const useWebRTC = ({ roomId, userId }: UseWebRTCProps): UseWebRTCReturn =
       }
     };
     
+    // Handle a batch of ICE candidates
+    const handleIceCandidates = ({ candidates }: { candidates: RTCIceCandidateInit[] }) => {
+      candidates.forEach(candidate => handleIceCandidate({ candidate }));
+    };
+    
     // Handle user joined
     const handleUserJoined = async ({ userId: remoteUserId }: { userId: string }) => {
       try {
@@ -238,23 +252,94 @@ export const useWebRTC = ({ roomId, userId }: UseWebRTCProps): UseWebRTCReturn =
       setRemoteStream(null);
     };
     
+    // Rejoin the call after a reconnect, so the server counts it as the same attendance
+    const handleReconnect = () => {
+      if (peerRef.current.peerConnection) {
+        socket.emit('webrtc:join-room', { roomId, userId });
+      }
+    };
+    
     // Register event listeners
     socket.on('webrtc:user-joined', handleUserJoined);
     socket.on('webrtc:offer', handleOffer);
     socket.on('webrtc:answer', handleAnswer);
-    socket.on('webrtc:ice-candidate', handleIceCandidate);
+    socket.on('webrtc:ice-candidates', handleIceCandidates);
     socket.on('webrtc:user-left', handleUserLeft);
+    socket.on('connect', handleReconnect);
     
     return () => {
       // Remove event listeners
       socket.off('webrtc:user-joined', handleUserJoined);
       socket.off('webrtc:offer', handleOffer);
       socket.off('webrtc:answer', handleAnswer);
-      socket.off('webrtc:ice-candidate', handleIceCandidate);
+      socket.off('webrtc:ice-candidates', handleIceCandidates);
       socket.off('webrtc:user-left', handleUserLeft);
+      socket.off('connect', handleReconnect);
     };
   }, [roomId, userId, socket]);
   
+  // Report call quality: sample WebRTC stats every second and send them in batches
+  useEffect(() => {
+    const { peerConnection } = peerRef.current;
+    if (!socket || !peerConnection || connectionState !== 'connected') return;
+    
+    let samples: Record<string, number>[] = [];
+    let previous: { bytesReceived: number; packetsLost: number; packetsReceived: number; timestamp: number } | null = null;
+    
+    const sample = async () => {
+      const stats = await peerConnection.getStats();
+      let rtt: number | undefined;
+      let jitter: number | undefined;
+      let bytesReceived = 0;
+      let packetsLost = 0;
+      let packetsReceived = 0;
+      
+      stats.forEach((report: any) => {
+        if (report.type === 'candidate-pair' && report.nominated && report.currentRoundTripTime !== undefined) {
+          rtt = report.currentRoundTripTime * 1000;
+        } else if (report.type === 'inbound-rtp') {
+          bytesReceived += report.bytesReceived || 0;
+          packetsLost += report.packetsLost || 0;
+          packetsReceived += report.packetsReceived || 0;
+          if (report.kind === 'audio' && report.jitter !== undefined) {
+            jitter = report.jitter * 1000;
+          }
+        }
+      });
+      
+      const now = Date.now();
+      if (previous) {
+        const entry: Record<string, number> = {
+          ts: now,
+          bitrate_kbps: ((bytesReceived - previous.bytesReceived) * 8) / (now - previous.timestamp),
+          packets_lost: Math.max(0, packetsLost - previous.packetsLost),
+          packets_received: Math.max(0, packetsReceived - previous.packetsReceived)
+        };
+        if (rtt !== undefined) entry.rtt_ms = rtt;
+        if (jitter !== undefined) entry.jitter_ms = jitter;
+        samples.push(entry);
+      }
+      previous = { bytesReceived, packetsLost, packetsReceived, timestamp: now };
+    };
+    
+    const flush = () => {
+      if (samples.length === 0) return;
+      socket.emit('webrtc:stats', { roomId, samples });
+      samples = [];
+    };
+    
+    const sampleInterval = setInterval(() => {
+      sample().catch(error => console.error('Error reading WebRTC stats:', error));
+    }, 1000);
+    const flushInterval = setInterval(flush, 5000);
+    
+    return () => {
+      clearInterval(sampleInterval);
+      clearInterval(flushInterval);
+      flush();
+    };
+  }, [roomId, socket, connectionState]);
+  
   // Toggle mute
   const toggleMute = useCallback(() => {
     if (localStream) {
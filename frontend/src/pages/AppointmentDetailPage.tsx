@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import { format } from 'date-fns';
+import { useAppointmentMessages } from '../hooks/useAppointmentMessages';
 
 interface Message {
   id: string;
@@ -40,37 +41,15 @@ const AppointmentDetailPage: React.FC = () => {
     createdAt: '2023-07-20T14:30:00Z',
   };
   
-  // Mock messages
-  const [messages, setMessages] = useState<Message[]>([
-    {
-      id: '1',
-      sender: 'system',
-      content: 'Appointment has been scheduled.',
-      timestamp: '2023-07-20T14:30:00Z',
-      read: true,
-    },
-    {
-      id: '2',
-      sender: 'doctor',
-      content: 'Hello John, please make sure to bring your recent test results to our appointment.',
-      timestamp: '2023-07-21T09:15:00Z',
-      read: true,
-    },
-    {
-      id: '3',
-      sender: 'patient',
-      content: 'Sure, Dr. Johnson. I will bring all the reports.',
-      timestamp: '2023-07-21T10:30:00Z',
-      read: true,
-    },
-    {
-      id: '4',
-      sender: 'system',
-      content: 'Appointment has been confirmed.',
-      timestamp: '2023-07-22T11:45:00Z',
-      read: true,
-    },
-  ]);
+  // Chat messages, kept in sequence order and caught up after reconnects
+  const { messages: chatMessages, sendMessage } = useAppointmentMessages(id);
+  const messages: Message[] = chatMessages.map(message => ({
+    id: message.id,
+    sender: message.message_type === 'system' ? 'system' : message.sender?.role === 'doctor' ? 'doctor' : 'patient',
+    content: message.content,
+    timestamp: message.created_at,
+    read: true,
+  }));
   
   // Mock files
   const [files, setFiles] = useState<File[]>([
@@ -103,20 +82,16 @@ const AppointmentDetailPage: React.FC = () => {
     },
   ]);
 
-  const handleSendMessage = (e: React.FormEvent) => {
+  const handleSendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
     if (newMessage.trim() === '') return;
     
-    const newMsg: Message = {
-      id: `msg-${Date.now()}`,
-      sender: 'patient', // Assuming the current user is the patient
-      content: newMessage,
-      timestamp: new Date().toISOString(),
-      read: false,
-    };
-    
-    setMessages([...messages, newMsg]);
-    setNewMessage('');
+    try {
+      await sendMessage(newMessage);
+      setNewMessage('');
+    } catch (error) {
+      console.error('Error sending message:', error);
+    }
   };
 
   const handleFileUpload = (e: React.ChangeEvent<HTMLInputElement>) => {
@@ -94,6 +94,14 @@ export const appointmentAPI = {
     const response = await api.delete(`/appointments/${id}`);
     return response.data;
   },
+  holdSlot: async (holdData: { doctor_id: string; time_slot_id?: string; start_time?: string }) => {
+    const response = await api.post('/appointments/holds', holdData);
+    return response.data;
+  },
+  releaseSlotHold: async () => {
+    const response = await api.delete('/appointments/holds');
+    return response.data;
+  },
 };
 
 // Message API
@@ -102,6 +110,10 @@ export const messageAPI = {
     const response = await api.get(`/appointments/${appointmentId}/messages`);
     return response.data;
   },
+  getMessagesSince: async (appointmentId: string, since: number) => {
+    const response = await api.get(`/appointments/${appointmentId}/messages`, { params: { since } });
+    return response.data;
+  },
   sendMessage: async (appointmentId: string, content: string) => {
     const response = await api.post(`/appointments/${appointmentId}/messages`, { content });
     return response.data;
@@ -151,6 +163,14 @@ export const notificationAPI = {
   },
 };
 
+// WebRTC API
+export const webrtcAPI = {
+  getIceServers: async () => {
+    const response = await api.get('/webrtc/ice-servers');
+    return response.data;
+  },
+};
+
 // Doctor API
 export const doctorAPI = {
   getDoctors: async (params?: any) => {
@@ -165,6 +185,14 @@ export const doctorAPI = {
     const response = await api.get(`/doctors/${doctorId}/availability`, { params: { date } });
     return response.data;
   },
+  getDoctorMonthAvailability: async (doctorId: string, month: string) => {
+    const response = await api.get(`/doctors/${doctorId}/availability`, { params: { month } });
+    return response.data;
+  },
+  getNextAvailableDoctors: async (params: { specialty?: string; from?: string; to?: string; limit?: number }) => {
+    const response = await api.get('/doctors/next-available', { params });
+    return response.data;
+  },
 };
 
 export default api;
\ No newline at end of file